@@ -3,7 +3,8 @@ import re
 
 from  functions.functions_modify import functions
 from  logger import logger
-from  utils import dockerwrite, dockerwrite_empty_file, gpt4, sys
+from  utils import (dockerwrite, dockerwrite_empty_file, gpt4,
+                           read_container_file, sys)
 
 
 class Creator:
@@ -47,10 +48,11 @@ The created file is:
         content = "Request: " + requirement
 
         if path:
-            if self.container.exec_run(["test", "-f", path]).exit_code == 0:
-                file_content = self.container.exec_run(["cat", path]).output.decode(
-                    "utf-8"
-                )
+            file = read_container_file(self.container, path)
+            if file is not None and file.binary:
+                return json.dumps({"Error": f"The file to refer to ({path}) is binary."})
+            if file is not None:
+                file_content = file.text()
                 system_cre = """You are a professional programmer. You will be given a query and a file. Your task is to imitate or refer to the given file to write a code file to complete the query. You should give me the complete file with no omit.
                 
 Your response should be structured as follows:
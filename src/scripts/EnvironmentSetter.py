@@ -10,10 +10,15 @@ from  Creator import Creator
 from  functions.functions_setup import functions
 from  logger import logger
 from  Modifier import Modifier
-from  utils import (EnhancedContainer, build_and_run_container,
-                           calculate_file_count, explore_container_directory,
+from  utils import (MAX_FULL_BYTES, build_and_run_container,
+                           calculate_file_count, container_pool,
+                           context_compactor, explore_container_directory,
                            find_lines_with_string, gpt4_functions,
-                           handle_readme, read_PRs, subdir, sys)
+                           handle_readme, read_container_file, read_PRs,
+                           subdir, sys, token_budget)
+
+SHORT_OUTPUT_TOKENS = 25
+OUTPUT_TOKENS = 500
 
 
 class RepoSetter:
@@ -65,19 +70,24 @@ class RepoSetter:
             str: JSON-formatted string containing the content of the file or directory,
                  or an error message if the path doesn't exist.
         """
-        if self.container.exec_run(["test", "-f", path]).exit_code == 0:
+        # A pickle is read whole in the same call, to be unpickled if it is binary
+        file = read_container_file(
+            self.container,
+            path,
+            whole_bytes=MAX_FULL_BYTES if path.endswith(".pkl") else 0,
+        )
+        if file is not None:
             try:
-                content = {
-                    "Content of this file": "'''"
-                    + self.container.exec_run(["cat", path]).output.decode("utf-8")
-                    + "'''"
-                }
-            except UnicodeDecodeError:
-                try:
-                    binary_content = self.container.exec_run(["cat", path]).output
-                    if path.endswith(".pkl"):
+                if not file.binary:
+                    content = {"Content of this file": "'''" + file.text() + "'''"}
+                elif path.endswith(".pkl"):
+                    if not file.complete:
+                        content = {
+                            "Error": f"File is a binary file of {file.size} bytes, too large to be unpickled."
+                        }
+                    else:
                         try:
-                            data = pickle.loads(binary_content)
+                            data = pickle.loads(file.data)
                             if str(data).strip() == "":
                                 content = {"Warning": "Binary file not readable."}
                             else:
@@ -88,14 +98,14 @@ class RepoSetter:
                             content = {
                                 "Error": "File is a binary file and could not be unpickled."
                             }
-                    else:
-                        content = {
-                            "Error": "File is binary and not a known format to parse."
-                        }
-                except Exception as e:
+                else:
                     content = {
-                        "Error": "An error occurred while reading the file: " + str(e)
+                        "Error": f"File is binary ({file.size} bytes) and not a known format to parse."
                     }
+            except Exception as e:
+                content = {
+                    "Error": "An error occurred while reading the file: " + str(e)
+                }
         elif self.container.exec_run(["test", "-d", path]).exit_code == 0:
             file_count = calculate_file_count(self.container, path)
             print(file_count)
@@ -164,14 +174,15 @@ class RepoSetter:
                         }
                     )
                 print(output)
-                if len(output) < 100:
+                if token_budget.count(output) < SHORT_OUTPUT_TOKENS:
                     return json.dumps({"output": output})
                 if exit_code == 0 and "ls" not in command:
                     output = (
                         "Executed successfully. The output of the execution is omitted."
                     )
-                if len(str(output)) > 2000:
-                    output = output[:1000] + "..." + output[-1000:]
+                output = token_budget.truncate_middle(
+                    str(output), OUTPUT_TOKENS, marker="..."
+                )
                 if "No module named" in output:
                     return json.dumps(
                         {
@@ -259,7 +270,9 @@ class RepoSetter:
                 {"role": "function", "name": func_name, "content": back_content}
             )
             logger.update("setup_log", self.messages[-1])
-            func_call = gpt4_functions(self.messages, funcs)
+            func_call = gpt4_functions(
+                context_compactor.compact(self.messages, funcs), funcs
+            )
             self.messages.append(
                 {"role": "assistant", "content": None, "function_call": func_call}
             )
@@ -333,7 +346,6 @@ class RepoSetter:
                    owner, data path, working directory, README content, and entrypoint.
         """
         self.repo_url = repo_url
-        client = docker.from_env()
         match = re.match(r"https:\/\/github\.com\/(.+?)\/(.+?)\.git", repo_url)
 
         if match:
@@ -345,15 +357,7 @@ class RepoSetter:
             and self.check_image_exists(f"{self.repo_name.lower()}_image")
         ):
             print("Using cached image.")
-            new_container = client.containers.create(
-                f"{self.repo_name.lower()}_image",
-                tty=True,
-                stdin_open=True,
-                command="/bin/sh",
-                network_mode="host",
-            )
-            self.container = EnhancedContainer(new_container, client)
-            self.container.start()
+            self.container = container_pool.acquire(f"{self.repo_name.lower()}_image")
             self.readme = cache[self.repo_name]["readme"]
             if "entrypoint" in cache[self.repo_name]:
                 self.entrypoint = cache[self.repo_name]["entrypoint"]
@@ -372,15 +376,7 @@ class RepoSetter:
                 self.entrypoint,
             )
 
-        self.container = client.containers.create(
-            "condaimage",
-            tty=True,
-            stdin_open=True,
-            command="/bin/sh",
-            network_mode="host",
-        )
-        self.container = EnhancedContainer(self.container, client)
-        self.container.start()
+        self.container = container_pool.acquire()
 
         exit_code, output = self.container.exec_run(f"git clone {repo_url}")
         print(output.decode("utf-8"))
@@ -429,18 +425,11 @@ class RepoSetter:
             except Exception as e:
                 print(e)
 
-        self.return_container.stop()
-        self.return_container.remove()
-
-        new_container = client.containers.create(
-            f"{self.repo_name.lower()}_image",
-            tty=True,
-            stdin_open=True,
-            command="/bin/sh",
-            network_mode="host",
-        )
-        self.return_container = EnhancedContainer(new_container, client)
-        self.return_container.start()
+        # The container already holds what was committed, so it is only restarted to stop what
+        # the setup left running, rather than replaced by a new container of the image
+        self.return_container.restart(timeout=0)
+        # Warm containers of the image run what it was before this commit
+        container_pool.discard(f"{self.repo_name.lower()}_image")
 
         return (
             self.repo_name,
@@ -14,10 +14,18 @@ from  Creator import Creator
 from  functions.functions_action import functions
 from  logger import logger
 from  Modifier import Modifier
-from  utils import (calculate_file_count, dockerwrite,
+from  utils import (CHARS_PER_TOKEN, MAX_FULL_BYTES, calculate_file_count,
+                           capture_output, context_compactor, dockerwrite,
                            dockerwrite_empty_file, download,
                            explore_container_directory, gpt4, gpt4_functions,
-                           read_issues, subdir, sys, upload, write_des, write_experience)
+                           read_container_file, read_issues, subdir, sys,
+                           token_budget, upload, write_des, write_experience)
+
+FILE_TOKENS = 250
+OUTPUT_TOKENS = 2000
+SHORT_OUTPUT_TOKENS = 125
+LONG_OUTPUT_TOKENS = 4000
+ISSUE_TOKENS = 150
 
 
 class RepoApplier:
@@ -91,35 +99,42 @@ class RepoApplier:
         Return:
             str: JSON-formatted content of the file or directory.
         """
-        if self.container.exec_run(["test", "-f", path]).exit_code == 0:
+        # A pickle is read whole in the same call, to be unpickled if it is binary
+        file = read_container_file(
+            self.container,
+            path,
+            whole_bytes=MAX_FULL_BYTES if path.endswith(".pkl") else 0,
+        )
+        if file is not None:
             try:
-                file_content = self.container.exec_run(["cat", path]).output.decode(
-                    "utf-8"
-                )
-                if len(file_content) > 1000:
-                    file_content = file_content[:500] + "\n...\n" + file_content[-500:]
-                content = {"Content of this file": "'''" + file_content + "'''"}
-            except UnicodeDecodeError:
-                try:
-                    binary_content = self.container.exec_run(["cat", path]).output
-                    if path.endswith(".pkl"):
+                if not file.binary:
+                    file_content = token_budget.truncate_middle(file.text(), FILE_TOKENS)
+                    content = {"Content of this file": "'''" + file_content + "'''"}
+                elif path.endswith(".pkl"):
+                    if not file.complete:
+                        content = {
+                            "Error": f"File is a binary file of {file.size} bytes, too large to be unpickled."
+                        }
+                    else:
                         try:
-                            data = pickle.loads(binary_content)
+                            data = pickle.loads(file.data)
                             content = {
-                                "Content of this file": "'''" + str(data) + "'''"
+                                "Content of this file": "'''"
+                                + token_budget.truncate_middle(str(data), FILE_TOKENS)
+                                + "'''"
                             }
                         except pickle.UnpicklingError:
                             content = {
                                 "Error": "File is a binary file and could not be unpickled."
                             }
-                    else:
-                        content = {
-                            "Error": "File is binary and not a known format to parse."
-                        }
-                except Exception as e:
+                else:
                     content = {
-                        "Error": "An error occurred while reading the file: " + str(e)
+                        "Error": f"File is binary ({file.size} bytes) and not a known format to parse."
                     }
+            except Exception as e:
+                content = {
+                    "Error": "An error occurred while reading the file: " + str(e)
+                }
         elif self.container.exec_run(["test", "-d", path]).exit_code == 0:
             file_count = calculate_file_count(self.container, path)
             print(file_count)
@@ -206,7 +221,7 @@ The program is:
                 }
             )
             message_mod = messages
-        response = gpt4(message_mod)
+        response = gpt4(message_mod, site="output_summary")
         message_mod.append({"role": "assistant", "content": response})
         if "The program is:" not in response:
             answer = response[6:].strip()
@@ -256,22 +271,22 @@ The program is:
             str: JSON-formatted result or error message.
         """
         sys.stdout.print_colored(command, "red")
-        exit_code, output = self.container.exec_run(command)
-        output = self.remove_unicode_block_elements(output.decode("utf-8"))
+        if self.workdir == "/":
+            save_dir = "/output.txt"
+        else:
+            save_dir = self.workdir + "output.txt"
+        # The whole output is saved in `save_dir` while it streams, and only its head and tail are kept here
+        exit_code, capture = capture_output(self.container, command, save_dir)
+        output = self.remove_unicode_block_elements(capture.text())
         if exit_code == 0 and not verbose:
             return json.dumps(
                 {
                     "Output": "Executed successfully. The output of the execution is omitted."
                 }
             )
-        if self.workdir == "/":
-            save_dir = "/output.txt"
-        else:
-            save_dir = self.workdir + "output.txt"
         print(save_dir)
-        dockerwrite_empty_file(self.container, save_dir)
-        successfully_written = dockerwrite(
-            save_dir, output, self.container, self.workdir
+        successfully_written = (
+            self.container.exec_run(["test", "-f", save_dir]).exit_code == 0
         )
         sys.stdout.print_colored(output, "cyan")
 
@@ -283,14 +298,17 @@ The program is:
         Judge: Yes/No
         Message: <(if Judge is Yes)modified output in natural language which contains what the query asks for>/<(if Judge is No)problem with the output>
         """
-        if len(output) > 8000:
-            output_for_gpt4 = output[:4000] + "\n...\n" + output[-4000:]
+        if capture.truncated:
+            output_tokens = capture.total_bytes // CHARS_PER_TOKEN
         else:
-            output_for_gpt4 = output
+            output_tokens = token_budget.count(output)
+        output_for_gpt4 = token_budget.truncate_middle(output, OUTPUT_TOKENS)
+        if capture.truncated or output_for_gpt4 != output:
+            output_for_gpt4 += "\n" + capture.summary()
 
         if exit_code != 0:
             return json.dumps({"Error": output_for_gpt4})
-        elif len(output) <= 500:
+        elif output_tokens <= SHORT_OUTPUT_TOKENS:
             return json.dumps({"Result": output_for_gpt4})
 
         content = (
@@ -304,7 +322,7 @@ The program is:
             {"role": "system", "content": system_exe},
             {"role": "user", "content": content},
         ]
-        if type and len(output) > 16000 and successfully_written:
+        if type and output_tokens > LONG_OUTPUT_TOKENS and successfully_written:
             return self.handle_output(output_for_gpt4)
         else:
             return json.dumps({"Output": output_for_gpt4})
@@ -393,8 +411,9 @@ The program is:
                     return self.last_issue
                 issue_content = issue["Issue"]
                 hint = issue["Hint"]
-                if len(issue_content) > 600:
-                    issue_content = issue_content[:300] + "..." + issue_content[-300:]
+                issue_content = token_budget.truncate_middle(
+                    issue_content, ISSUE_TOKENS, marker="..."
+                )
                 return json.dumps({"Issue": issue_content, "Hint": hint})
         except Exception as e:
             if str(e) == "":
@@ -420,7 +439,9 @@ The program is:
                 {"role": "function", "name": func_name, "content": back_content}
             )
             logger.update("apply_phase", self.messages[-1])
-            func_call = gpt4_functions(self.messages, funcs)
+            func_call = gpt4_functions(
+                context_compactor.compact(self.messages, funcs), funcs
+            )
             self.messages.append(
                 {"role": "assistant", "content": None, "function_call": func_call}
             )
@@ -1,15 +1,25 @@
+import copy
 import json
 import os
 import re
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import git
-import requests
 
 from  Cacher import cache
 from  functions.functions_dispatcher import functions
 from  logger import logger
-from  utils import (gpt4,gpt4_functions)
+from  utils import (BATCH_JUDGE, BATCH_TOKEN_BUDGET, DISPATCH_TOP_K,
+                           estimate_tokens, fetch_readme, github, gpt4,
+                           gpt4_functions, handle_readme, judge_batch,
+                           pack_batches, rank_candidates, repo_index,
+                           resolve_head_sha, search_cache, token_budget,
+                           trim_item)
+
+JUDGE_WORKERS = 8
+JUDGE_README_TOKENS = 3750
 
 
 class RepoSearcher:
@@ -17,15 +27,31 @@ class RepoSearcher:
     This class provides functions to search for appropriate GitHub repositories.
     """
     
-    def __init__(self, token):
+    def __init__(
+        self,
+        token,
+        judge_workers=JUDGE_WORKERS,
+        fetch_mode="readme",
+        rank_options=None,
+        batch_judge=BATCH_JUDGE,
+    ):
         """
         Initialize the RepoSearcher.
         
         Args:
             token (str): The GitHub access token.
+            judge_workers (int, optional): The maximum number of candidates judged concurrently. Default is JUDGE_WORKERS.
+            fetch_mode (str, optional): How candidate READMEs are fetched, "readme" (README blob only) or "clone" (full clone). Default is "readme".
+            rank_options (dict, optional): Cutoffs passed to `rank_candidates`, e.g. {"top_k": 5, "min_stars": 10}. Default is None.
+            batch_judge (bool, optional): Whether several READMEs are judged per LLM call. Default is BATCH_JUDGE.
         """
         self.token = token
         self.failed_repo = []
+        self.judge_workers = judge_workers
+        self.fetch_mode = fetch_mode
+        self.rank_options = rank_options or {}
+        self.batch_judge = batch_judge
+        self.log_lock = threading.Lock()
         self.headers = {
             "Accept": "application/vnd.github+json",
             "Authorization": f"Bearer {self.token}",
@@ -65,9 +91,9 @@ You will be given the query of the task and name(s) and description(s) of existe
         Return:
             dict: The response data containing the retrieved repositories.
         """
-        url = f"https://api.github.com/search/repositories?q=topic:{topic}&per_page=50"
+        url = f"/search/repositories?q=topic:{topic}&per_page=50"
 
-        response = requests.get(url, headers=self.headers)
+        response = github.get(url, headers=self.headers)
         response_data = response.json()
         if response.status_code == 200:
             print(
@@ -89,9 +115,9 @@ You will be given the query of the task and name(s) and description(s) of existe
         Return:
             dict: The response data containing the retrieved repositories.
         """
-        url = f"https://api.github.com/search/repositories?q={text}"
+        url = f"/search/repositories?q={text}"
 
-        response = requests.get(url, headers=self.headers)
+        response = github.get(url, headers=self.headers)
         response_data = response.json()
         if response.status_code == 200:
             print(
@@ -103,59 +129,276 @@ You will be given the query of the task and name(s) and description(s) of existe
         else:
             print(f"Request failed with status code {response.status_code}")
 
-    def judge(self, repo, query):
+    def fetch_candidate_readme(self, repo, destination):
+        """
+        Fetch the README of a candidate repository according to `fetch_mode`.
+        
+        In "readme" mode only the README blob is downloaded, through the contents API or a sparse
+        checkout. In "clone" mode the whole repository is cloned and removed afterwards.
+        
+        Args:
+            repo (dict): The repository information.
+            destination (str): The local directory used if the repository has to be checked out.
+            
+        Return:
+            str: The content of the README, or None if it could not be fetched.
+        """
+        if self.fetch_mode == "readme":
+            return fetch_readme(repo, self.headers, destination)
+        try:
+            git.Repo.clone_from(repo["clone_url"], destination)
+            for file in os.listdir(destination):
+                if "readme" in file.lower():
+                    file_path = os.path.join(destination, file)
+                    print(file_path)
+                    with open(file_path, "r") as f:
+                        return f.read()
+        except Exception as e:
+            print(e)
+        finally:
+            shutil.rmtree(destination, ignore_errors=True)
+        return None
+
+    def prepare_candidate(self, repo, query):
+        """
+        Look up the cached judgement of a candidate repository, and get its README if there is none.
+        
+        Args:
+            repo (dict): The repository information.
+            query (str): The query to solve.
+            
+        Return:
+            tuple: The default-branch SHA, the cached judgement (or None), and the README (or None if
+            a cached judgement exists or the README could not be fetched).
+        """
+        repo_url = repo["clone_url"]
+        sha = resolve_head_sha(repo_url)
+        verdict = search_cache.get_verdict(query, repo_url, sha)
+        if verdict is not None:
+            return sha, verdict, None
+        readme = search_cache.get_readme(repo_url, sha)
+        if readme is None:
+            clone_destination = "repos/" + repo.get("full_name", repo["name"]).replace("/", "_")
+            readme = self.fetch_candidate_readme(repo, clone_destination)
+            if readme is not None:
+                search_cache.put_readme(repo_url, sha, readme)
+        return sha, None, readme
+
+    def apply_verdict(self, repo, judgement, response, cached=False):
+        """
+        Log the judgement of a candidate repository and turn it into the result of `judge`.
+        
+        Args:
+            repo (dict): The repository information.
+            judgement (bool): Whether the repository is suitable.
+            response (str): The response of the judge.
+            cached (bool, optional): Whether the judgement was read from the search cache. Default is False.
+            
+        Return:
+            tuple: A tuple containing the judgment result, repository name, and repository URL.
+        """
+        message = {"repo_name": repo["name"], "response": response}
+        if cached:
+            message["cached"] = True
+        with self.log_lock:
+            logger.update("search_phase", message)
+        if judgement:
+            return True, repo["name"], repo["clone_url"]
+        self.failed_repo.append(repo["clone_url"])
+        return False, None, None
+
+    def conclude(self, repo, query, sha, response):
+        """
+        Parse the response of the judge for a candidate repository, cache it and apply it.
+        
+        Args:
+            repo (dict): The repository information.
+            query (str): The query to solve.
+            sha (str): The SHA of the default branch head of the repository.
+            response (str): The response of the judge.
+            
+        Return:
+            tuple: A tuple containing the judgment result, repository name, and repository URL.
+        """
+        judgement = re.findall(r"Judge: (\w+)$", response)[0] != "No"
+        search_cache.put_verdict(query, repo["clone_url"], sha, judgement, response)
+        return self.apply_verdict(repo, judgement, response)
+
+    def judge(self, repo, query, stop_event=None):
         """
         Judge whether a repository is suitable for solving a query based on its README.
         
         Args:
             repo (dict): The repository information.
             query (str): The query to solve.
+            stop_event (threading.Event, optional): If set before the README is judged, the judgement is skipped. Default is None.
             
         Return:
             tuple: A tuple containing the judgment result, repository name, and repository URL.
         """
-        repo_url = repo["clone_url"]
-        repo_name = repo["name"]
-        if repo_url in self.failed_repo:
+        if repo["clone_url"] in self.failed_repo:
+            return False, None, None
+        if stop_event is not None and stop_event.is_set():
             return False, None, None
-        clone_destination = "repos/" + repo_name
-        try:
-            git.Repo.clone_from((repo_url), clone_destination)
-        except Exception as e:
-            print(e)
         try:
-            for file in os.listdir(clone_destination):
-                if "readme" in file.lower():
-                    file_path = os.path.join(clone_destination, file)
-                    print(file_path)
-                    with open(file_path, "r") as f:
-                        readme = f.read()
-                    break
-            content = str(
-                "Query:'''"
-                + query
-                + "'''\n\nReadme of the repository:'''"
-                + readme[:15000]
-                + "...'''"
-            )
-            messages = [
-                {"role": "system", "content": self.system_judge},
-                {"role": "user", "content": content},
-            ]
-            response = gpt4(messages)
-            logger.update(
-                "search_phase", {"repo_name": repo_name, "response": response}
-            )
-            judgement = re.findall(r"Judge: (\w+)$", response)[0]
-            if judgement != "No":
-                return True, repo_name, repo_url
-            else:
-                self.failed_repo.append(repo_url)
+            sha, verdict, readme = self.prepare_candidate(repo, query)
+            if verdict is not None:
+                return self.apply_verdict(
+                    repo, verdict["judgement"], verdict["response"], cached=True
+                )
+            if readme is None:
+                return False, None, None
+            if stop_event is not None and stop_event.is_set():
                 return False, None, None
+            return self.judge_readme(repo, query, sha, readme)
         except Exception:
             return False, None, None
+
+    def judge_readme(self, repo, query, sha, readme):
+        """
+        Judge whether a repository is suitable for solving a query with one LLM call on its README.
+        
+        Args:
+            repo (dict): The repository information.
+            query (str): The query to solve.
+            sha (str): The SHA of the default branch head of the repository.
+            readme (str): The README of the repository.
+            
+        Return:
+            tuple: A tuple containing the judgment result, repository name, and repository URL.
+        """
+        content = str(
+            "Query:'''"
+            + query
+            + "'''\n\nReadme of the repository:'''"
+            + token_budget.truncate(readme, JUDGE_README_TOKENS, marker="")
+            + "...'''"
+        )
+        messages = [
+            {"role": "system", "content": self.system_judge},
+            {"role": "user", "content": content},
+        ]
+        response = gpt4(messages, site="readme_judge")
+        return self.conclude(repo, query, sha, response)
+
+    def judge_readmes(self, candidates, query):
+        """
+        Judge prepared candidates in batches, several READMEs per LLM call, and return the first suitable one.
+        
+        Args:
+            candidates (list): (repository information, SHA, README) tuples, ordered by rank.
+            query (str): The query to solve.
+            
+        Return:
+            tuple: A tuple containing the judgment result, repository name, and repository URL.
+        """
+        readmes = [handle_readme(readme) for _, _, readme in candidates]
+        for batch in pack_batches(readmes):
+            texts = [
+                f"Readme of the repository {candidates[index][0]['name']}:'''{text}'''"
+                for index, text in batch
+            ]
+            answers = judge_batch(
+                self.system_judge, "Query:'''" + query + "'''", texts, "readme_judge"
+            )
+            for (index, _), answer in zip(batch, answers):
+                repo, sha, readme = candidates[index]
+                try:
+                    if answer is None:
+                        # Left out of the batch answer: judged on its own rather than rejected
+                        result = self.judge_readme(repo, query, sha, readme)
+                    else:
+                        result = self.conclude(repo, query, sha, answer)
+                except Exception:
+                    continue
+                if result[0]:
+                    return result
+        return False, None, None
+
+    def judge_candidates_batched(self, repos, query):
+        """
+        Judge candidate repositories with batched LLM calls and return the best-ranked suitable one.
+        
+        READMEs are fetched concurrently on a bounded worker pool. Candidates are then judged in
+        ranking order, in batches limited by BATCH_TOKEN_BUDGET, and later batches are only sent if no
+        candidate of the earlier ones is suitable.
+        
+        Args:
+            repos (list): The candidate repositories, ordered by rank.
+            query (str): The query to solve.
+            
+        Return:
+            tuple: A tuple containing the repository name and URL, or (None, None) if not found.
+        """
+        repos = [repo for repo in repos if repo["clone_url"] not in self.failed_repo]
+
+        def prepare(repo):
+            # A candidate that fails to be prepared is skipped, as `judge` does
+            try:
+                return self.prepare_candidate(repo, query)
+            except Exception:
+                return None, None, None
+
+        executor = ThreadPoolExecutor(max_workers=self.judge_workers)
+        try:
+            prepared = executor.map(prepare, repos)
+            pending = []
+            pending_tokens = 0
+            for repo, (sha, verdict, readme) in zip(repos, prepared):
+                if verdict is None and readme is None:
+                    continue
+                if verdict is not None or pending_tokens >= BATCH_TOKEN_BUDGET:
+                    judge, repo_name, repo_url = self.judge_readmes(pending, query)
+                    if judge:
+                        return repo_name, repo_url
+                    pending = []
+                    pending_tokens = 0
+                if verdict is not None:
+                    judge, repo_name, repo_url = self.apply_verdict(
+                        repo, verdict["judgement"], verdict["response"], cached=True
+                    )
+                    if judge:
+                        return repo_name, repo_url
+                    continue
+                pending.append((repo, sha, readme))
+                pending_tokens += estimate_tokens(trim_item(handle_readme(readme)))
+            judge, repo_name, repo_url = self.judge_readmes(pending, query)
+            return repo_name, repo_url
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def judge_candidates(self, repos, query):
+        """
+        Judge candidate repositories concurrently and return the best-ranked suitable one.
+        
+        Judgements run on a bounded worker pool, but results are consumed in ranking order, so a
+        repository is only returned once every better-ranked candidate has been judged unsuitable.
+        Pending judgements are cancelled as soon as a winner is confirmed. If `batch_judge` is set,
+        `judge_candidates_batched` is used instead.
+        
+        Args:
+            repos (list): The candidate repositories, ordered by rank.
+            query (str): The query to solve.
+            
+        Return:
+            tuple: A tuple containing the repository name and URL, or (None, None) if not found.
+        """
+        if self.batch_judge:
+            return self.judge_candidates_batched(repos, query)
+        stop_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.judge_workers)
+        try:
+            futures = [
+                executor.submit(self.judge, repo, query, stop_event) for repo in repos
+            ]
+            for future in futures:
+                judge, repo_name, repo_url = future.result()
+                if judge:
+                    return repo_name, repo_url
+            return None, None
         finally:
-            shutil.rmtree(clone_destination, ignore_errors=True)
+            stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def search_by_text(self, text):
         """
@@ -171,32 +414,32 @@ You will be given the query of the task and name(s) and description(s) of existe
         response_data = self.retrieve_through_text(text)
         if not response_data:
             return None, None
-        for repo in response_data["items"]:
-            judge, repo_name, repo_url = self.judge(repo, text)
-            if judge:
-                return repo_name, repo_url
+        candidates = rank_candidates(response_data["items"], text, **self.rank_options)
+        return self.judge_candidates(candidates, text)
 
-    def judge_topic(self, topic, query):
+    def merge_candidates(self, results):
         """
-        Search for a suitable repository based on a topic.
+        Merge search results into a single ranked candidate list without duplicates.
+        
+        Candidates keep the order of the result sets (more relevant topics first) and their rank
+        inside each set. A repository found under several topics is kept at its best position.
         
         Args:
-            topic (str): The topic to search for.
-            query (str): The query to solve.
+            results (list): The search responses, in order of relevance. Failed searches are None.
             
         Return:
-            tuple: A tuple containing the repository name and URL, or (None, None) if not found.
+            list: The distinct candidate repositories, identified by `clone_url`.
         """
-        logger.log["search_phase"].append({"topic": topic, "search_log": []})
-        response_data = self.retrieve_through_topic(topic)
-        if not response_data:
-            return None, None
-        for repo in response_data["items"]:
-            judge, repo_name, repo_url = self.judge(repo, query)
-            if judge:
-                return repo_name, repo_url
-        else:
-            return None, None
+        candidates = []
+        seen = set()
+        for response_data in results:
+            if not response_data:
+                continue
+            for repo in response_data["items"]:
+                if repo["clone_url"] not in seen:
+                    seen.add(repo["clone_url"])
+                    candidates.append(repo)
+        return candidates
 
     def search_by_topic(self, query):
         """
@@ -218,17 +461,34 @@ You will be given the query of the task and name(s) and description(s) of existe
             topics = re.findall(r"\*\n(.+?)\n\*", response)[0].split(", ")
         except:
             topics = response.split(", ")
+        topics = [topic.strip() for topic in topics if topic.strip()]
         print(topics)
+        if not topics:
+            return None, None
 
-        for topic in topics:
-            repo_name, repo_url = self.judge_topic(topic, query)
-            if repo_name:
-                return repo_name, repo_url
+        logger.log["search_phase"].append({"topics": topics, "search_log": []})
+        with ThreadPoolExecutor(max_workers=min(len(topics), self.judge_workers)) as executor:
+            futures = [
+                executor.submit(self.retrieve_through_topic, topic) for topic in topics
+            ]
+            results = []
+            for topic, future in zip(topics, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"Failed to search topic {topic}: {e}")
+        candidates = self.merge_candidates(results)
+        print(f"{len(candidates)} distinct repos found under {len(topics)} topics.")
+        candidates = rank_candidates(candidates, query, **self.rank_options)
+        return self.judge_candidates(candidates, query)
 
     def search_by_query(self, query, use_cache=True):
         """
         Search for a suitable repository based on the given query.
         
+        Only the cached repositories that best match the query in the repository index are offered
+        to the dispatcher, so the size of the dispatch prompt does not depend on the size of the cache.
+        
         Args:
             query (str): The query to solve.
             use_cache (bool, optional): Whether to use cached repository information. Default is True.
@@ -236,30 +496,29 @@ You will be given the query of the task and name(s) and description(s) of existe
         Return:
             tuple: A tuple containing the repository name and URL, or (None, None) if not found.
         """
-        temp_func = functions
+        temp_func = copy.deepcopy(functions)
         content = "Query: " + query
-        if (
-            use_cache
-            and cache != {}
-            and any(
-                "description" in repo and repo["description"] is not None
-                for repo in cache.values()
-            )
-        ):
+        matches = []
+        if use_cache and cache != {}:
+            repo_index.sync(cache)
+            matches = [
+                repo_name
+                for repo_name, _ in repo_index.search(query, DISPATCH_TOP_K)
+                if cache[repo_name].get("description") is not None
+            ]
+        if matches:
             sys_prompt = self.system_dispatch
-            repo_list = list(cache.keys())
             temp_func[0]["function"]["parameters"]["properties"]["repo_name"][
                 "enum"
-            ] = repo_list
-            for repo_name, repo in cache.items():
-                if "description" in repo and repo["description"] is not None:
-                    content += (
-                        "\nRepository's name: "
-                        + repo_name
-                        + "\nDescription: "
-                        + repo["description"]
-                        + "\n\n"
-                    )
+            ] = matches
+            for repo_name in matches:
+                content += (
+                    "\nRepository's name: "
+                    + repo_name
+                    + "\nDescription: "
+                    + cache[repo_name]["description"]
+                    + "\n\n"
+                )
         else:
             sys_prompt = "You are a professional programmer. Given a task, you want to find a github repository to solve the task."
             temp_func = temp_func[1:]
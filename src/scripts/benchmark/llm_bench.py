@@ -0,0 +1,304 @@
+"""
+Offline load test of the LLM pipeline.
+
+Concurrent `gpt4` or `gpt4_functions` calls are sent through the real client, limiter, retry policy
+and response cache to `MockOpenai`, which answers from a script with configurable latency, token
+usage and injected rate limits. Throughput, latency, the peak concurrency seen by the server, rate
+limits, retries and cache hits are reported per pass.
+
+Run it from `src/scripts`:
+
+    python -m benchmark.llm_bench --requests 200 --concurrency 16 --latency 0.5 --rate_limit 0.05
+    python -m benchmark.llm_bench --tools --stream --passes 2 --llm_cache cache
+
+To drive `main.py` end to end offline instead, serve the script with
+`python -m benchmark.mock_openai --port 8766` and set `BaseURL` to `http://127.0.0.1:8766/v1`.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+import utils.OpenaiAPI as openai_api_module
+from  benchmark.mock_openai import MockOpenai, llm_script_file
+from  benchmark.search_bench import percentile
+from  functions.functions_main import functions
+from  utils import (MODES, LLMCallError, background_loop, gpt, llm_cache,
+                           llm_limiter)
+
+MOCK_API_KEY = "mock"
+
+
+def build_messages(number, distinct):
+    """
+    Build the messages of a request.
+
+    Args:
+        number (int): The number of the request.
+        distinct (int): The number of distinct requests; request `number` repeats request `number % distinct`.
+
+    Return:
+        list: The messages.
+    """
+    return [
+        {"role": "system", "content": "You are a helpful assistant that solves queries with github repositories."},
+        {"role": "user", "content": f"Query {number % distinct}: remove the background of image {number % distinct}."},
+    ]
+
+
+async def timed_call(number, args):
+    """
+    Send one request and time it.
+
+    Args:
+        number (int): The number of the request.
+        args (argparse.Namespace): The benchmark options.
+
+    Return:
+        dict: The latency of the request and its error, if any.
+    """
+    messages = build_messages(number, args.distinct or args.requests)
+    start = time.perf_counter()
+    error = None
+    try:
+        if args.tools:
+            await gpt.agpt4_functions(messages, functions)
+        else:
+            await gpt.agpt4(messages)
+    except LLMCallError as e:
+        error = e.kind
+    except Exception as e:
+        error = type(e).__name__
+    return {"latency": time.perf_counter() - start, "error": error}
+
+
+async def run_pass(args):
+    """
+    Send all the requests of a pass concurrently.
+
+    Args:
+        args (argparse.Namespace): The benchmark options.
+
+    Return:
+        list: The result of each request.
+    """
+    return await asyncio.gather(
+        *[timed_call(number, args) for number in range(args.requests)]
+    )
+
+
+def summarize(results, wall, mock, cache_stats):
+    """
+    Aggregate the measurements of a pass.
+
+    Args:
+        results (list): The result of each request.
+        wall (float): The duration of the pass in seconds.
+        mock (MockOpenai): The mock server, with the counters of the pass.
+        cache_stats (dict): The counters of the response cache during the pass.
+
+    Return:
+        dict: The summary of the pass.
+    """
+    latencies = [result["latency"] for result in results]
+    errors = [result["error"] for result in results if result["error"]]
+    succeeded = len(results) - len(errors)
+    return {
+        "requests": len(results),
+        "errors": len(errors),
+        "error_kinds": {kind: errors.count(kind) for kind in set(errors)},
+        "wall": wall,
+        "throughput": len(results) / wall if wall else 0,
+        "latency_mean": sum(latencies) / (len(latencies) or 1),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "server_requests": mock.stats["requests"],
+        "rate_limited": mock.stats["rate_limited"],
+        "retries": max(0, mock.stats["requests"] - succeeded + cache_stats["hits"]),
+        "peak_in_flight": mock.stats["peak_in_flight"],
+        "cache_hits": cache_stats["hits"],
+        "prompt_tokens": mock.stats["prompt_tokens"],
+        "completion_tokens": mock.stats["completion_tokens"],
+    }
+
+
+def print_pass(number, summary):
+    """
+    Print the summary of a pass.
+
+    Args:
+        number (int): The number of the pass, from 1.
+        summary (dict): The summary of the pass.
+    """
+    print(
+        f"Pass {number}: {summary['requests']} requests in {summary['wall']:.2f}s "
+        f"({summary['throughput']:.1f}/s), latency mean {summary['latency_mean']:.3f}s "
+        f"p50 {summary['latency_p50']:.3f}s p95 {summary['latency_p95']:.3f}s, "
+        f"{summary['server_requests']} sent, peak {summary['peak_in_flight']} in flight, "
+        f"{summary['rate_limited']} rate limited, {summary['retries']} retries, "
+        f"{summary['cache_hits']} cache hits, {summary['errors']} errors {summary['error_kinds'] or ''}, "
+        f"{summary['prompt_tokens']} prompt + {summary['completion_tokens']} completion tokens"
+    )
+
+
+if __name__ == "__main__":
+    my_parser = argparse.ArgumentParser(description="Load test the LLM pipeline offline")
+    my_parser.add_argument(
+        "--requests",
+        metavar="requests",
+        type=int,
+        help="the number of requests of a pass",
+        default=100,
+    )
+    my_parser.add_argument(
+        "--distinct",
+        metavar="distinct",
+        type=int,
+        help="the number of distinct requests; fewer than --requests gives cache hits (default: all distinct)",
+        default=None,
+    )
+    my_parser.add_argument(
+        "--concurrency",
+        metavar="concurrency",
+        type=int,
+        help="the requests in flight allowed for the model (default: the ModelLimits of config.json)",
+        default=None,
+    )
+    my_parser.add_argument(
+        "--tpm",
+        metavar="tpm",
+        type=int,
+        help="the tokens per minute allowed for the model",
+        default=None,
+    )
+    my_parser.add_argument(
+        "--tools",
+        action="store_true",
+        help="send tool calls with the functions of the main agent instead of text requests",
+        default=False,
+    )
+    my_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="stream the responses",
+        default=False,
+    )
+    my_parser.add_argument(
+        "--passes",
+        metavar="passes",
+        type=int,
+        help="how many times the requests are sent; later passes can hit the response cache",
+        default=1,
+    )
+    my_parser.add_argument(
+        "--llm_cache",
+        choices=MODES,
+        help="how LLM responses are cached during the test",
+        default="off",
+    )
+    my_parser.add_argument(
+        "--script",
+        metavar="script",
+        type=str,
+        help="the JSON script of the mock server",
+        default=llm_script_file,
+    )
+    my_parser.add_argument(
+        "--latency",
+        metavar="latency",
+        type=float,
+        help="the mean number of seconds each response is delayed by",
+        default=0.2,
+    )
+    my_parser.add_argument(
+        "--latency_sd",
+        metavar="latency_sd",
+        type=float,
+        help="the standard deviation of the delay",
+        default=0.05,
+    )
+    my_parser.add_argument(
+        "--usage_sigma",
+        metavar="usage_sigma",
+        type=float,
+        help="the sigma of the log-normal noise on the completion tokens reported",
+        default=0.3,
+    )
+    my_parser.add_argument(
+        "--rate_limit",
+        metavar="rate_limit",
+        type=float,
+        help="the share of requests answered with 429",
+        default=0,
+    )
+    my_parser.add_argument(
+        "--seed",
+        metavar="seed",
+        type=int,
+        help="the seed of the random draws of the mock server",
+        default=0,
+    )
+    my_parser.add_argument(
+        "--output",
+        metavar="output",
+        type=str,
+        help="the JSON file the report is written to",
+        default=None,
+    )
+    my_parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="show the responses",
+        default=False,
+    )
+    args = my_parser.parse_args()
+
+    mock = MockOpenai(
+        args.script,
+        args.latency,
+        args.latency_sd,
+        args.usage_sigma,
+        args.rate_limit,
+        args.seed,
+    )
+    openai_api_module.OPENAI_BASE_URL = mock.start()
+    openai_api_module.OPENAI_API_KEY = MOCK_API_KEY
+    gpt.stream = args.stream
+    workspace = tempfile.mkdtemp(prefix="llm_bench_")
+    llm_cache.cache_dir = workspace
+    llm_cache.mode = args.llm_cache
+    limits = llm_limiter.model_limits.setdefault(gpt.version, {})
+    if args.concurrency:
+        limits["concurrency"] = args.concurrency
+    if args.tpm:
+        limits["tpm"] = args.tpm
+    if not args.verbose:
+        sys.stdout.terminal = io.StringIO()
+
+    report = {"options": vars(args), "passes": []}
+    try:
+        for number in range(1, args.passes + 1):
+            mock.reset_stats()
+            hits = llm_cache.stats["hits"]
+            start = time.perf_counter()
+            results = background_loop.run(run_pass(args))
+            wall = time.perf_counter() - start
+            summary = summarize(
+                results, wall, mock, {"hits": llm_cache.stats["hits"] - hits}
+            )
+            report["passes"].append(summary)
+    finally:
+        mock.stop()
+        shutil.rmtree(workspace, ignore_errors=True)
+        sys.stdout.terminal = sys.__stdout__
+
+    for number, summary in enumerate(report["passes"], 1):
+        print_pass(number, summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
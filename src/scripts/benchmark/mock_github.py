@@ -0,0 +1,361 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_WEB_URL = "https://github.com"
+WEB_PREFIX = "/web"
+fixtures_file = "benchmark/fixtures/github.json"
+RATE_LIMIT = 5000
+
+
+def route_key(url):
+    """
+    Get the fixture key of a GitHub URL: the unquoted path and query, with web URLs (clone, diff) under WEB_PREFIX.
+
+    Args:
+        url (str): An absolute GitHub API or web URL, or a path already relative to the mock server.
+
+    Return:
+        str: The key, or None if the URL does not belong to GitHub.
+    """
+    if url.startswith(GITHUB_API_URL):
+        url = url[len(GITHUB_API_URL):]
+    elif url.startswith(GITHUB_WEB_URL):
+        url = WEB_PREFIX + url[len(GITHUB_WEB_URL):]
+    elif not url.startswith("/"):
+        return None
+    return unquote(url)
+
+
+def pkt_line(text):
+    """
+    Encode a line in the pkt-line format of the git smart HTTP protocol.
+
+    Args:
+        text (str): The line.
+
+    Return:
+        bytes: The encoded line.
+    """
+    data = text.encode("utf-8")
+    return f"{len(data) + 4:04x}".encode("ascii") + data
+
+
+class MockGithub:
+    """
+    This class replays recorded GitHub responses from a fixtures file so the search phase can be measured offline.
+
+    The fixtures file holds `routes`, mapping the path and query of an API request (see `route_key`) to
+    its recorded status, content type and body, and `refs`, mapping `owner/name` to the SHA of the
+    default branch. Absolute GitHub URLs inside replayed bodies are rewritten to point at the mock
+    server, `git ls-remote` is answered from `refs`, and every body carries an `ETag`, so conditional
+    requests are answered with `304 Not Modified` like the real API does.
+    """
+
+    def __init__(self, file_name=fixtures_file, latency=0):
+        """
+        Initialize the MockGithub and load its fixtures.
+
+        Args:
+            file_name (str, optional): The JSON fixtures file. Default is fixtures_file.
+            latency (float, optional): Seconds each response is delayed by, to simulate the network. Default is 0.
+        """
+        with open(file_name, "r") as f:
+            fixtures = json.load(f)
+        self.routes = fixtures.get("routes", {})
+        self.refs = fixtures.get("refs", {})
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.server = None
+        self.url = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Reset the request counters.
+        """
+        with self.lock:
+            self.stats = {"requests": 0, "not_modified": 0, "misses": 0, "bytes": 0}
+
+    def count(self, status, size):
+        """
+        Count a response sent by the server.
+
+        Args:
+            status (int): The status code of the response.
+            size (int): The number of body bytes sent.
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += size
+            if status == 304:
+                self.stats["not_modified"] += 1
+            elif status == 404:
+                self.stats["misses"] += 1
+
+    def rewrite(self, text):
+        """
+        Point the GitHub URLs of a recorded body at the mock server.
+
+        Args:
+            text (str): The recorded body.
+
+        Return:
+            str: The rewritten body.
+        """
+        text = text.replace(GITHUB_API_URL, self.url)
+        return text.replace(GITHUB_WEB_URL, self.url + WEB_PREFIX)
+
+    def advertise_refs(self, full_name):
+        """
+        Build the ref advertisement `git ls-remote` reads over smart HTTP.
+
+        Args:
+            full_name (str): The repository in `owner/name` form.
+
+        Return:
+            bytes: The advertisement, or None if the repository has no recorded SHA.
+        """
+        sha = self.refs.get(full_name)
+        if sha is None:
+            return None
+        return (
+            pkt_line("# service=git-upload-pack\n")
+            + b"0000"
+            + pkt_line(f"{sha} HEAD\0symref=HEAD:refs/heads/main\n")
+            + pkt_line(f"{sha} refs/heads/main\n")
+            + b"0000"
+        )
+
+    def respond(self, path, headers):
+        """
+        Build the response to a request.
+
+        Args:
+            path (str): The path and query of the request.
+            headers (dict): The headers of the request.
+
+        Return:
+            tuple: The status code, the response headers and the body.
+        """
+        key = unquote(path)
+        response_headers = {
+            "X-RateLimit-Limit": str(RATE_LIMIT),
+            "X-RateLimit-Remaining": str(RATE_LIMIT),
+            "X-RateLimit-Reset": str(int(time.time()) + 3600),
+        }
+        if key.endswith(".git/info/refs?service=git-upload-pack"):
+            full_name = key[len(WEB_PREFIX) + 1:].split(".git/")[0]
+            body = self.advertise_refs(full_name)
+            if body is None:
+                return 404, {}, b""
+            return 200, {"Content-Type": "application/x-git-upload-pack-advertisement"}, body
+
+        route = self.routes.get(key)
+        if route is None:
+            body = json.dumps({"message": "Not Found"}).encode("utf-8")
+            response_headers["Content-Type"] = "application/json"
+            return 404, response_headers, body
+        body = route["body"]
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        body = self.rewrite(body).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        response_headers["ETag"] = etag
+        if headers.get("If-None-Match") == etag:
+            return 304, response_headers, b""
+        response_headers["Content-Type"] = route.get("content_type", "application/json")
+        return route.get("status", 200), response_headers, body
+
+    def start(self, port=0):
+        """
+        Serve the fixtures on a background thread.
+
+        Args:
+            port (int, optional): The port to listen on. Default is 0, any free port.
+
+        Return:
+            str: The URL of the server.
+        """
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if mock.latency:
+                    time.sleep(mock.latency)
+                status, headers, body = mock.respond(self.path, self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                mock.count(status, len(body))
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        """
+        Stop the server.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class FixtureRecorder:
+    """
+    This class records the GitHub responses of a live run into a fixtures file for `MockGithub`.
+
+    It wraps `GithubClient.send` and `resolve_head_sha` so every request made while it is installed is
+    stored under its `route_key`. Recording merges into an existing fixtures file.
+    """
+
+    def __init__(self, file_name=fixtures_file):
+        """
+        Initialize the FixtureRecorder and load the fixtures recorded so far.
+
+        Args:
+            file_name (str, optional): The JSON fixtures file. Default is fixtures_file.
+        """
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.refs = {}
+        try:
+            with open(file_name, "r") as f:
+                fixtures = json.load(f)
+            self.routes = fixtures.get("routes", {})
+            self.refs = fixtures.get("refs", {})
+        except (OSError, ValueError):
+            pass
+
+    def record_response(self, response):
+        """
+        Store a live response.
+
+        Args:
+            response (requests.Response): The response to store.
+        """
+        if response.status_code == 304:
+            return
+        key = route_key(response.url)
+        if key is None:
+            return
+        content_type = response.headers.get("Content-Type", "application/json").split(";")[0]
+        body = response.text
+        if content_type.endswith("json"):
+            try:
+                body = json.loads(body)
+            except ValueError:
+                pass
+        with self.lock:
+            self.routes[key] = {
+                "status": response.status_code,
+                "content_type": content_type,
+                "body": body,
+            }
+
+    def record_ref(self, repo_url, sha):
+        """
+        Store the default-branch SHA of a repository.
+
+        Args:
+            repo_url (str): The clone URL of the repository.
+            sha (str): The SHA, or None if it could not be resolved.
+        """
+        key = route_key(repo_url)
+        if sha is None or key is None or not key.startswith(WEB_PREFIX + "/"):
+            return
+        full_name = key[len(WEB_PREFIX) + 1:]
+        if full_name.endswith(".git"):
+            full_name = full_name[: -len(".git")]
+        with self.lock:
+            self.refs[full_name] = sha
+
+    def install(self, client, searcher_module):
+        """
+        Wrap the request functions of a GitHub client and of the searcher module so their results are recorded.
+
+        Args:
+            client (GithubClient): The shared GitHub client.
+            searcher_module (module): The `RepoSearcher` module, whose `resolve_head_sha` is wrapped.
+        """
+        send = client.send
+        resolve_head_sha = searcher_module.resolve_head_sha
+
+        def recording_send(url, headers, **kwargs):
+            headers = {
+                name: value
+                for name, value in headers.items()
+                if name not in ("If-None-Match", "If-Modified-Since")
+            }
+            response = send(url, headers, **kwargs)
+            self.record_response(response)
+            return response
+
+        def recording_resolve_head_sha(repo_url):
+            sha = resolve_head_sha(repo_url)
+            self.record_ref(repo_url, sha)
+            return sha
+
+        client.send = recording_send
+        searcher_module.resolve_head_sha = recording_resolve_head_sha
+
+    def save(self):
+        """
+        Write the recorded fixtures to disk.
+        """
+        with self.lock:
+            fixtures = {"routes": self.routes, "refs": self.refs}
+        with open(self.file_name, "w") as f:
+            json.dump(fixtures, f, indent=1, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    my_parser = argparse.ArgumentParser(description="Serve recorded GitHub responses")
+    my_parser.add_argument(
+        "--fixtures",
+        metavar="fixtures",
+        type=str,
+        help="the JSON fixtures file to replay",
+        default=fixtures_file,
+    )
+    my_parser.add_argument(
+        "--port",
+        metavar="port",
+        type=int,
+        help="the port to listen on",
+        default=8765,
+    )
+    my_parser.add_argument(
+        "--latency",
+        metavar="latency",
+        type=float,
+        help="seconds each response is delayed by",
+        default=0,
+    )
+    args = my_parser.parse_args()
+
+    mock = MockGithub(args.fixtures, args.latency)
+    print(f"Serving {len(mock.routes)} routes and {len(mock.refs)} refs on {mock.start(args.port)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,475 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from  utils.TokenBudget import token_budget
+
+llm_script_file = "benchmark/fixtures/llm_script.json"
+DEFAULT_TEXT = "Judge: Yes\nMessage: scripted"
+# Tool calls that end a loop, preferred when no rule matches
+FINISHING_TOOLS = ["finish", "submit"]
+STREAM_PIECES = 8
+RETRY_AFTER = 1
+PLACEHOLDERS = {
+    "string": "scripted",
+    "boolean": False,
+    "integer": 0,
+    "number": 0,
+    "array": [],
+    "object": {},
+}
+
+
+def placeholder_arguments(function):
+    """
+    Build arguments for a function from its JSON schema, with a placeholder for every required parameter.
+
+    Args:
+        function (dict): The tool, in the `{"type": "function", "function": {...}}` form.
+
+    Return:
+        dict: The arguments.
+    """
+    parameters = function["function"].get("parameters", {})
+    properties = parameters.get("properties", {})
+    arguments = {}
+    for name in parameters.get("required", []):
+        kind = properties.get(name, {}).get("type", "string")
+        arguments[name] = PLACEHOLDERS.get(kind, "scripted")
+    return arguments
+
+
+class MockOpenai:
+    """
+    This class is a local stand-in for the chat completions endpoint of the OpenAI API, for offline runs and load tests.
+
+    Answers come from the rules of a script file. A rule has a `pattern` matched against the system
+    prompt and the last message, an optional `tool` that must be among the offered tools, and
+    `responses`, each either `{"content": ...}` or `{"tool_call": {"name": ..., "arguments": {...}}}`.
+    They are given in turn on every match, and the last one repeats. When no rule matches, a tool
+    request gets a call of `finish`/`submit` (or of the first tool) with placeholder arguments, and a
+    text request gets `default_text`, so every agent loop comes to an end.
+
+    Both plain and streamed (SSE) responses are served, with tool calls in the tools schema. Latency
+    is drawn from a normal distribution, the reported completion usage is the counted tokens scaled by
+    a log-normal factor, and a share of the requests can be answered with `429 Too Many Requests`.
+    """
+
+    def __init__(
+        self,
+        file_name=llm_script_file,
+        latency=0,
+        latency_sd=0,
+        usage_sigma=0,
+        rate_limit=0,
+        seed=None,
+    ):
+        """
+        Initialize the MockOpenai and load its script.
+
+        Args:
+            file_name (str, optional): The JSON script file. Default is llm_script_file.
+            latency (float, optional): The mean number of seconds a response is delayed by. Default is 0.
+            latency_sd (float, optional): The standard deviation of the delay. Default is 0.
+            usage_sigma (float, optional): The sigma of the log-normal factor applied to the completion tokens reported. Default is 0.
+            rate_limit (float, optional): The share of requests answered with 429. Default is 0.
+            seed (int, optional): The seed of the random draws. Default is None.
+        """
+        self.script = {"rules": [], "default_text": DEFAULT_TEXT}
+        try:
+            with open(file_name, "r") as f:
+                self.script.update(json.load(f))
+        except OSError:
+            pass
+        self.latency = latency
+        self.latency_sd = latency_sd
+        self.usage_sigma = usage_sigma
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.turns = {}
+        self.server = None
+        self.url = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Reset the request counters.
+        """
+        with self.lock:
+            self.in_flight = 0
+            self.stats = {
+                "requests": 0,
+                "rate_limited": 0,
+                "streamed": 0,
+                "tool_calls": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "peak_in_flight": 0,
+            }
+
+    def draw(self):
+        """
+        Draw the delay of a response, whether it is rate limited and the factor of its completion usage.
+
+        Return:
+            tuple: The delay in seconds, whether to answer with 429, and the usage factor.
+        """
+        with self.lock:
+            delay = max(0, self.random.gauss(self.latency, self.latency_sd))
+            limited = self.random.random() < self.rate_limit
+            factor = math.exp(self.random.gauss(0, self.usage_sigma))
+        return delay, limited, factor
+
+    def answer(self, body):
+        """
+        Pick the answer of a request from the script.
+
+        Args:
+            body (dict): The request.
+
+        Return:
+            dict: `{"content": ...}` or `{"tool_call": {"name": ..., "arguments": ...}}`.
+        """
+        messages = body.get("messages", [])
+        tools = body.get("tools") or []
+        names = [tool["function"]["name"] for tool in tools]
+        system = (messages[0].get("content") or "") if messages else ""
+        last = (messages[-1].get("content") or "") if messages else ""
+        for number, rule in enumerate(self.script["rules"]):
+            if ("tool_call" in rule["responses"][0]) != bool(tools):
+                continue
+            if rule.get("tool") and rule["tool"] not in names:
+                continue
+            if not re.search(rule.get("pattern", ""), system + "\n" + last, re.DOTALL):
+                continue
+            with self.lock:
+                turn = self.turns.get(number, 0)
+                self.turns[number] = turn + 1
+            return rule["responses"][min(turn, len(rule["responses"]) - 1)]
+        if not tools:
+            return {"content": self.script["default_text"]}
+        finishing = [name for name in FINISHING_TOOLS if name in names]
+        tool = tools[names.index(finishing[0])] if finishing else tools[0]
+        return {
+            "tool_call": {
+                "name": tool["function"]["name"],
+                "arguments": placeholder_arguments(tool),
+            }
+        }
+
+    def message(self, answer):
+        """
+        Build the assistant message of an answer.
+
+        Args:
+            answer (dict): The answer picked by `answer`.
+
+        Return:
+            dict: The message, with `content` or `tool_calls`.
+        """
+        if "content" in answer:
+            return {"role": "assistant", "content": answer["content"]}
+        arguments = answer["tool_call"]["arguments"]
+        if not isinstance(arguments, str):
+            arguments = json.dumps(arguments)
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": "call_0",
+                    "type": "function",
+                    "function": {"name": answer["tool_call"]["name"], "arguments": arguments},
+                }
+            ],
+        }
+
+    def usage(self, body, message, factor):
+        """
+        Count the token usage of a response and add it to the stats.
+
+        Args:
+            body (dict): The request.
+            message (dict): The assistant message.
+            factor (float): The factor applied to the completion tokens.
+
+        Return:
+            dict: The usage.
+        """
+        model = body.get("model")
+        prompt_tokens = token_budget.count_messages(
+            body.get("messages", []), body.get("tools"), model
+        )
+        completion = message["content"] or json.dumps(message.get("tool_calls"))
+        completion_tokens = max(1, round(token_budget.count(completion, model) * factor))
+        with self.lock:
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            if message.get("tool_calls"):
+                self.stats["tool_calls"] += 1
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def chunks(self, body, message, usage):
+        """
+        Split a response into the chunks of a stream.
+
+        Args:
+            body (dict): The request.
+            message (dict): The assistant message.
+            usage (dict): The usage, sent in a last chunk if the request asks for it.
+
+        Return:
+            list: The chunks.
+        """
+        model = body.get("model")
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        chunks = [chunk({"role": "assistant", "content": ""})]
+        if message.get("tool_calls"):
+            function = message["tool_calls"][0]["function"]
+            chunks.append(
+                chunk(
+                    {
+                        "tool_calls": [
+                            {
+                                "index": 0,
+                                "id": "call_0",
+                                "type": "function",
+                                "function": {"name": function["name"], "arguments": ""},
+                            }
+                        ]
+                    }
+                )
+            )
+            text = function["arguments"]
+            key = "tool_calls"
+        else:
+            text = message["content"]
+            key = "content"
+        size = max(1, math.ceil(len(text) / STREAM_PIECES))
+        for start in range(0, len(text), size):
+            piece = text[start : start + size]
+            if key == "content":
+                chunks.append(chunk({"content": piece}))
+            else:
+                chunks.append(
+                    chunk({"tool_calls": [{"index": 0, "function": {"arguments": piece}}]})
+                )
+        chunks.append(chunk({}, "tool_calls" if key == "tool_calls" else "stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunks.append(
+                {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+            )
+        return chunks
+
+    def start(self, port=0):
+        """
+        Serve the chat completions endpoint on a background thread.
+
+        Args:
+            port (int, optional): The port to listen on. Default is 0, any free port.
+
+        Return:
+            str: The base URL of the API, ending in `/v1`.
+        """
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send_json(self, status, data, headers=None):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_event(self, data):
+                event = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+                event = event.encode("utf-8")
+                self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if not self.path.endswith("/chat/completions"):
+                    self.send_json(404, {"error": {"message": "Not Found", "type": "invalid_request_error"}})
+                    return
+                delay, limited, factor = mock.draw()
+                with mock.lock:
+                    mock.stats["requests"] += 1
+                    mock.in_flight += 1
+                    mock.stats["peak_in_flight"] = max(
+                        mock.stats["peak_in_flight"], mock.in_flight
+                    )
+                try:
+                    if limited:
+                        with mock.lock:
+                            mock.stats["rate_limited"] += 1
+                        self.send_json(
+                            429,
+                            {
+                                "error": {
+                                    "message": "Rate limit reached (mock).",
+                                    "type": "requests",
+                                    "code": "rate_limit_exceeded",
+                                }
+                            },
+                            {"Retry-After": str(RETRY_AFTER)},
+                        )
+                        return
+                    message = mock.message(mock.answer(body))
+                    usage = mock.usage(body, message, factor)
+                    if not body.get("stream"):
+                        time.sleep(delay)
+                        self.send_json(
+                            200,
+                            {
+                                "id": "chatcmpl-mock",
+                                "object": "chat.completion",
+                                "created": int(time.time()),
+                                "model": body.get("model"),
+                                "choices": [
+                                    {
+                                        "index": 0,
+                                        "message": message,
+                                        "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                                    }
+                                ],
+                                "usage": usage,
+                            },
+                        )
+                        return
+                    with mock.lock:
+                        mock.stats["streamed"] += 1
+                    chunks = mock.chunks(body, message, usage)
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for chunk in chunks:
+                        time.sleep(delay / len(chunks))
+                        self.send_event(chunk)
+                    self.send_event("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with mock.lock:
+                        mock.in_flight -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        """
+        Stop the server.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+if __name__ == "__main__":
+    my_parser = argparse.ArgumentParser(description="Serve scripted chat completions")
+    my_parser.add_argument(
+        "--script",
+        metavar="script",
+        type=str,
+        help="the JSON script of the responses",
+        default=llm_script_file,
+    )
+    my_parser.add_argument(
+        "--port",
+        metavar="port",
+        type=int,
+        help="the port to listen on",
+        default=8766,
+    )
+    my_parser.add_argument(
+        "--latency",
+        metavar="latency",
+        type=float,
+        help="the mean number of seconds each response is delayed by",
+        default=0,
+    )
+    my_parser.add_argument(
+        "--latency_sd",
+        metavar="latency_sd",
+        type=float,
+        help="the standard deviation of the delay",
+        default=0,
+    )
+    my_parser.add_argument(
+        "--usage_sigma",
+        metavar="usage_sigma",
+        type=float,
+        help="the sigma of the log-normal noise on the completion tokens reported",
+        default=0,
+    )
+    my_parser.add_argument(
+        "--rate_limit",
+        metavar="rate_limit",
+        type=float,
+        help="the share of requests answered with 429",
+        default=0,
+    )
+    my_parser.add_argument(
+        "--seed",
+        metavar="seed",
+        type=int,
+        help="the seed of the random draws",
+        default=None,
+    )
+    args = my_parser.parse_args()
+
+    mock = MockOpenai(
+        args.script,
+        args.latency,
+        args.latency_sd,
+        args.usage_sigma,
+        args.rate_limit,
+        args.seed,
+    )
+    print(f"Serving {len(mock.script['rules'])} rules on {mock.start(args.port)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+        print(json.dumps(mock.stats, indent=2))
@@ -0,0 +1,203 @@
+import json
+import re
+import threading
+
+from  utils.BatchJudge import estimate_tokens, split_answers
+from  utils.RepoRanker import tokenize
+
+script_file = "benchmark/fixtures/script.json"
+TOPIC_COUNT = 3
+JUDGE_OVERLAP = 0.3
+
+
+class ScriptedLLM:
+    """
+    This class is a deterministic stand-in for `gpt4` and `gpt4_functions` during benchmarks.
+
+    Answers come from the rules of a script file where one matches, and from simple lexical heuristics
+    otherwise, so the same queries and fixtures always lead to the same calls. The script holds
+    `topics` and `texts` (regular expression on the query -> answer) and `verdicts` (repository name ->
+    "Yes"/"No"). Every call is counted with its estimated prompt and completion tokens.
+    """
+
+    def __init__(self, file_name=script_file):
+        """
+        Initialize the ScriptedLLM and load its script.
+
+        Args:
+            file_name (str, optional): The JSON script file. Default is script_file.
+        """
+        self.script = {"topics": {}, "texts": {}, "verdicts": {}}
+        try:
+            with open(file_name, "r") as f:
+                self.script.update(json.load(f))
+        except OSError:
+            pass
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Reset the call counters.
+        """
+        with self.lock:
+            self.stats = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def count(self, messages, answer, functions=None):
+        """
+        Count a call with its estimated token usage.
+
+        Args:
+            messages (list): The messages of the call.
+            answer (str): The answer returned.
+            functions (list, optional): The functions offered to the model. Default is None.
+        """
+        prompt = "".join(str(message.get("content") or "") for message in messages)
+        if functions:
+            prompt += json.dumps(functions)
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["prompt_tokens"] += estimate_tokens(prompt)
+            self.stats["completion_tokens"] += estimate_tokens(answer)
+
+    def lookup(self, section, text):
+        """
+        Get the answer of the first rule of a script section whose pattern matches a text.
+
+        Args:
+            section (str): "topics" or "texts".
+            text (str): The text matched against the patterns.
+
+        Return:
+            The answer of the rule, or None if no rule matches.
+        """
+        for pattern, answer in self.script[section].items():
+            if re.search(pattern, text, re.IGNORECASE):
+                return answer
+        return None
+
+    def topics(self, query):
+        """
+        Get the topics to search for a query.
+
+        Args:
+            query (str): The query to solve.
+
+        Return:
+            list: The topics.
+        """
+        topics = self.lookup("topics", query)
+        if topics is not None:
+            return topics
+        words = []
+        for word in tokenize(query):
+            if len(word) > 3 and not word.isdigit() and word not in words:
+                words.append(word)
+        return words[:TOPIC_COUNT]
+
+    def verdict(self, query, readme, repo_name=None):
+        """
+        Judge whether a README fits a query: by the script if it names the repository, by word overlap otherwise.
+
+        Args:
+            query (str): The query to solve.
+            readme (str): The README.
+            repo_name (str, optional): The name of the repository. Default is None.
+
+        Return:
+            str: The answer in the format of the README judge.
+        """
+        if repo_name in self.script["verdicts"]:
+            judgement = self.script["verdicts"][repo_name]
+            return f"Reason: scripted.\nJudge: {judgement}"
+        query_words = set(tokenize(query))
+        overlap = len(query_words & set(tokenize(readme))) / (len(query_words) or 1)
+        judgement = "Yes" if overlap >= JUDGE_OVERLAP else "No"
+        return f"Reason: {overlap:.0%} of the query words appear in the readme.\nJudge: {judgement}"
+
+    def answer(self, messages):
+        """
+        Answer a text completion request of the search phase.
+
+        Args:
+            messages (list): The messages of the request.
+
+        Return:
+            str: The answer.
+        """
+        system = messages[0]["content"]
+        content = messages[-1]["content"]
+        if "search for the needed repository by their topics" in system:
+            return "************\n" + ", ".join(self.topics(content)) + "\n************"
+        if "readme file of a github repository" in system:
+            query = re.search(r"Query:'''(.*?)'''", content, re.DOTALL)
+            query = query.group(1) if query else content
+            if "### Candidate 1" not in content:
+                readme = content.split("Readme of the repository:", 1)[-1]
+                return self.verdict(query, readme)
+            count = len(re.findall(r"^### Candidate \d+$", content, re.MULTILINE))
+            answers = []
+            for number, candidate in enumerate(split_answers(content, count), 1):
+                candidate = candidate or ""
+                repo_name = re.match(r"Readme of the repository (\S+?):", candidate)
+                repo_name = repo_name.group(1) if repo_name else None
+                answers.append(f"### Candidate {number}\n" + self.verdict(query, candidate, repo_name))
+            return "\n\n".join(answers)
+        return "Judge: No\nMessage: None"
+
+    def gpt4(self, messages, *args, **kwargs):
+        """
+        Stand in for `gpt4`.
+
+        Args:
+            messages (list): The messages of the request.
+            *args: Ignored.
+            **kwargs: Ignored.
+
+        Return:
+            str: The answer.
+        """
+        answer = self.answer(messages)
+        self.count(messages, answer)
+        return answer
+
+    def gpt4_functions(self, messages, functions, *args, **kwargs):
+        """
+        Stand in for `gpt4_functions` in the dispatch step of the search phase.
+
+        A cached repository is used if its description fits the query. Otherwise a repository named in
+        the query (or matched by a `texts` rule) is searched by text, and topics are searched last.
+
+        Args:
+            messages (list): The messages of the request.
+            functions (list): The functions offered to the model.
+            *args: Ignored.
+            **kwargs: Ignored.
+
+        Return:
+            dict: The function call, with `name` and JSON `arguments`.
+        """
+        content = messages[-1]["content"]
+        query = content.split("\n")[0].replace("Query: ", "", 1)
+        names = [function["function"]["name"] for function in functions]
+        call = None
+        if "use_existing_repository" in names:
+            described = re.findall(
+                r"Repository's name: (.+)\nDescription: (.*?)\n\n", content, re.DOTALL
+            )
+            for repo_name, description in described:
+                if "Judge: Yes" in self.verdict(query, description):
+                    call = {"name": "use_existing_repository", "arguments": {"repo_name": repo_name}}
+                    break
+        if call is None:
+            arguments = {}
+            named = re.search(r"github\.com/[\w.-]+/([\w.-]+)", query)
+            text = self.lookup("texts", query) or (named.group(1) if named else None)
+            if text:
+                arguments["text"] = text
+            else:
+                arguments["topics"] = ", ".join(self.topics(query))
+            call = {"name": names[-1], "arguments": arguments}
+        call["arguments"] = json.dumps(dict(thought="scripted", **call["arguments"]))
+        self.count(messages, call["arguments"], functions)
+        return call
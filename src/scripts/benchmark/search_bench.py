@@ -0,0 +1,391 @@
+"""
+Offline benchmark of the search phase.
+
+`RepoSearcher.search_by_query` is run over the queries of `data/queries.json` against `MockGithub`,
+which replays recorded GitHub responses, with `ScriptedLLM` standing in for the model. Latency,
+GitHub calls, bytes fetched and LLM tokens are reported per query and summed per pass, and can be
+compared against an earlier report to catch regressions.
+
+Run it from `src/scripts`:
+
+    python -m benchmark.search_bench --limit 20 --output report.json
+    python -m benchmark.search_bench --limit 20 --compare report.json
+
+Fixtures are recorded from the live GitHub API (with the scripted LLM, so that the replay makes the
+same requests) with:
+
+    python -m benchmark.search_bench --record --limit 20
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import RepoSearcher as searcher_module
+import utils.BatchJudge as batch_judge_module
+from  benchmark.mock_github import FixtureRecorder, MockGithub, fixtures_file
+from  benchmark.scripted_llm import ScriptedLLM, script_file
+from  logger import logger
+from  utils import GITHUB_TOKEN, RateLimiter, github, repo_index, search_cache
+
+queries_file = "../../data/queries.json"
+TOLERANCE = 0.1
+LOWER_IS_BETTER = [
+    "latency_mean",
+    "latency_p50",
+    "latency_p95",
+    "github_requests",
+    "bytes",
+    "llm_calls",
+    "prompt_tokens",
+    "completion_tokens",
+]
+HIGHER_IS_BETTER = ["found"]
+
+
+def percentile(values, fraction):
+    """
+    Get a percentile of a list of values with the nearest-rank method.
+
+    Args:
+        values (list): The values.
+        fraction (float): The percentile, between 0 and 1.
+
+    Return:
+        float: The percentile, or 0 for an empty list.
+    """
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def load_queries(file_name, ids=None, limit=None):
+    """
+    Load the benchmark queries.
+
+    Args:
+        file_name (str): The JSON file mapping query ids to queries.
+        ids (list, optional): The ids of the queries to run. Default is None, all of them.
+        limit (int, optional): The maximum number of queries. Default is None.
+
+    Return:
+        list: (id, query) tuples.
+    """
+    with open(file_name, "r") as f:
+        queries = json.load(f)
+    items = [(key, queries[key]) for key in ids] if ids else list(queries.items())
+    return items[:limit] if limit else items
+
+
+def isolate(workspace):
+    """
+    Point the persistent caches of the search phase at an empty workspace, so the benchmark starts cold
+    and leaves the real caches untouched.
+
+    Args:
+        workspace (str): The temporary directory.
+    """
+    github.cache_dir = os.path.join(workspace, "github_cache")
+    github.rate_limiter = RateLimiter(os.path.join(github.cache_dir, "rate_limit.json"))
+    search_cache.cache_dir = os.path.join(workspace, "search_cache")
+    repo_index.file_name = os.path.join(workspace, "repo_index.pkl")
+    repo_index.docs = {}
+    repo_index.df = Counter()
+    repo_index.total_length = 0
+    logger.file_name = os.path.join(workspace, "buffer.txt")
+
+
+def run_query(query, llm, args):
+    """
+    Run the search phase for one query and measure it.
+
+    Args:
+        query (str): The query to solve.
+        llm (ScriptedLLM): The scripted LLM.
+        args (argparse.Namespace): The benchmark options.
+
+    Return:
+        dict: The measurements of the query.
+    """
+    github.stats = {key: 0 for key in github.stats}
+    llm.reset_stats()
+    logger.log["search_phase"] = []
+    searcher = searcher_module.RepoSearcher(
+        GITHUB_TOKEN, batch_judge=not args.no_batch_judge
+    )
+    output = sys.stdout if args.verbose else io.StringIO()
+    error = None
+    repo_name = None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            repo_name, _ = searcher.search_by_query(query, use_cache=args.use_cache)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    latency = time.perf_counter() - start
+    return {
+        "latency": latency,
+        "github_requests": github.stats["requests"],
+        "not_modified": github.stats["not_modified"],
+        "retries": github.stats["retries"],
+        "bytes": github.stats["bytes"],
+        "llm_calls": llm.stats["calls"],
+        "prompt_tokens": llm.stats["prompt_tokens"],
+        "completion_tokens": llm.stats["completion_tokens"],
+        "repo_name": repo_name,
+        "error": error,
+    }
+
+
+def summarize(results):
+    """
+    Aggregate the measurements of a pass.
+
+    Args:
+        results (list): The measurements of each query.
+
+    Return:
+        dict: The summary of the pass.
+    """
+    latencies = [result["latency"] for result in results]
+    summary = {
+        "queries": len(results),
+        "found": sum(1 for result in results if result["repo_name"]),
+        "errors": sum(1 for result in results if result["error"]),
+        "latency_mean": sum(latencies) / (len(latencies) or 1),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+    }
+    for key in [
+        "github_requests",
+        "not_modified",
+        "retries",
+        "bytes",
+        "llm_calls",
+        "prompt_tokens",
+        "completion_tokens",
+    ]:
+        summary[key] = sum(result[key] for result in results)
+    return summary
+
+
+def print_pass(number, results, summary):
+    """
+    Print the measurements of a pass as a table.
+
+    Args:
+        number (int): The number of the pass, from 1.
+        results (list): The measurements of each query.
+        summary (dict): The summary of the pass.
+    """
+    print(f"\nPass {number}")
+    print(
+        f"{'id':>6} {'latency':>9} {'calls':>6} {'304':>5} {'bytes':>10} "
+        f"{'llm':>4} {'prompt':>8} {'compl':>6}  result"
+    )
+    for result in results:
+        outcome = result["error"] or result["repo_name"] or "-"
+        print(
+            f"{result['id']:>6} {result['latency']:>8.3f}s {result['github_requests']:>6} "
+            f"{result['not_modified']:>5} {result['bytes']:>10} {result['llm_calls']:>4} "
+            f"{result['prompt_tokens']:>8} {result['completion_tokens']:>6}  {outcome}"
+        )
+    print(
+        f"found {summary['found']}/{summary['queries']}, errors {summary['errors']}, "
+        f"latency mean {summary['latency_mean']:.3f}s p50 {summary['latency_p50']:.3f}s "
+        f"p95 {summary['latency_p95']:.3f}s, {summary['github_requests']} GitHub calls "
+        f"({summary['not_modified']} not modified), {summary['bytes']} bytes, "
+        f"{summary['llm_calls']} LLM calls, {summary['prompt_tokens']} prompt + "
+        f"{summary['completion_tokens']} completion tokens"
+    )
+
+
+def compare(summary, baseline, tolerance=TOLERANCE):
+    """
+    Compare a summary against the summary of a baseline report.
+
+    Args:
+        summary (dict): The summary of the last pass.
+        baseline (dict): The summary of the last pass of the baseline.
+        tolerance (float, optional): The relative change allowed before a metric counts as a regression. Default is TOLERANCE.
+
+    Return:
+        list: The names of the regressed metrics.
+    """
+    regressions = []
+    print("\nComparison with the baseline")
+    for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+        old, new = baseline.get(key), summary.get(key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else (1 if new else 0)
+        worse = change > tolerance if key in LOWER_IS_BETTER else change < -tolerance
+        if worse:
+            regressions.append(key)
+        mark = "REGRESSION" if worse else ""
+        print(f"{key:>18} {old:>12.3f} -> {new:>12.3f} ({change:+.1%}) {mark}")
+    return regressions
+
+
+if __name__ == "__main__":
+    my_parser = argparse.ArgumentParser(description="Benchmark the search phase offline")
+    my_parser.add_argument(
+        "--queries",
+        metavar="queries",
+        type=str,
+        help="the JSON file of the queries",
+        default=queries_file,
+    )
+    my_parser.add_argument(
+        "--ids",
+        metavar="ids",
+        type=str,
+        help="comma-separated ids of the queries to run (default: all)",
+        default=None,
+    )
+    my_parser.add_argument(
+        "--limit",
+        metavar="limit",
+        type=int,
+        help="the maximum number of queries to run",
+        default=None,
+    )
+    my_parser.add_argument(
+        "--fixtures",
+        metavar="fixtures",
+        type=str,
+        help="the JSON file of the recorded GitHub responses",
+        default=fixtures_file,
+    )
+    my_parser.add_argument(
+        "--script",
+        metavar="script",
+        type=str,
+        help="the JSON script of the scripted LLM",
+        default=script_file,
+    )
+    my_parser.add_argument(
+        "--latency",
+        metavar="latency",
+        type=float,
+        help="seconds each mock GitHub response is delayed by",
+        default=0,
+    )
+    my_parser.add_argument(
+        "--passes",
+        metavar="passes",
+        type=int,
+        help="how many times the queries are run; later passes run with warm caches",
+        default=1,
+    )
+    my_parser.add_argument(
+        "--use_cache",
+        action="store_true",
+        help="whether to offer cached repositories to the dispatcher (default: do not use cache)",
+        default=False,
+    )
+    my_parser.add_argument(
+        "--no_batch_judge",
+        action="store_true",
+        help="judge one README per LLM call",
+        default=False,
+    )
+    my_parser.add_argument(
+        "--record",
+        action="store_true",
+        help="run against the live GitHub API and record its responses into the fixtures file",
+        default=False,
+    )
+    my_parser.add_argument(
+        "--output",
+        metavar="output",
+        type=str,
+        help="the JSON file the report is written to",
+        default=None,
+    )
+    my_parser.add_argument(
+        "--compare",
+        metavar="compare",
+        type=str,
+        help="a JSON report to compare against; the exit code is 1 on a regression",
+        default=None,
+    )
+    my_parser.add_argument(
+        "--tolerance",
+        metavar="tolerance",
+        type=float,
+        help="the relative change allowed before a metric counts as a regression",
+        default=TOLERANCE,
+    )
+    my_parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="show the output of the searcher",
+        default=False,
+    )
+    args = my_parser.parse_args()
+
+    queries = load_queries(
+        args.queries, args.ids.split(",") if args.ids else None, args.limit
+    )
+    llm = ScriptedLLM(args.script)
+    searcher_module.gpt4 = llm.gpt4
+    searcher_module.gpt4_functions = llm.gpt4_functions
+    batch_judge_module.gpt4 = llm.gpt4
+
+    workspace = tempfile.mkdtemp(prefix="search_bench_")
+    isolate(workspace)
+    mock = None
+    recorder = None
+    if args.record:
+        recorder = FixtureRecorder(args.fixtures)
+        recorder.install(github, searcher_module)
+    else:
+        mock = MockGithub(args.fixtures, args.latency)
+        github.base_url = mock.start()
+
+    report = {"queries": args.queries, "batch_judge": not args.no_batch_judge, "passes": []}
+    try:
+        for number in range(1, args.passes + 1):
+            results = []
+            for query_id, query in queries:
+                result = run_query(query, llm, args)
+                result["id"] = query_id
+                results.append(result)
+            summary = summarize(results)
+            if mock is not None:
+                summary["mock_misses"] = mock.stats["misses"]
+                mock.reset_stats()
+            print_pass(number, results, summary)
+            report["passes"].append({"results": results, "summary": summary})
+    finally:
+        if mock is not None:
+            mock.stop()
+        if recorder is not None:
+            recorder.save()
+            print(f"Recorded {len(recorder.routes)} routes and {len(recorder.refs)} refs to {args.fixtures}")
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(
+            report["passes"][-1]["summary"],
+            baseline["passes"][-1]["summary"],
+            args.tolerance,
+        )
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
@@ -210,7 +210,7 @@ class Logger:
             self.tool_block_id += 1
             block_id = "tool-" + str(self.tool_block_id)
             self.add_to_queue(
-                "on_agent_action", block_id, action=tag, action_input=message["content"]
+                "on_agent_action", block_id, action=tag, action_input=message.get("content")
             )
             if "function_call" in message.keys():
                 self.add_to_queue(
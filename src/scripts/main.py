@@ -11,8 +11,9 @@ from  functions.functions_main import functions
 from  logger import logger
 from  RepoApplier import RepoApplier
 from  RepoSearcher import RepoSearcher
-from  utils import (GITHUB_TOKEN, LoggerAndPrinter, gpt, gpt4_functions,
-                           print_usage, sys)
+from  utils import (GITHUB_TOKEN, MODES, LoggerAndPrinter, container_pool,
+                           context_compactor, gpt, gpt4_functions, llm_cache,
+                           print_usage, sys, token_budget, user_config)
 
 MAX_RETRIES = 5
 
@@ -236,7 +237,9 @@ You should make sure the result of `apply` function well completed the query. If
                 {"role": "function", "name": func_name, "content": back_content}
             )
             logger.update("main_task", self.messages[-1])
-            func_call = gpt4_functions(self.messages, funcs)
+            func_call = gpt4_functions(
+                context_compactor.compact(self.messages, funcs), funcs
+            )
             self.messages.append(
                 {"role": "assistant", "content": None, "function_call": func_call}
             )
@@ -247,8 +250,7 @@ You should make sure the result of `apply` function well completed the query. If
                 logger.update("result", func_para["result"])
                 print_usage()
                 logger.calculate_cost()
-                self.container.stop()
-                self.container.remove()
+                container_pool.release(self.container)
                 return func_para["result"]
 
             back_content = self.call_func(query, func_name, func_para)
@@ -264,8 +266,7 @@ You should make sure the result of `apply` function well completed the query. If
         print(self.init_query)
         result = self.start_chain(self.init_query, funcs)
         print(result)
-        self.container.stop()
-        self.container.remove()
+        container_pool.release(self.container)
 
 
 def main():
@@ -325,7 +326,25 @@ def main():
         default=False,
     )
 
+    my_parser.add_argument(
+        "--llm_cache",
+        choices=MODES,
+        help="how LLM responses are cached on disk (default: the LLMCache setting of config.json, or off)",
+        default=None,
+    )
+
+    my_parser.add_argument(
+        "--drain_pool",
+        action="store_true",
+        help="remove the warm containers of the container pool and exit",
+        default=False,
+    )
+
     args = my_parser.parse_args()
+    container_pool.configure(user_config.get("ContainerPool", {}))
+    if args.drain_pool:
+        container_pool.drain()
+        return
 
     init_query = args.query
     use_cache = args.use_cache
@@ -333,7 +352,10 @@ def main():
     gpt_temperature = args.temperature
     repo_name = args.name
     gpt.version = gpt4_version
+    token_budget.model = gpt4_version
     gpt.temperature = gpt_temperature
+    if args.llm_cache:
+        llm_cache.mode = args.llm_cache
     logger.init(
         init_query,
         datetime.now().strftime("%m-%d-%H-%M-%S"),
@@ -344,6 +366,8 @@ def main():
         "GA",
     )
 
+    # Containers start while the repository is searched, off the critical path of the setup
+    container_pool.warm_up()
     assistant = OpenAgent(init_query, use_cache)
     assistant.run(functions)
 
@@ -10,7 +10,12 @@ from  functions.functions_modify import functions
 from  logger import logger
 from  utils import (calculate_file_count, dockerwrite,
                            explore_container_directory, gpt4, gpt4_functions,
-                           subdir, sys)
+                           read_container_file, read_whole_container_file,
+                           subdir, sys, token_budget)
+
+FILE_TOKENS = 4000
+# Files larger than this are not read whole to be modified
+MAX_FILE_BYTES = 1024 * 1024
 
 
 class Modifier:
@@ -62,12 +67,9 @@ Modified Function:
             str: JSON-formatted string containing the content of the file or directory,
                  or an error message if the path doesn't exist.
         """
-        if self.container.exec_run(["test", "-f", path]).exit_code == 0:
-            content = {
-                "Content of this file": "'''"
-                + self.container.exec_run(["cat", path]).output.decode("utf-8")
-                + "'''"
-            }
+        file = read_container_file(self.container, path)
+        if file is not None:
+            content = {"Content of this file": "'''" + file.text() + "'''"}
         elif self.container.exec_run(["test", "-d", path]).exit_code == 0:
             file_count = calculate_file_count(self.container, path)
             print(file_count)
@@ -152,11 +154,13 @@ Modified Function:
         Returns:
             str: JSON-formatted string indicating the result of the modification.
         """
-        exit_code, output = self.container.exec_run(["cat", path])
-        if exit_code != 0:
+        original = read_whole_container_file(self.container, path, MAX_FILE_BYTES)
+        if original is None:
             return json.dumps({"Error": f"{path} file doesn't exist."})
+        if original.binary or not original.complete:
+            return json.dumps({"Error": "file too long or binary and can't be modified."})
 
-        file = output.decode("utf-8")
+        file = original.text()
         system_mod = """You are a professional programmer. Given a query to modify a file with the original file, you should give me the complete modified file. Don't modify what is not required to modify. Don't modify or add anything to the original file if you have no reason to do so. Only make modification(s) that you are absolutely sure that it will make sense. Notice that format of the modified file should be the same as the original file.
 
 Your response should be structured as follows:
@@ -168,10 +172,10 @@ The modified file is:
 
         content = "Query: " + message
         if query_file_path is not None:
-            exit_code, query_in_file = self.container.exec_run(["cat", query_file_path])
-            if exit_code != 0:
+            query_in_file = read_container_file(self.container, query_file_path)
+            if query_in_file is None:
                 return json.dumps({"Error": f"File `{query_file_path}` doesn't exist."})
-            content = f"Difference of the pull request you should refer to:'''\n{query_in_file.decode('utf-8')}'''"
+            content = f"Difference of the pull request you should refer to:'''\n{query_in_file.text()}'''"
         if self.issue:
             content += "\nIssue that the query is derived: " + self.issue
         content += "\nOriginal File: \n'''\n" + file + "\n'''"
@@ -191,7 +195,7 @@ The modified file is:
                 "query": message,
                 "file_path": path,
                 "query_file_path": query_file_path,
-                "original_code": output,
+                "original_code": file,
                 "code": code,
             },
         )
@@ -214,10 +218,12 @@ The modified file is:
         Returns:
             str: JSON-formatted string indicating the result of the modification.
         """
-        exit_code, output = self.container.exec_run(["cat", path])
-        if exit_code != 0:
+        original = read_whole_container_file(self.container, path, MAX_FILE_BYTES)
+        if original is None:
             return json.dumps({"Error": "Such file doesn't exist."})
-        file = output.decode("utf-8")
+        if original.binary or not original.complete:
+            return json.dumps({"Error": "file too long or binary and can't be modified."})
+        file = original.text()
         content = (
             "Request: "
             + query
@@ -370,10 +376,12 @@ The modified file is:
             str: JSON-formatted string indicating the result of the modification.
         """
         self.issue = issue
-        exit_code, output = self.container.exec_run(["cat", path])
-        if exit_code != 0:
+        original = read_whole_container_file(self.container, path, MAX_FILE_BYTES)
+        if original is None:
             return json.dumps({"Error": "Such file doesn't exist."})
-        file = output.decode("utf-8")
-        if len(file) >= 16000:
+        if original.binary or not original.complete:
+            return json.dumps({"Error": "file too long and can't be modified."})
+        file = original.text()
+        if token_budget.count(file) >= FILE_TOKENS:
             return json.dumps({"Error": "file too long and can't be modified."})
         return self.start_chain(message, file, functions, path)
\ No newline at end of file
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+
+class BackgroundLoop:
+    """
+    This class runs one asyncio event loop on a daemon thread, shared by the whole process.
+
+    Synchronous code, from any thread, hands coroutines to the loop with `run` and waits for their
+    result, so coroutines from different threads run concurrently on the same loop and share its
+    clients, semaphores and rate limits.
+    """
+
+    def __init__(self):
+        """
+        Initialize the BackgroundLoop. The loop is started on first use.
+        """
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the loop thread if it is not running yet.
+
+        Return:
+            asyncio.AbstractEventLoop: The loop.
+        """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(
+                    target=self.serve, name="BackgroundLoop", daemon=True
+                )
+                self.thread.start()
+            return self.loop
+
+    def serve(self):
+        """
+        Run the loop forever. This is the target of the loop thread.
+        """
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        """
+        Schedule a coroutine on the loop without waiting for it.
+
+        Args:
+            coroutine (coroutine): The coroutine to run.
+
+        Return:
+            concurrent.futures.Future: The future of the result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start())
+
+    def run(self, coroutine, timeout=None):
+        """
+        Run a coroutine on the loop and wait for its result.
+
+        Args:
+            coroutine (coroutine): The coroutine to run.
+            timeout (float, optional): Seconds to wait for the result. Default is None, no limit.
+
+        Return:
+            The result of the coroutine.
+        """
+        self.start()
+        if threading.current_thread() is self.thread:
+            coroutine.close()
+            raise RuntimeError(
+                "A blocking call was made on the background loop; await the async variant instead."
+            )
+        return self.submit(coroutine).result(timeout)
+
+
+background_loop = BackgroundLoop()
@@ -0,0 +1,165 @@
+import re
+
+from  utils.OpenaiAPI import gpt4
+from  utils.TokenBudget import token_budget
+
+BATCH_JUDGE = True
+BATCH_TOKEN_BUDGET = 12000
+ITEM_TOKEN_LIMIT = 2000
+# A line that starts the answer for a candidate: "### Candidate 1", "**Candidate 1:**", or
+# "Candidate 1: <answer>" with the answer on the same line
+CANDIDATE_HEADER = r"^[ \t]*[#*_]*[ \t]*Candidate[ \t]+(\d+)[ \t]*(?:[*_]*[ \t]*:[*_]*|[*_]*[ \t]*$)"
+
+batch_instruction = """
+
+You will be given several candidates at once. Each candidate starts with a line `### Candidate <number>`. Judge every candidate independently of the others, as if it were the only one you were given.
+
+Answer for every candidate, in the order they are given. Start the answer for each candidate with the same `### Candidate <number>` line, followed by your answer for that candidate in the format described above."""
+
+
+def estimate_tokens(text):
+    """
+    Count the tokens of a text for the active model.
+
+    Args:
+        text (str): The text.
+
+    Return:
+        int: The number of tokens.
+    """
+    return token_budget.count(text)
+
+
+def trim_item(text, item_limit=ITEM_TOKEN_LIMIT):
+    """
+    Trim a candidate so that it fits in its share of a batch.
+
+    Args:
+        text (str): The candidate text.
+        item_limit (int, optional): The maximum number of tokens of the candidate. Default is ITEM_TOKEN_LIMIT.
+
+    Return:
+        str: The trimmed text.
+    """
+    return token_budget.truncate(text, item_limit)
+
+
+def pack_batches(texts, budget=BATCH_TOKEN_BUDGET, item_limit=ITEM_TOKEN_LIMIT):
+    """
+    Split trimmed candidates into consecutive batches whose estimated size fits a token budget.
+
+    The candidates are read as the batches are packed, so a batch is yielded as soon as the next
+    candidate does not fit in it, and the later candidates are only read if iteration goes on.
+
+    Args:
+        texts (iterable): The candidate texts, in the order they should be judged.
+        budget (int, optional): The maximum number of tokens of the candidates of one batch. Default is BATCH_TOKEN_BUDGET.
+        item_limit (int, optional): The maximum number of tokens of a single candidate. Default is ITEM_TOKEN_LIMIT.
+
+    Yields:
+        list: A batch, as a list of (index, trimmed text) tuples.
+    """
+    batch = []
+    used = 0
+    for index, text in enumerate(texts):
+        text = trim_item(text, item_limit)
+        cost = estimate_tokens(text)
+        if batch and used + cost > budget:
+            yield batch
+            batch = []
+            used = 0
+        batch.append((index, text))
+        used += cost
+    if batch:
+        yield batch
+
+
+def split_answers(response, count):
+    """
+    Split the answer to a batch into the answers for each candidate.
+
+    Args:
+        response (str): The answer of the LLM.
+        count (int): The number of candidates in the batch.
+
+    Return:
+        list: The answer for each candidate, None where the LLM gave none.
+    """
+    answers = [None] * count
+    parts = re.split(CANDIDATE_HEADER, response, flags=re.MULTILINE)
+    for number, answer in zip(parts[1::2], parts[2::2]):
+        number = int(number)
+        if 1 <= number <= count and answers[number - 1] is None:
+            answers[number - 1] = answer.strip()
+    return answers
+
+
+def judge_batch(system, preamble, texts, site):
+    """
+    Judge several candidates with a single LLM call.
+
+    The system prompt of the single-candidate judge is reused, so each answer can be parsed exactly
+    like the answer of the single-candidate judge.
+
+    Args:
+        system (str): The system prompt of the single-candidate judge.
+        preamble (str): The context shared by all candidates, e.g. the query.
+        texts (list): The candidate texts, already trimmed.
+        site (str): The call site of the judge, e.g. "issue_judge", which picks the model (see `ModelRouter`).
+
+    Return:
+        list: The answer for each candidate, None where the LLM gave none.
+    """
+    content = preamble
+    for number, text in enumerate(texts, 1):
+        content += f"\n\n### Candidate {number}\n{text}"
+    messages = [
+        {"role": "system", "content": system + batch_instruction},
+        {"role": "user", "content": content},
+    ]
+    response = gpt4(messages, site=site)
+    return split_answers(response, len(texts))
+
+
+def judge_each(system, preamble, texts, site, parse, judge_one, log, prefix=""):
+    """
+    Judge candidates several per LLM call, and yield the verdict for each, in order.
+
+    Candidates are read from `texts` as the batches are packed, and a batch is only sent once its
+    first verdict is asked for, so a suitable candidate in an early batch saves both the LLM calls
+    and the reading of the later candidates. A candidate the answer to its batch leaves out, e.g.
+    because the LLM wrote the headers in another format, is judged on its own instead.
+
+    Args:
+        system (str): The system prompt of the single-candidate judge.
+        preamble (str): The context shared by all candidates, e.g. the problem.
+        texts (iterable): The candidate texts.
+        site (str): The call site of the judge, which picks the model (see `ModelRouter`).
+        parse (callable): Turns the answer for a candidate into its verdict.
+        judge_one (callable): Judges a single candidate text and returns its verdict.
+        log (callable): Records a candidate text with the answer for it.
+        prefix (str, optional): Put before each candidate text in the batch, e.g. "Issue: ". Default is "".
+
+    Yields:
+        tuple: The candidate text and its verdict, (False, None) if the answer can't be parsed.
+    """
+    contents = []
+
+    def read():
+        for text in texts:
+            contents.append(text)
+            yield text
+
+    for batch in pack_batches(read()):
+        answers = judge_batch(system, preamble, [prefix + text for _, text in batch], site)
+        for (index, _), answer in zip(batch, answers):
+            text = contents[index]
+            try:
+                if answer is None:
+                    verdict = judge_one(text)
+                else:
+                    log(text, answer)
+                    verdict = parse(answer)
+            except (IndexError, TypeError):
+                verdict = (False, None)
+            yield text, verdict
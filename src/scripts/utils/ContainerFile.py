@@ -0,0 +1,204 @@
+import os
+import tarfile
+
+import docker
+
+from  utils.ContainerTree import ChunkReader
+
+HEAD_BYTES = 16 * 1024
+TAIL_BYTES = 16 * 1024
+SNIFF_BYTES = 4096
+# Largest file read whole when a caller needs all of it, e.g. to rewrite it or to unpickle it
+MAX_FULL_BYTES = 64 * 1024 * 1024
+DIRECTORY_MODE = 1 << 31
+SYMLINK_MODE = 1 << 27
+
+
+def is_binary(prefix):
+    """
+    Tell binary data from text by its first bytes.
+
+    Args:
+        prefix (bytes): The first bytes of the file.
+
+    Return:
+        bool: True if the data contains a NUL byte or is not UTF-8.
+    """
+    if b"\0" in prefix:
+        return True
+    try:
+        prefix.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the end of the prefix is still text
+        return e.start < len(prefix) - 3
+    return False
+
+
+class ContainerFile:
+    """
+    This class holds what was read of a file inside a container: its size, whether it is binary, and
+    either all of its bytes or only its head and tail.
+    """
+
+    def __init__(self, path, size, head, tail=b""):
+        """
+        Initialize the ContainerFile.
+
+        Args:
+            path (str): The path of the file in the container.
+            size (int): The size of the file in bytes.
+            head (bytes): The first bytes of the file, all of them if the file was read whole.
+            tail (bytes, optional): The last bytes of the file if it was not read whole. Default is b"".
+        """
+        self.path = path
+        self.size = size
+        self.head = head
+        self.tail = tail
+        self.complete = len(head) >= size
+        self.binary = is_binary(head[:SNIFF_BYTES])
+
+    @property
+    def data(self):
+        """
+        The bytes of the file, or None if it was not read whole.
+        """
+        return self.head if self.complete else None
+
+    def text(self):
+        """
+        Decode the file, with a note of the bytes left out between the head and the tail.
+
+        Return:
+            str: The text.
+        """
+        if self.complete:
+            return self.head.decode("utf-8", errors="replace")
+        omitted = self.size - len(self.head) - len(self.tail)
+        return (
+            self.head.decode("utf-8", errors="ignore")
+            + f"\n...({omitted} bytes of {self.size} omitted)...\n"
+            + self.tail.decode("utf-8", errors="ignore")
+        )
+
+
+def read_tail(container, path, tail_bytes):
+    """
+    Read the last bytes of a file inside a container.
+
+    Args:
+        container (docker.Container): The container.
+        path (str): The path of the file.
+        tail_bytes (int): The number of bytes.
+
+    Return:
+        bytes: The bytes, or b"" if they could not be read.
+    """
+    exit_code, output = container.exec_run(["tail", "-c", str(tail_bytes), path])
+    if exit_code != 0 or not isinstance(output, bytes):
+        return b""
+    return output
+
+
+def open_container_file(container, path):
+    """
+    Open the `get_archive` stream of a file inside a container, following symbolic links.
+
+    Args:
+        container (docker.Container): The container.
+        path (str): The path of the file.
+
+    Return:
+        tuple: The path of the file, the stream, not read yet, and the size of the file from the
+               archive header, or None if the path does not exist or is a directory.
+    """
+    for _ in range(8):
+        try:
+            stream, stat = container.get_archive(path)
+        except docker.errors.NotFound:
+            return None
+        if stat.get("mode", 0) & SYMLINK_MODE and stat.get("linkTarget"):
+            path = os.path.join(os.path.dirname(path), stat["linkTarget"])
+            stream.close()
+            continue
+        break
+    else:
+        return None
+    if stat.get("mode", 0) & DIRECTORY_MODE:
+        stream.close()
+        return None
+    return path, stream, stat.get("size", 0)
+
+
+def read_stream(stream, size):
+    """
+    Read the first bytes of the file of a `get_archive` stream, then close the stream.
+
+    Args:
+        stream (generator): The stream.
+        size (int): The number of bytes.
+
+    Return:
+        bytes: The bytes.
+    """
+    try:
+        with tarfile.open(fileobj=ChunkReader(stream), mode="r|") as archive:
+            member = archive.next()
+            reader = archive.extractfile(member) if member is not None else None
+            return reader.read(size) if reader else b""
+    finally:
+        stream.close()
+
+
+def read_container_file(
+    container, path, head_bytes=HEAD_BYTES, tail_bytes=TAIL_BYTES, whole_bytes=0
+):
+    """
+    Read a file inside a container through one `get_archive` stream, without transferring more than needed.
+
+    Files up to `head_bytes + tail_bytes`, or up to `whole_bytes` if it is larger, are read whole. Of
+    larger files only the first `head_bytes` are read from the stream, which is then closed, and the
+    last `tail_bytes` are read with `tail -c`. Symbolic links are followed.
+
+    Args:
+        container (docker.Container): The container.
+        path (str): The path of the file.
+        head_bytes (int, optional): The number of bytes read from the beginning. Default is HEAD_BYTES.
+        tail_bytes (int, optional): The number of bytes read from the end. Default is TAIL_BYTES.
+        whole_bytes (int, optional): The largest size read whole, e.g. for a file to unpickle. Default is 0.
+
+    Return:
+        ContainerFile: The file, or None if the path does not exist or is a directory.
+    """
+    opened = open_container_file(container, path)
+    if opened is None:
+        return None
+    path, stream, size = opened
+    if size <= max(whole_bytes, head_bytes + tail_bytes):
+        return ContainerFile(path, size, read_stream(stream, size))
+    head = read_stream(stream, head_bytes)
+    return ContainerFile(path, size, head, read_tail(container, path, tail_bytes))
+
+
+def read_whole_container_file(container, path, max_bytes=MAX_FULL_BYTES):
+    """
+    Read all of a file inside a container, if it is not too large.
+
+    The size is taken from the archive header, so nothing is read of a file larger than `max_bytes`.
+
+    Args:
+        container (docker.Container): The container.
+        path (str): The path of the file.
+        max_bytes (int, optional): The largest size read. Default is MAX_FULL_BYTES.
+
+    Return:
+        ContainerFile: The file, complete unless it is larger than `max_bytes`, in which case it holds
+                       no bytes, or None if the path does not exist or is a directory.
+    """
+    opened = open_container_file(container, path)
+    if opened is None:
+        return None
+    path, stream, size = opened
+    if size > max_bytes:
+        stream.close()
+        return ContainerFile(path, size, b"")
+    return ContainerFile(path, size, read_stream(stream, size))
@@ -0,0 +1,416 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import docker
+
+from  utils.EnhancedContianer import EnhancedContainer
+
+BASE_IMAGE = "condaimage"
+POOL_SIZE = 1
+IMAGE_POOL_SIZE = 1
+MAX_WARM_IMAGES = 2
+# A cached repository image is kept warm once it has been used this many times
+WARM_AFTER_USES = 2
+# Seconds a warm container is kept when no run claims it
+POOL_TTL = 6 * 3600
+LABEL = "openact.pool.image"
+CREATED_LABEL = "openact.pool.created"
+WARM_PREFIX = "openact-warm-"
+BUSY_PREFIX = "openact-busy-"
+LOCK_FILE = "container_pool.lock"
+USAGE_FILE = "container_pool.json"
+CONTAINER_OPTIONS = {
+    "tty": True,
+    "stdin_open": True,
+    "command": "/bin/sh",
+    "network_mode": "host",
+}
+
+
+class ContainerPool:
+    """
+    This class keeps containers started ahead of time, so that setting up a repository does not wait
+    for one to be created and started.
+
+    The pool is kept by Docker itself: warm containers are named with WARM_PREFIX and labeled with
+    their image, so the runs of the host share them and a run leaves warm containers for the next
+    query of a queue. Containers are created and started with BUSY_PREFIX, and only renamed into the
+    pool, or claimed out of it, under a file lock. Used containers are destroyed in the background,
+    and warm containers no run claimed within `ttl` seconds are destroyed by the next refill (or all
+    at once with `main.py --drain_pool`). `size` containers of the base image are kept warm,
+    and `image_size` of each of the `max_images` most used repository images (those named in `images`
+    first), which are counted in USAGE_FILE.
+    """
+
+    def __init__(
+        self,
+        base_image=BASE_IMAGE,
+        size=POOL_SIZE,
+        image_size=IMAGE_POOL_SIZE,
+        max_images=MAX_WARM_IMAGES,
+        images=None,
+        ttl=POOL_TTL,
+    ):
+        """
+        Initialize the ContainerPool.
+
+        Args:
+            base_image (str, optional): The image repositories are set up in. Default is BASE_IMAGE.
+            size (int, optional): The number of warm containers of the base image. Default is POOL_SIZE.
+            image_size (int, optional): The number of warm containers of each popular repository image. Default is IMAGE_POOL_SIZE.
+            max_images (int, optional): The number of repository images kept warm. Default is MAX_WARM_IMAGES.
+            images (list, optional): Repository images kept warm whatever their use. Default is None.
+            ttl (int, optional): Seconds a warm container is kept when no run claims it. Default is POOL_TTL.
+        """
+        self.base_image = base_image
+        self.size = size
+        self.image_size = image_size
+        self.max_images = max_images
+        self.images = list(images or [])
+        self.ttl = ttl
+        self.client = None
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="container-pool")
+        self.refilling = set()
+        self.lock = threading.Lock()
+        self.stats = {"warm": 0, "cold": 0, "created": 0, "destroyed": 0}
+
+    def configure(self, settings):
+        """
+        Apply the `ContainerPool` settings of config.json.
+
+        Args:
+            settings (dict): Any of `size`, `image_size`, `max_images`, `images` and `ttl`.
+        """
+        self.size = settings.get("size", self.size)
+        self.image_size = settings.get("image_size", self.image_size)
+        self.max_images = settings.get("max_images", self.max_images)
+        self.images = list(settings.get("images", self.images))
+        self.ttl = settings.get("ttl", self.ttl)
+
+    def count(self, stat):
+        """
+        Count an event of the pool in `stats`.
+
+        Args:
+            stat (str): The event, e.g. "created".
+        """
+        with self.lock:
+            self.stats[stat] += 1
+
+    def docker(self):
+        """
+        Get the Docker client of the pool, created on first use.
+
+        Return:
+            docker.DockerClient: The client.
+        """
+        if self.client is None:
+            self.client = docker.from_env()
+        return self.client
+
+    @contextmanager
+    def locked(self):
+        """
+        Hold the file lock that runs on the host share to move containers into and out of the pool.
+        """
+        with open(LOCK_FILE, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def warm_containers(self, image=None):
+        """
+        List the warm containers of an image.
+
+        Args:
+            image (str, optional): The image. Default is None, every image.
+
+        Return:
+            list: The running containers not claimed yet.
+        """
+        label = LABEL if image is None else f"{LABEL}={image}"
+        containers = self.docker().containers.list(
+            filters={"label": label, "name": WARM_PREFIX, "status": "running"}
+        )
+        return [container for container in containers if container.name.startswith(WARM_PREFIX)]
+
+    def create(self, image):
+        """
+        Create and start a container, named with BUSY_PREFIX so that no run claims it before it is started.
+
+        Args:
+            image (str): The image.
+
+        Return:
+            docker.Container: The started container.
+        """
+        name = BUSY_PREFIX + uuid.uuid4().hex[:12]
+        container = self.docker().containers.create(
+            image,
+            name=name,
+            labels={LABEL: image, CREATED_LABEL: str(int(time.time()))},
+            **CONTAINER_OPTIONS,
+        )
+        container.start()
+        self.count("created")
+        return container
+
+    def is_current(self, container, image):
+        """
+        Check that a container runs the image its tag points to now, as a repository image is committed again after each setup.
+
+        Args:
+            container (docker.Container): The container.
+            image (str): The image tag.
+
+        Return:
+            bool: Whether the container is up to date.
+        """
+        try:
+            return container.attrs["Image"] == self.docker().images.get(image).id
+        except docker.errors.ImageNotFound:
+            return False
+
+    def withdraw(self, containers):
+        """
+        Take warm containers out of the pool, so that no run claims them while they are removed.
+
+        Args:
+            containers (list): The warm containers.
+
+        Return:
+            list: The containers taken, leaving out those another run claimed first.
+        """
+        withdrawn = []
+        with self.locked():
+            for container in containers:
+                try:
+                    container.rename(BUSY_PREFIX + uuid.uuid4().hex[:12])
+                except docker.errors.APIError:
+                    continue
+                withdrawn.append(container)
+        return withdrawn
+
+    def claim(self, image):
+        """
+        Take a warm container of an image out of the pool.
+
+        Args:
+            image (str): The image.
+
+        Return:
+            docker.Container: The container, or None if the pool has none.
+        """
+        with self.locked():
+            for container in self.warm_containers(image):
+                try:
+                    container.rename(BUSY_PREFIX + uuid.uuid4().hex[:12])
+                except docker.errors.APIError:
+                    continue
+                if self.is_current(container, image):
+                    return container
+                self.release(container)
+        return None
+
+    def acquire(self, image=None):
+        """
+        Get a started container, from the pool if it has one, and refill the pool in the background.
+
+        Args:
+            image (str, optional): The image. Default is None, the base image.
+
+        Return:
+            EnhancedContainer: The container, to be given back with `release`.
+        """
+        image = image or self.base_image
+        try:
+            container = self.claim(image)
+        except Exception as e:
+            print(f"Failed to claim a warm container: {e}")
+            container = None
+        if container is None:
+            self.count("cold")
+            container = self.create(image)
+        else:
+            self.count("warm")
+        if image != self.base_image:
+            self.record(image)
+        self.refill_later(image)
+        return EnhancedContainer(container, self.docker())
+
+    def release(self, container):
+        """
+        Give back a container, which is destroyed in the background.
+
+        Args:
+            container (docker.Container): The container.
+        """
+        if container is None:
+            return
+        try:
+            self.executor.submit(self.destroy, container)
+        except RuntimeError:
+            # The executor is shut down, e.g. at interpreter exit
+            self.destroy(container)
+
+    def destroy(self, container):
+        """
+        Stop and remove a container.
+
+        Args:
+            container (docker.Container): The container.
+        """
+        try:
+            container.remove(force=True)
+            self.count("destroyed")
+        except docker.errors.NotFound:
+            pass
+        except Exception as e:
+            print(f"Failed to remove container {container.id}: {e}")
+
+    def discard(self, image):
+        """
+        Destroy the warm containers of an image in the background, e.g. because it was committed
+        again, and start ones of the new image in their place.
+
+        Args:
+            image (str): The image.
+        """
+        for container in self.withdraw(self.warm_containers(image)):
+            self.release(container)
+        self.refill_later(image)
+
+    def drain(self):
+        """
+        Destroy all the warm containers of the host.
+        """
+        containers = self.docker().containers.list(
+            all=True, filters={"label": LABEL, "name": WARM_PREFIX}
+        )
+        for container in self.withdraw(containers):
+            self.destroy(container)
+
+    def expire(self, image=None):
+        """
+        Destroy the warm containers no run claimed within `ttl` seconds.
+
+        Args:
+            image (str, optional): The image. Default is None, every image.
+        """
+        deadline = time.time() - self.ttl
+        try:
+            expired = [
+                container
+                for container in self.warm_containers(image)
+                if int(container.labels.get(CREATED_LABEL, 0)) < deadline
+            ]
+            for container in self.withdraw(expired):
+                self.destroy(container)
+        except Exception as e:
+            print(f"Failed to remove expired warm containers: {e}")
+
+    def read_usage(self):
+        """
+        Read how many times each repository image was used.
+
+        Return:
+            dict: The number of uses by image.
+        """
+        if not os.path.exists(USAGE_FILE):
+            return {}
+        try:
+            with open(USAGE_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, image):
+        """
+        Count a use of a repository image.
+
+        Args:
+            image (str): The image.
+        """
+        with self.locked():
+            usage = self.read_usage()
+            usage[image] = usage.get(image, 0) + 1
+            with open(USAGE_FILE, "w") as f:
+                json.dump(usage, f, indent=4)
+
+    def targets(self):
+        """
+        Get how many warm containers each image should have.
+
+        Return:
+            dict: The number of warm containers by image.
+        """
+        targets = {self.base_image: self.size}
+        usage = self.read_usage()
+        popular = sorted(
+            (image for image, uses in usage.items() if uses >= WARM_AFTER_USES),
+            key=lambda image: -usage[image],
+        )
+        for image in (self.images + popular)[: self.max_images]:
+            targets.setdefault(image, self.image_size)
+        return targets
+
+    def refill(self, image):
+        """
+        Start warm containers of an image until it has as many as it should.
+
+        Args:
+            image (str): The image.
+        """
+        try:
+            self.expire(image)
+            target = self.targets().get(image, 0)
+            for _ in range(target - len(self.warm_containers(image))):
+                container = self.create(image)
+                # Only the hand-over to the pool is locked, as other runs may have refilled it meanwhile
+                with self.locked():
+                    joined = len(self.warm_containers(image)) < target
+                    if joined:
+                        container.rename(WARM_PREFIX + uuid.uuid4().hex[:12])
+                if not joined:
+                    self.destroy(container)
+                    break
+        except docker.errors.ImageNotFound:
+            print(f"Image {image} is not found and can't be kept warm.")
+        except Exception as e:
+            print(f"Failed to refill the container pool: {e}")
+        finally:
+            with self.lock:
+                self.refilling.discard(image)
+
+    def refill_later(self, image):
+        """
+        Refill the warm containers of an image in the background, unless it is already being done.
+
+        Args:
+            image (str): The image.
+        """
+        with self.lock:
+            if image in self.refilling:
+                return
+            self.refilling.add(image)
+        self.executor.submit(self.refill, image)
+
+    def warm_up(self):
+        """
+        Destroy the expired warm containers and fill the pool in the background, e.g. while the
+        repository is being searched.
+        """
+        self.executor.submit(self.expire)
+        for image in self.targets():
+            self.refill_later(image)
+
+
+container_pool = ContainerPool()
@@ -0,0 +1,180 @@
+import os
+import shlex
+import tarfile
+
+MAX_SNAPSHOT_ENTRIES = 20000
+NOT_A_DIRECTORY = 3
+# One line per entry: the type with symlinks followed, the size and the path relative to the root
+FIND_FORMAT = "%Y\\t%s\\t%P\\n"
+
+
+class TreeSnapshot:
+    """
+    This class is the listing of a directory inside a container, taken at once.
+
+    Entries are (relative path, type, size) tuples, where the type is "f" for a file, "d" for a
+    directory and another `find -printf %Y` letter otherwise. The snapshot knows whether it was cut at
+    its entry limit, so callers can tell a small tree from the first part of a large one.
+    """
+
+    def __init__(self, root, entries, truncated=False):
+        """
+        Initialize the TreeSnapshot.
+
+        Args:
+            root (str): The directory, as given by the caller.
+            entries (list): The (relative path, type, size) tuples.
+            truncated (bool, optional): Whether entries were left out because of the entry limit. Default is False.
+        """
+        self.root = root
+        self.entries = sorted(entries, key=lambda entry: entry[0].split("/"))
+        self.truncated = truncated
+
+    def file_count(self):
+        """
+        Count the files of the tree.
+
+        Return:
+            int: The number of files, a lower bound if the snapshot is truncated.
+        """
+        return sum(1 for _, kind, _ in self.entries if kind == "f")
+
+    def nested(self, max_depth=None):
+        """
+        Build the nested form of the tree that `explore_container_directory` returns.
+
+        Args:
+            max_depth (int, optional): The deepest level included, 1 for the direct children. Default is None, no limit.
+
+        Return:
+            dict: Full paths of the direct children mapped to 0 for a file or to the same form of a directory.
+        """
+        tree = {}
+        directories = {"": tree}
+        for path, kind, _ in self.entries:
+            depth = path.count("/") + 1
+            if max_depth is not None and depth > max_depth:
+                continue
+            parent = directories.get(os.path.dirname(path))
+            if parent is None:
+                continue
+            full_path = os.path.join(self.root, path)
+            if kind == "d":
+                parent[full_path] = {}
+                directories[path] = parent[full_path]
+            elif kind == "f":
+                parent[full_path] = 0
+        return tree
+
+
+class ChunkReader:
+    """
+    This class turns the chunk iterator of a Docker stream into a file object `tarfile` can read.
+    """
+
+    def __init__(self, chunks):
+        """
+        Initialize the ChunkReader.
+
+        Args:
+            chunks (iterator): The byte chunks.
+        """
+        self.chunks = iter(chunks)
+        self.buffer = b""
+        self.offset = 0
+
+    def read(self, size=-1):
+        """
+        Read bytes from the stream.
+
+        Args:
+            size (int, optional): The number of bytes to read. Default is -1, all of them.
+
+        Return:
+            bytes: The bytes read, fewer than `size` only at the end of the stream.
+        """
+        while size < 0 or len(self.buffer) - self.offset < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer = self.buffer[self.offset:] + chunk
+            self.offset = 0
+        if size < 0:
+            size = len(self.buffer) - self.offset
+        data = self.buffer[self.offset : self.offset + size]
+        self.offset += len(data)
+        return data
+
+
+def snapshot_from_archive(container, directory, max_depth=None, max_entries=MAX_SNAPSHOT_ENTRIES):
+    """
+    Take a snapshot from the tar stream of `get_archive`, for images whose `find` has no `-printf`.
+
+    Args:
+        container (docker.Container): The container.
+        directory (str): The directory.
+        max_depth (int, optional): The deepest level listed. Default is None, no limit.
+        max_entries (int, optional): The maximum number of entries listed. Default is MAX_SNAPSHOT_ENTRIES.
+
+    Return:
+        TreeSnapshot: The snapshot, or None if the directory does not exist.
+    """
+    try:
+        stream, _ = container.get_archive(directory)
+    except Exception:
+        return None
+    reader = ChunkReader(stream)
+    entries = []
+    truncated = False
+    with tarfile.open(fileobj=reader, mode="r|") as archive:
+        for member in archive:
+            # Members are named after the last component of the directory
+            parts = member.name.split("/", 1)
+            if len(parts) < 2 or not parts[1]:
+                continue
+            path = parts[1]
+            if max_depth is not None and path.count("/") + 1 > max_depth:
+                continue
+            if len(entries) >= max_entries:
+                truncated = True
+                break
+            kind = "d" if member.isdir() else "f" if member.isfile() else "l"
+            entries.append((path, kind, member.size))
+    return TreeSnapshot(directory, entries, truncated)
+
+
+def snapshot_tree(container, directory, max_depth=None, max_entries=MAX_SNAPSHOT_ENTRIES):
+    """
+    List a directory of a container recursively, with types and sizes, in a single exec.
+
+    Args:
+        container (docker.Container): The container.
+        directory (str): The directory.
+        max_depth (int, optional): The deepest level listed, 1 for the direct children. Default is None, no limit.
+        max_entries (int, optional): The maximum number of entries listed. Default is MAX_SNAPSHOT_ENTRIES.
+
+    Return:
+        TreeSnapshot: The snapshot, or None if the directory does not exist.
+    """
+    depth = f" -maxdepth {int(max_depth)}" if max_depth is not None else ""
+    script = (
+        f"[ -d {shlex.quote(directory)} ] || exit {NOT_A_DIRECTORY}; "
+        f"find {shlex.quote(directory)} -mindepth 1{depth} -printf '{FIND_FORMAT}' "
+        f"| head -n {int(max_entries) + 1}"
+    )
+    exit_code, output = container.exec_run(["sh", "-c", script], demux=True)
+    if exit_code == NOT_A_DIRECTORY:
+        return None
+    stdout, stderr = output if isinstance(output, tuple) else (output, None)
+    stdout = (stdout or b"").decode("utf-8", errors="replace")
+    if not stdout and stderr and b"printf" in stderr:
+        return snapshot_from_archive(container, directory, max_depth, max_entries)
+    entries = []
+    for line in stdout.split("\n"):
+        fields = line.split("\t", 2)
+        if len(fields) != 3 or not fields[2]:
+            continue
+        kind, size, path = fields
+        entries.append((path, kind, int(size) if size.isdigit() else 0))
+    truncated = len(entries) > max_entries
+    return TreeSnapshot(directory, entries[:max_entries], truncated)
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import threading
+
+from  utils.TokenBudget import token_budget
+
+KEEP_TURNS = 4
+CONTEXT_TOKENS = 12000
+DIGEST_TOKENS = 60
+ARGUMENT_TOKENS = 200
+PINNED_ROLES = ("system", "user")
+
+
+class ContextCompactor:
+    """
+    This class keeps the prompt of a long function-calling loop bounded.
+
+    The transcript itself is never changed: `compact` returns the list of messages to send. The
+    system prompt and the first user message (the query and the README) are pinned and always sent
+    verbatim, as are the last `keep_turns` turns. Older function results shrink to one-line digests
+    and long arguments of older function calls are cut, so every turn costs a few dozen tokens once it
+    is out of the recent window. Digests are computed once per message and reused on every later turn.
+    If the prompt is still larger than `max_tokens`, the oldest digested turns are dropped.
+    """
+
+    def __init__(
+        self,
+        keep_turns=KEEP_TURNS,
+        max_tokens=CONTEXT_TOKENS,
+        digest_tokens=DIGEST_TOKENS,
+        argument_tokens=ARGUMENT_TOKENS,
+    ):
+        """
+        Initialize the ContextCompactor.
+
+        Args:
+            keep_turns (int, optional): The number of recent turns sent verbatim. Default is KEEP_TURNS.
+            max_tokens (int, optional): The prompt size above which old turns are dropped. Default is CONTEXT_TOKENS.
+            digest_tokens (int, optional): The maximum number of tokens of a digest. Default is DIGEST_TOKENS.
+            argument_tokens (int, optional): The maximum number of tokens of an argument of an old function call. Default is ARGUMENT_TOKENS.
+        """
+        self.keep_turns = keep_turns
+        self.max_tokens = max_tokens
+        self.digest_tokens = digest_tokens
+        self.argument_tokens = argument_tokens
+        self.digests = {}
+        self.lock = threading.Lock()
+        self.stats = {"computed": 0, "reused": 0, "dropped": 0}
+
+    def key(self, message):
+        """
+        Get the cache key of a message.
+
+        Args:
+            message (dict): The message.
+
+        Return:
+            str: The hash of the message.
+        """
+        text = json.dumps(message, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def summarize_result(self, message):
+        """
+        Write the one-line digest of a function result.
+
+        Args:
+            message (dict): The function message.
+
+        Return:
+            str: The digest.
+        """
+        content = message.get("content") or ""
+        try:
+            fields = json.loads(content)
+        except (TypeError, ValueError):
+            fields = content
+        if not isinstance(fields, dict):
+            fields = {"Output": fields}
+        parts = []
+        for name, value in fields.items():
+            if not isinstance(value, str):
+                value = json.dumps(value, ensure_ascii=False)
+            lines = [line.strip() for line in value.splitlines() if line.strip()]
+            parts.append(f"{name}: {lines[0] if lines else ''}")
+        digest = token_budget.truncate("; ".join(parts), self.digest_tokens)
+        tokens = token_budget.count(content)
+        return f"[Digest of an earlier {message.get('name', 'function')} result of {tokens} tokens] {digest}"
+
+    def shorten_call(self, message):
+        """
+        Cut the long arguments of a function call, keeping them valid JSON.
+
+        Args:
+            message (dict): The assistant message with the function call.
+
+        Return:
+            dict: The shortened function call.
+        """
+        func_call = message["function_call"]
+        try:
+            arguments = json.loads(func_call["arguments"])
+        except (TypeError, ValueError):
+            return dict(
+                func_call,
+                arguments=token_budget.truncate_middle(
+                    str(func_call["arguments"]), self.argument_tokens, marker="..."
+                ),
+            )
+        if isinstance(arguments, dict):
+            for name, value in arguments.items():
+                if isinstance(value, str):
+                    arguments[name] = token_budget.truncate_middle(
+                        value, self.argument_tokens, marker="\n...\n"
+                    )
+        return dict(func_call, arguments=json.dumps(arguments, ensure_ascii=False))
+
+    def digest(self, message):
+        """
+        Get the compacted form of an old message, computing it on first use.
+
+        Args:
+            message (dict): A function result or an assistant message with a function call.
+
+        Return:
+            dict: The compacted message.
+        """
+        key = self.key(message)
+        with self.lock:
+            if key in self.digests:
+                self.stats["reused"] += 1
+                return self.digests[key]
+        if message["role"] == "function":
+            compacted = dict(message, content=self.summarize_result(message))
+        elif message.get("function_call"):
+            compacted = dict(message, function_call=self.shorten_call(message))
+        else:
+            compacted = dict(
+                message,
+                content=token_budget.truncate(
+                    message.get("content") or "", self.digest_tokens
+                ),
+            )
+        with self.lock:
+            self.digests[key] = compacted
+            self.stats["computed"] += 1
+        return compacted
+
+    def split(self, messages):
+        """
+        Split a transcript into the pinned messages, the older turns and the recent turns.
+
+        Args:
+            messages (list): The transcript.
+
+        Return:
+            tuple: The pinned messages, the older turns and the recent messages. A turn is a list of messages starting with an assistant message.
+        """
+        start = 0
+        while start < len(messages) and messages[start]["role"] == "system":
+            start += 1
+        if start < len(messages) and messages[start]["role"] in PINNED_ROLES:
+            start += 1
+        pinned = messages[:start]
+        turns = []
+        for message in messages[start:]:
+            if message["role"] == "assistant" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        keep = max(self.keep_turns, 1)
+        recent = [message for turn in turns[-keep:] for message in turn]
+        return pinned, turns[:-keep], recent
+
+    def compact(self, messages, functions=None, model=None, max_tokens=None):
+        """
+        Get the messages to send for a transcript.
+
+        Args:
+            messages (list): The transcript, which is left unchanged.
+            functions (list, optional): The tools offered to the model, counted in the prompt size. Default is None.
+            model (str, optional): The model. Default is None, the active model.
+            max_tokens (int, optional): The prompt size above which old turns are dropped. Default is None, `max_tokens` of the compactor.
+
+        Return:
+            list: The messages to send.
+        """
+        pinned, old, recent = self.split(messages)
+        if not old:
+            return list(messages)
+        old = [[self.digest(message) for message in turn] for turn in old]
+        max_tokens = max_tokens or self.max_tokens
+        fixed = token_budget.count_messages(pinned + recent, functions, model)
+        sizes = [token_budget.count_messages(turn, model=model) for turn in old]
+        dropped = 0
+        while dropped < len(old) and fixed + sum(sizes[dropped:]) > max_tokens:
+            dropped += 1
+        note = []
+        if dropped:
+            with self.lock:
+                self.stats["dropped"] += dropped
+            note = [
+                {
+                    "role": "user",
+                    "content": f"({dropped} earlier steps are omitted to save context.)",
+                }
+            ]
+        return (
+            pinned
+            + note
+            + [message for turn in old[dropped:] for message in turn]
+            + recent
+        )
+
+
+context_compactor = ContextCompactor()
@@ -2,6 +2,7 @@ import re
 
 from  Cacher import cache, save_cache
 from  utils.OpenaiAPI import gpt4, handle_readme
+from  utils.RepoIndex import repo_index
 
 
 def generate_des(readme):
@@ -15,7 +16,7 @@ Description: <your description>
         {"role": "system", "content": system},
         {"role": "user", "content": readme},
     ]
-    response = gpt4(messages)
+    response = gpt4(messages, site="description")
     description = re.findall(r"Description:(.+)", response, re.DOTALL)[0].strip()
     return description
 
@@ -25,3 +26,4 @@ def write_des(readme, repo_name):
         des = generate_des(handle_readme(readme))
         cache[repo_name]["description"] = des
         save_cache(cache)
+        repo_index.update(repo_name, cache[repo_name])
@@ -11,6 +11,7 @@ import docker
 import git
 
 from  logger import logger
+from  utils.ContainerTree import snapshot_tree
 
 MAX_FILE_COUNT = 50
 
@@ -342,23 +343,12 @@ def download(container, container_folder_path, local_folder_path):
 
 
 def calculate_file_count(container, directory, MAX_FILE_COUNT=80):
-    cmd = ["ls", "-a", directory]
-    output = container.exec_run(cmd).output.decode("utf-8")
-    entries = output.split("\n")[2:-1]
-    file_count = 0
-
-    for entry in entries:
-        if file_count > MAX_FILE_COUNT:
-            break
-        if entry:
-            entry_path = os.path.join(directory, entry)
-            if container.exec_run(["test", "-e", entry_path]).exit_code == 0:
-                if container.exec_run(["test", "-f", entry_path]).exit_code == 0:
-                    file_count += 1
-                elif container.exec_run(["test", "-d", entry_path]).exit_code == 0:
-                    file_count += calculate_file_count(container, entry_path)
-
-    return file_count
+    # One snapshot of the whole tree instead of an exec per entry; the count is
+    # exact below the entry limit, which is far above MAX_FILE_COUNT
+    snapshot = snapshot_tree(container, directory)
+    if snapshot is None:
+        return 0
+    return snapshot.file_count()
 
 
 def subdir(container, start_directory):
@@ -376,32 +366,13 @@ def subdir(container, start_directory):
     return subdirlist
 
 
-def explore_container_directory(container, start_directory, file_count, data={}):
-    cmd = ["ls", "-a", start_directory]
-    output = container.exec_run(cmd).output.decode("utf-8")
-    if "cannot access" in output:
+def explore_container_directory(
+    container, start_directory, file_count=None, data=None, max_depth=None
+):
+    snapshot = snapshot_tree(container, start_directory, max_depth)
+    if snapshot is None:
         return "This path doesn't exist. Please study relevant bash commands in the readme file carefully and give me your modified path."
-    entries = output.split("\n")[2:-1]
-    if not isinstance(file_count, int):
-        file_count = 0
-    if file_count < MAX_FILE_COUNT and file_count != 0:
-        for entry in entries:
-            if entry:
-                entry_path = os.path.join(start_directory, entry)
-                if container.exec_run(["test", "-f", entry_path]).exit_code == 0:
-                    data[entry_path] = 0
-                elif container.exec_run(["test", "-d", entry_path]).exit_code == 0:
-                    dir_data = explore_container_directory(container, entry_path, {})
-                    data[entry_path] = dir_data
-    else:
-        for entry in entries:
-            if entry:
-                entry_path = os.path.join(start_directory, entry)
-                if container.exec_run(["test", "-f", entry_path]).exit_code == 0:
-                    data[entry_path] = 0
-                elif container.exec_run(["test", "-d", entry_path]).exit_code == 0:
-                    dir_data = explore_container_directory(
-                        container, entry_path, file_count, {}
-                    )
-                    data[entry_path] = dir_data
+    if data is None:
+        data = {}
+    data.update(snapshot.nested(max_depth))
     return data
@@ -1,8 +1,27 @@
+import shlex
 import threading
 import time
+import uuid
 
 import docker
 
+KILL_GRACE = 5
+PIDFILE_DIR = "/tmp"
+# Runs the command in a session of its own, so that its whole process group can be killed, and
+# records the pid of the group leader. Images without setsid still run the command, and only its pid is killed.
+LAUNCHER = (
+    'if command -v setsid >/dev/null 2>&1; then setsid "$@" & else "$@" & fi; '
+    "echo $! > {pidfile}; wait $!; code=$?; rm -f {pidfile}; exit $code"
+)
+# Terminates the process group, then kills what is left of it after the grace period
+KILLER = (
+    "pid=$(cat {pidfile} 2>/dev/null) || exit 0; "
+    "kill -TERM -$pid 2>/dev/null || kill -TERM $pid 2>/dev/null; "
+    "i=0; while [ $i -lt {grace} ]; do "
+    "kill -0 -$pid 2>/dev/null || kill -0 $pid 2>/dev/null || break; sleep 1; i=$((i+1)); done; "
+    "kill -KILL -$pid 2>/dev/null || kill -KILL $pid 2>/dev/null; rm -f {pidfile}"
+)
+
 
 class ExecRunResult:
     def __init__(self, exit_code, output):
@@ -13,58 +32,185 @@ class ExecRunResult:
         return iter((self.exit_code, self.output))
 
 
+class ContainerExec:
+    """
+    This class is one command run in a container through the low-level exec API.
+
+    The output is read by a background thread into this object only, so commands that overlap do not
+    share any state. The command runs under a launcher that records its pid in a file of the container,
+    which lets `kill` terminate the command and everything it started when it is timed out or cancelled.
+    """
+
+    def __init__(self, container, cmd, demux=False, capture=None, **kwargs):
+        """
+        Initialize the ContainerExec.
+
+        Args:
+            container (docker.Container): The container.
+            cmd (str or list): The command, split like `docker exec` does if it is a string.
+            demux (bool, optional): Whether stdout and stderr are returned apart. Default is False.
+            capture (OutputCapture, optional): Fed the output as it is streamed, instead of it being buffered here. Default is None.
+            **kwargs: Other arguments of `exec_create`, such as `workdir`, `environment` or `user`.
+        """
+        self.container = container
+        self.api = container.client.api
+        self.cmd = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+        self.demux = demux
+        self.capture = capture
+        self.kwargs = kwargs
+        self.pidfile = f"{PIDFILE_DIR}/openact-exec-{uuid.uuid4().hex}.pid"
+        self.exec_id = None
+        self.stdout = []
+        self.stderr = []
+        self.exit_code = None
+        self.error = None
+        self.done = threading.Event()
+
+    def start(self):
+        """
+        Start the command and the thread reading its output.
+
+        Return:
+            ContainerExec: The started command.
+        """
+        launcher = ["sh", "-c", LAUNCHER.format(pidfile=self.pidfile), "sh"] + self.cmd
+        self.exec_id = self.api.exec_create(
+            self.container.id, launcher, stdout=True, stderr=True, **self.kwargs
+        )["Id"]
+        threading.Thread(target=self.collect, daemon=True).start()
+        return self
+
+    def collect(self):
+        """
+        Read the output of the command until it ends, then get its exit code.
+        """
+        try:
+            for chunk in self.api.exec_start(self.exec_id, stream=True, demux=self.demux):
+                if self.capture is not None:
+                    self.capture.feed(chunk[0] or chunk[1] if self.demux else chunk)
+                elif self.demux:
+                    stdout, stderr = chunk
+                    if stdout:
+                        self.stdout.append(stdout)
+                    if stderr:
+                        self.stderr.append(stderr)
+                else:
+                    self.stdout.append(chunk)
+            self.exit_code = self.api.exec_inspect(self.exec_id)["ExitCode"]
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the command to end.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Default is None, no limit.
+
+        Return:
+            bool: Whether the command ended.
+        """
+        return self.done.wait(timeout)
+
+    def kill(self, grace=KILL_GRACE):
+        """
+        Terminate the process group of the command inside the container.
+
+        Args:
+            grace (int, optional): Seconds left to the processes to exit before they are killed. Default is KILL_GRACE.
+        """
+        killer = ["sh", "-c", KILLER.format(pidfile=self.pidfile, grace=int(grace))]
+        try:
+            exec_id = self.api.exec_create(self.container.id, killer)["Id"]
+            self.api.exec_start(exec_id)
+        except Exception as e:
+            print(f"Failed to kill the command: {e}")
+
+    def result(self):
+        """
+        Get the result of the command, as `docker.Container.exec_run` returns it.
+
+        Return:
+            ExecRunResult: The exit code and the output.
+        """
+        stdout = b"".join(self.stdout)
+        if self.demux:
+            output = (stdout or None, b"".join(self.stderr) or None)
+        else:
+            output = stdout
+        return ExecRunResult(self.exit_code, output)
+
+
 class EnhancedContainer(docker.models.containers.Container):
     def __init__(self, container, client=None):
         self.__dict__ = container.__dict__.copy()
-        self.client = client
-
-    def exec_run(self, cmd, max_retries=5, delay=2, timeout=1200, **kwargs):
-        parent_exec_run = (
-            super().exec_run
-        )  # Assign parent class method to a local variable
-        parent_restart = (
-            super().restart
-        )  # Assign parent class method to a local variable
-
-        def target():
-            nonlocal delay
-            try:
-                exit_code, output = parent_exec_run(
-                    cmd, **kwargs
-                )  # Use the local variable instead of super()
-                self.result = ExecRunResult(exit_code, output)
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-                print(
-                    f"before start: {self.id}, {self.client.containers.get(self.id).status}"
-                )
-                parent_restart()  # Use the local variable instead of super()
-
-                stop_time = 3
-                elapsed_time = 0
-                while (
-                    self.client.containers.get(self.id).status != "running"
-                    and elapsed_time < 60
-                ):
-                    time.sleep(stop_time)
-                    elapsed_time += stop_time
-                    print(f"{self.id}, {self.client.containers.get(self.id).status}")
-
-                time.sleep(delay)
-                delay *= 2  # Exponential backoff
+        self.client = client or container.client
+
+    def exec_run(self, cmd, max_retries=5, delay=2, timeout=1200, capture=None, **kwargs):
+        """
+        Run a command in the container, retrying after a restart if Docker fails, and killing the command if it times out.
+
+        Args:
+            cmd (str or list): The command.
+            max_retries (int, optional): The number of attempts. Default is 5.
+            delay (int, optional): Seconds waited after the first restart, doubled after each one. Default is 2.
+            timeout (int, optional): Seconds the command may run. Default is 1200.
+            capture (OutputCapture, optional): Fed the output as it is streamed, which is then not returned. Default is None.
+            **kwargs: Other arguments of `docker.Container.exec_run`.
 
+        Return:
+            ExecRunResult: The exit code and the output.
+        """
+        if kwargs.get("stream") or kwargs.get("socket") or kwargs.get("detach"):
+            return super().exec_run(cmd, **kwargs)
+        demux = kwargs.pop("demux", False)
         for attempt in range(max_retries):
-            thread = threading.Thread(target=target)
-            thread.start()
-            thread.join(timeout)
-            if thread.is_alive():
-                print(f"Command execution timeout after {timeout} seconds.")
-                thread._stop()
-                return ExecRunResult(-1, "Command execution timeout".encode())
+            if capture is not None:
+                capture.reset()
+            try:
+                execution = ContainerExec(self, cmd, demux, capture, **kwargs).start()
+            except Exception as e:
+                error = e
             else:
-                if (
-                    hasattr(self, "result") and self.result.exit_code != 0.5
-                ):  # Check if result is set
-                    return self.result
+                try:
+                    finished = execution.wait(timeout)
+                except BaseException:
+                    execution.kill()
+                    raise
+                if not finished:
+                    print(f"Command execution timeout after {timeout} seconds.")
+                    execution.kill()
+                    execution.wait(KILL_GRACE)
+                    return ExecRunResult(-1, "Command execution timeout".encode())
+                if execution.error is None:
+                    return execution.result()
+                error = execution.error
+            print(f"Attempt {attempt + 1} failed: {error}")
+            self.recover(delay)
+            delay *= 2  # Exponential backoff
 
         return ExecRunResult(-1, "Error occurs: All attempts failed".encode())
+
+    def recover(self, delay):
+        """
+        Restart the container and wait for it to run again.
+
+        Args:
+            delay (int): Seconds waited once it runs.
+        """
+        print(f"before start: {self.id}, {self.client.containers.get(self.id).status}")
+        self.restart()
+
+        stop_time = 3
+        elapsed_time = 0
+        while (
+            self.client.containers.get(self.id).status != "running"
+            and elapsed_time < 60
+        ):
+            time.sleep(stop_time)
+            elapsed_time += stop_time
+            print(f"{self.id}, {self.client.containers.get(self.id).status}")
+
+        time.sleep(delay)
@@ -2,6 +2,7 @@ import json
 
 from  Cacher import cache, save_cache
 from  utils.OpenaiAPI import gpt4
+from  utils.RepoIndex import repo_index
 
 sys_exp = """You are a professional programmer. You have successfully used a github repository as a tool to solve a query and you want to write your experience of using this repository to other programmers. 
 
@@ -75,6 +76,7 @@ def write_experience(repo_name, query, messages):
             {"role": "system", "content": sys_exp},
             {"role": "user", "content": focused_messages},
         ]
-    response = gpt4(messages)
+    response = gpt4(messages, site="experience")
     cache[repo_name]["experience"] = response
     save_cache(cache)
+    repo_index.update(repo_name, cache[repo_name])
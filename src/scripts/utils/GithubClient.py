@@ -0,0 +1,387 @@
+import fcntl
+import hashlib
+import json
+import os
+import pickle
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+GITHUB_API_URL = "https://api.github.com"
+github_cache_dir = "github_cache"
+POOL_MAXSIZE = 16
+REQUEST_TIMEOUT = 30
+MAX_RETRIES = 5
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+MAX_RATE_LIMIT_WAIT = 300
+PACING_THRESHOLD = 0.2
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """
+    This class paces GitHub requests with one token bucket per rate-limit resource ("core", "search", ...).
+
+    The buckets are filled from the `X-RateLimit-Remaining` / `X-RateLimit-Reset` headers and kept in a
+    state file guarded by a file lock, so every thread and every agent process on the machine spends
+    the same budget. While a bucket holds more than `PACING_THRESHOLD` of its limit requests go out
+    immediately; below that they are spread evenly over the time left until the reset, and an empty
+    bucket blocks until the reset.
+    """
+
+    def __init__(self, state_file):
+        """
+        Initialize the RateLimiter.
+
+        Args:
+            state_file (str): The JSON file the buckets are shared through.
+        """
+        self.state_file = state_file
+        self.lock = threading.Lock()
+
+    def transact(self, update):
+        """
+        Apply `update` to the shared state while holding both the thread lock and the file lock.
+
+        Args:
+            update (callable): A function that receives the state dict, may modify it in place and returns a value.
+
+        Return:
+            The value returned by `update`.
+        """
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        with self.lock, open(self.state_file, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except json.JSONDecodeError:
+                    state = {}
+                result = update(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self, resource):
+        """
+        Take a token from the bucket of a resource, sleeping until the request may be sent.
+
+        Args:
+            resource (str): The rate-limit resource of the request, or None if it is not rate limited.
+
+        Return:
+            float: The number of seconds waited.
+        """
+        if resource is None:
+            return 0
+
+        def take(state):
+            now = time.time()
+            bucket = state.get(resource)
+            if bucket is None or now >= bucket["reset"]:
+                return 0
+            if bucket["remaining"] <= 0:
+                return bucket["reset"] - now
+            bucket["remaining"] -= 1
+            if bucket["remaining"] >= bucket["limit"] * PACING_THRESHOLD:
+                return 0
+            interval = (bucket["reset"] - now) / (bucket["remaining"] + 1)
+            send_at = max(bucket.get("next", now), now)
+            bucket["next"] = send_at + interval
+            return send_at - now
+
+        waited = 0
+        while True:
+            wait = self.transact(take)
+            if wait <= 0:
+                return waited
+            wait = min(wait, MAX_RATE_LIMIT_WAIT - waited)
+            if wait <= 0:
+                return waited
+            print(f"GitHub {resource} rate limit is low, waiting {wait:.1f}s.")
+            time.sleep(wait)
+            waited += wait
+            if waited >= MAX_RATE_LIMIT_WAIT:
+                return waited
+
+    def update(self, resource, headers):
+        """
+        Refill the bucket of a resource from the rate-limit headers of a response.
+
+        Args:
+            resource (str): The rate-limit resource of the request, or None if it is not rate limited.
+            headers (dict): The headers of the response.
+        """
+        resource = headers.get("X-RateLimit-Resource", resource)
+        if resource is None or "X-RateLimit-Remaining" not in headers:
+            return
+
+        def refill(state):
+            bucket = state.setdefault(resource, {})
+            bucket["remaining"] = int(headers["X-RateLimit-Remaining"])
+            bucket["limit"] = int(headers.get("X-RateLimit-Limit", bucket.get("limit", 1)))
+            bucket["reset"] = float(headers.get("X-RateLimit-Reset", time.time() + 60))
+
+        self.transact(refill)
+
+    def block(self, resource, until):
+        """
+        Empty the bucket of a resource until a given time, e.g. after a `Retry-After` answer.
+
+        Args:
+            resource (str): The rate-limit resource of the request, or None if it is not rate limited.
+            until (float): The UNIX time at which requests may be sent again.
+        """
+        if resource is None:
+            return
+
+        def empty(state):
+            bucket = state.setdefault(resource, {"limit": 1})
+            bucket["remaining"] = 0
+            bucket["reset"] = max(until, bucket.get("reset", 0))
+
+        self.transact(empty)
+
+
+class GithubClient:
+    """
+    This class is the shared entry point for GitHub REST calls.
+
+    Successful responses carrying an `ETag` or `Last-Modified` header are stored on disk. Later
+    requests for the same resource are sent as conditional requests with `If-None-Match` /
+    `If-Modified-Since`, and a `304 Not Modified` answer, which does not count against the rate
+    limit, is served from the stored body.
+
+    All requests share one keep-alive `requests.Session`, are paced by a `RateLimiter` and are
+    retried with bounded, jittered exponential backoff on connection errors, 5xx answers and
+    rate-limit answers.
+    """
+
+    def __init__(self, base_url=GITHUB_API_URL, cache_dir=github_cache_dir):
+        """
+        Initialize the GithubClient.
+
+        Args:
+            base_url (str, optional): The URL that relative request paths are resolved against. Default is GITHUB_API_URL.
+            cache_dir (str, optional): The directory responses are cached in. Default is github_cache_dir.
+        """
+        self.base_url = base_url
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "retries": 0, "bytes": 0}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.rate_limiter = RateLimiter(os.path.join(cache_dir, "rate_limit.json"))
+
+    def rate_limit_resource(self, url):
+        """
+        Get the rate-limit resource a request is counted against.
+
+        Args:
+            url (str): The absolute URL of the request.
+
+        Return:
+            str: "search" or "core" for REST API requests, None for other hosts.
+        """
+        parsed = urlparse(url)
+        if parsed.netloc != urlparse(self.base_url).netloc:
+            return None
+        return "search" if parsed.path.startswith("/search/") else "core"
+
+    def is_rate_limited(self, response):
+        """
+        Check whether a response was refused because of a primary or secondary rate limit.
+
+        Args:
+            response (requests.Response): The response to check.
+
+        Return:
+            bool: True if the request should be retried after the rate limit resets.
+        """
+        if response.status_code == 429:
+            return True
+        if response.status_code != 403:
+            return False
+        return (
+            "Retry-After" in response.headers
+            or response.headers.get("X-RateLimit-Remaining") == "0"
+            or "rate limit" in response.text.lower()
+        )
+
+    def send(self, url, headers, **kwargs):
+        """
+        Send a GET request through the shared session, pacing it and retrying transient failures.
+
+        Args:
+            url (str): The absolute URL of the request.
+            headers (dict): The headers of the request.
+            **kwargs: Other arguments passed to `requests.Session.get`.
+
+        Return:
+            requests.Response: The last response received.
+        """
+        resource = self.rate_limit_resource(url)
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        for attempt in range(MAX_RETRIES):
+            self.rate_limiter.acquire(resource)
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt) * random.uniform(0.5, 1)
+            try:
+                response = self.session.get(url, headers=headers, **kwargs)
+            except requests.RequestException as e:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                print(f"GitHub request failed: {e}. Retrying in {delay:.1f}s.")
+            else:
+                with self.lock:
+                    self.stats["requests"] += 1
+                    self.stats["bytes"] += len(response.content)
+                self.rate_limiter.update(resource, response.headers)
+                rate_limited = self.is_rate_limited(response)
+                if not rate_limited and response.status_code not in RETRY_STATUS:
+                    return response
+                if attempt == MAX_RETRIES - 1:
+                    return response
+                if rate_limited:
+                    if "Retry-After" in response.headers:
+                        until = time.time() + float(response.headers["Retry-After"])
+                    elif "X-RateLimit-Reset" in response.headers:
+                        until = float(response.headers["X-RateLimit-Reset"])
+                    else:
+                        until = time.time() + delay
+                    if until - time.time() > MAX_RATE_LIMIT_WAIT:
+                        return response
+                    self.rate_limiter.block(resource, until)
+                    delay = 0
+                print(f"GitHub request answered {response.status_code}. Retrying.")
+            with self.lock:
+                self.stats["retries"] += 1
+            time.sleep(delay)
+
+    def resolve(self, url):
+        """
+        Resolve a request path such as `/repos/owner/name/issues` against the base URL.
+
+        Args:
+            url (str): An absolute URL or a path starting with "/".
+
+        Return:
+            str: The absolute URL.
+        """
+        if url.startswith("/"):
+            return self.base_url.rstrip("/") + url
+        return url
+
+    def cache_path(self, url, headers):
+        """
+        Get the file a response is cached in. The representation and the credentials are part of the key.
+
+        Args:
+            url (str): The absolute URL of the request.
+            headers (dict): The headers of the request.
+
+        Return:
+            str: The path of the cache file.
+        """
+        key = "\n".join(
+            [url, headers.get("Accept", ""), headers.get("Authorization", "")]
+        )
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".pkl")
+
+    def load_entry(self, path):
+        """
+        Load a cached response.
+
+        Args:
+            path (str): The path of the cache file.
+
+        Return:
+            dict: The cached status code, headers, content and encoding, or None on a miss.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def save_entry(self, path, response):
+        """
+        Cache a response on disk atomically.
+
+        Args:
+            path (str): The path of the cache file.
+            response (requests.Response): The response to cache.
+        """
+        entry = {
+            "status_code": response.status_code,
+            "headers": CaseInsensitiveDict(response.headers),
+            "content": response.content,
+            "encoding": response.encoding,
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(entry, f)
+        os.replace(temp_path, path)
+
+    def get(self, url, headers=None, **kwargs):
+        """
+        Send a GET request, revalidating a cached response if there is one.
+
+        Args:
+            url (str): An absolute URL or a path starting with "/".
+            headers (dict, optional): The headers of the request. Default is None.
+            **kwargs: Other arguments passed to `requests.Session.get`.
+
+        Return:
+            requests.Response: The response. A revalidated cached response has status 200 and `from_cache` set to True.
+        """
+        url = self.resolve(url)
+        headers = dict(headers or {})
+        path = self.cache_path(url, headers)
+        entry = self.load_entry(path)
+        if entry is not None:
+            etag = entry["headers"].get("ETag")
+            last_modified = entry["headers"].get("Last-Modified")
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = self.send(url, headers, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            with self.lock:
+                self.stats["not_modified"] += 1
+            cached_headers = CaseInsensitiveDict(entry["headers"])
+            cached_headers.update(response.headers)
+            response.headers = cached_headers
+            response.status_code = entry["status_code"]
+            response._content = entry["content"]
+            response.encoding = entry["encoding"]
+            response.from_cache = True
+            return response
+
+        response.from_cache = False
+        if response.status_code == 200 and (
+            "ETag" in response.headers or "Last-Modified" in response.headers
+        ):
+            self.save_entry(path, response)
+        return response
+
+
+github = GithubClient()
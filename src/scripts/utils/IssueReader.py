@@ -1,13 +1,16 @@
 import json
 import re
 
-import requests
 from rich.console import Console
 from rich.markdown import Markdown
 
 from  logger import logger
+from  utils.BatchJudge import BATCH_JUDGE, judge_each
+from  utils.GithubClient import github
 from  utils.OpenaiAPI import GITHUB_TOKEN, gpt4
 
+MAX_ISSUES = 50
+
 system = """You are a professional programmer. When using a github repository to solve a query, you meet a problem and you want to check the issues to solve it.
 Now you will be given the initial query of using this repository and the problem you want to solve by checking the issues and the content of a issue of the repository. You need to judge whether the issue can solve the problem. If so, you should convert locate the significant part of the issue and tell the solution to the problem with the repository.
 
@@ -33,24 +36,29 @@ def judge(problem, content, init_query):
         {"role": "system", "content": system},
         {"role": "user", "content": query},
     ]
-    response = gpt4(messages)
+    response = gpt4(messages, site="issue_judge")
+    judgement, message = parse_judgement(response)
+    logger.update("issue_log", {"issue": content, "judgement": response})
+    return judgement, message
+
+
+def parse_judgement(response):
     judgement = re.findall(r"Judge: (.+?)\n", response)[0] == "Yes"
     message = re.findall(r"Message: (.+?)$", response, re.DOTALL)[0]
-    logger.update("issue_log", {"issue": content, "judgement": response})
     return judgement, message
 
 
 def process_issue(issue, headers, owner, repo):
     issue_number = issue["number"]
-    url = f"https://api.github.com/repos/{owner}/{repo}/issues/{issue_number}"
-    response = requests.get(url, headers=headers)
+    url = f"/repos/{owner}/{repo}/issues/{issue_number}"
+    response = github.get(url, headers=headers)
 
     if response.status_code == 200:
         issue_details = response.json()
         comments = []
         if issue_details["comments"] != 0:
             comments_url = issue_details["comments_url"]
-            comments_response = requests.get(comments_url, headers=headers)
+            comments_response = github.get(comments_url, headers=headers)
             if comments_response.status_code == 200:
                 comments = comments_response.json()
             else:
@@ -88,7 +96,7 @@ def process_issue(issue, headers, owner, repo):
     )
 
 
-def read_issues(problem, owner, repo, init_query):
+def read_issues(problem, owner, repo, init_query, batch=BATCH_JUDGE):
     logger.log["issue_log"].append({"problem": problem, "search_log": []})
     cnt = 0
     headers = {
@@ -100,22 +108,44 @@ def read_issues(problem, owner, repo, init_query):
     per_page = 30
 
     while True:
-        url = f"https://api.github.com/repos/{owner}/{repo}/issues?page={page}&per_page={per_page}&state=all"
-        response = requests.get(url, headers=headers)
+        url = f"/repos/{owner}/{repo}/issues?page={page}&per_page={per_page}&state=all"
+        response = github.get(url, headers=headers)
 
         if response.status_code == 200:
             issues = response.json()
             if not issues:
                 break
 
-            for issue in issues:
-                cnt += 1
-                if cnt == 50:
+            if batch:
+                issues = issues[: MAX_ISSUES - 1 - cnt]
+                cnt += len(issues)
+                # Issues are fetched batch by batch, so a suitable issue early on saves fetching the rest
+                results = judge_each(
+                    system,
+                    "Problem: " + problem + "\nInit query: " + init_query,
+                    (process_issue(issue, headers, owner, repo) for issue in issues),
+                    "issue_judge",
+                    parse_judgement,
+                    lambda content: judge(problem, content, init_query),
+                    lambda content, response: logger.update(
+                        "issue_log", {"issue": content, "judgement": response}
+                    ),
+                    prefix="Issue: ",
+                )
+                for processed_content, (judgement, message) in results:
+                    if judgement:
+                        return json.dumps({"Issue": processed_content, "Hint": message})
+                if cnt == MAX_ISSUES - 1:
                     return json.dumps({"Result": "Relevant issue not found."})
-                processed_content = process_issue(issue, headers, owner, repo)
-                judgement, message = judge(problem, processed_content, init_query)
-                if judgement:
-                    return json.dumps({"Issue": processed_content, "Hint": message})
+            else:
+                for issue in issues:
+                    cnt += 1
+                    if cnt == MAX_ISSUES:
+                        return json.dumps({"Result": "Relevant issue not found."})
+                    processed_content = process_issue(issue, headers, owner, repo)
+                    judgement, message = judge(problem, processed_content, init_query)
+                    if judgement:
+                        return json.dumps({"Issue": processed_content, "Hint": message})
             page += 1
         else:
             print(f"Failed to retrieve issues: {response.status_code}")
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+llm_cache_dir = "llm_cache"
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+EVICT_TO = 0.9
+MODES = ("off", "cache", "record", "replay")
+
+
+class LLMCacheMiss(Exception):
+    """
+    Raised in "replay" mode when a request has no recorded response.
+    """
+
+
+class LLMCache:
+    """
+    This class stores LLM responses on disk, addressed by a hash of the canonicalized request.
+
+    The request is the model, temperature, messages and tools serialized as canonical JSON, so any
+    change to the prompt or to the tools is a different entry. Each entry is its own file, and reading
+    an entry refreshes its modification time, so when the cache grows past `max_bytes` the least
+    recently used entries are evicted first.
+
+    Modes:
+        off: The cache is neither read nor written.
+        cache: Hits are served from disk, misses are sent to the API and stored.
+        record: Every request is sent to the API and its response stored, overwriting older ones.
+        replay: Every request is served from disk, and a miss raises LLMCacheMiss.
+    Recordings are not evicted in "record" mode, so a replay never misses a recorded exchange.
+    """
+
+    def __init__(self, cache_dir=llm_cache_dir, mode="off", max_bytes=MAX_CACHE_BYTES):
+        """
+        Initialize the LLMCache.
+
+        Args:
+            cache_dir (str, optional): The directory the responses are stored in. Default is llm_cache_dir.
+            mode (str, optional): One of MODES. Default is "off".
+            max_bytes (int, optional): The size above which entries are evicted. Default is MAX_CACHE_BYTES.
+        """
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.size = None
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def canonicalize(self, model, temperature, messages, tools=None):
+        """
+        Serialize a request as canonical JSON.
+
+        Args:
+            model (str): The model.
+            temperature (float): The sampling temperature.
+            messages (list): The messages.
+            tools (list, optional): The tools offered to the model. Default is None.
+
+        Return:
+            str: The canonical request.
+        """
+        request = {
+            "model": model,
+            "temperature": temperature,
+            "messages": messages,
+            "tools": tools,
+        }
+        return json.dumps(
+            request, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+        )
+
+    def path(self, request):
+        """
+        Get the file the response to a request is stored in.
+
+        Args:
+            request (str): The canonical request.
+
+        Return:
+            str: The path of the entry.
+        """
+        digest = hashlib.sha256(request.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".pkl")
+
+    def lookup(self, request):
+        """
+        Get the stored response to a request, according to the mode.
+
+        Args:
+            request (str): The canonical request.
+
+        Return:
+            dict: The entry, with the `response` and the `usage` of the original call, or None if the request should be sent.
+        """
+        if self.mode in ("off", "record"):
+            return None
+        path = self.path(request)
+        entry = None
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            os.utime(path)
+        except Exception:
+            entry = None
+        if entry is not None and entry["request"] != request:
+            entry = None
+        with self.lock:
+            self.stats["hits" if entry is not None else "misses"] += 1
+        if entry is None and self.mode == "replay":
+            raise LLMCacheMiss(f"No recorded response for request {os.path.basename(path)}")
+        return entry
+
+    def store(self, request, response, usage=None):
+        """
+        Store the response to a request, according to the mode, and evict entries if the cache is too large.
+
+        Args:
+            request (str): The canonical request.
+            response: The response, a text or a function call.
+            usage (dict, optional): The token usage of the call. Default is None.
+        """
+        if self.mode not in ("cache", "record"):
+            return
+        path = self.path(request)
+        entry = {
+            "request": request,
+            "response": response,
+            "usage": usage,
+            "time": time.time(),
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(entry, f)
+        size = os.path.getsize(temp_path)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(temp_path, path)
+        with self.lock:
+            self.stats["stores"] += 1
+            if self.size is not None:
+                self.size += size - old_size
+        if self.mode == "cache":
+            self.evict()
+
+    def entries(self):
+        """
+        List the stored entries.
+
+        Return:
+            list: (modification time, size, path) tuples.
+        """
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if not file.endswith(".pkl"):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache is below EVICT_TO of `max_bytes`.
+        """
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.entries())
+            if self.size <= self.max_bytes:
+                return
+            for _, size, path in sorted(self.entries()):
+                if self.size <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.size -= size
+                self.stats["evictions"] += 1
+
+
+llm_cache = LLMCache()
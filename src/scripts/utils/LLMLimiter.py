@@ -0,0 +1,189 @@
+import asyncio
+import contextlib
+import time
+
+from  utils.TokenBudget import token_budget
+
+MAX_CONCURRENCY = 16
+MODEL_CONCURRENCY = 8
+TOKENS_PER_MINUTE = None
+COMPLETION_TOKENS = 500
+
+
+def estimate_request_tokens(messages, functions=None, model=None):
+    """
+    Estimate the tokens a chat request will use, before it is sent.
+
+    Args:
+        messages (list): The messages of the request.
+        functions (list, optional): The tools offered to the model. Default is None.
+        model (str, optional): The model of the request. Default is None, the active model.
+
+    Return:
+        int: The prompt tokens plus COMPLETION_TOKENS for the answer.
+    """
+    return token_budget.count_messages(messages, functions, model) + COMPLETION_TOKENS
+
+
+class TokenBucket:
+    """
+    This class limits the tokens spent per minute on a model.
+
+    The bucket holds up to one minute of tokens and refills continuously. A request takes its
+    estimated tokens before it is sent, waiting while the bucket is too low, and the difference to
+    the actual usage is settled once the usage is known.
+    """
+
+    def __init__(self, tokens_per_minute=TOKENS_PER_MINUTE):
+        """
+        Initialize the TokenBucket.
+
+        Args:
+            tokens_per_minute (int, optional): The limit. Default is TOKENS_PER_MINUTE, None for no limit.
+        """
+        self.capacity = tokens_per_minute
+        self.tokens = tokens_per_minute or 0
+        self.updated = time.monotonic()
+        self.lock = None
+
+    def refill(self):
+        """
+        Add the tokens earned since the last refill.
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.capacity / 60
+        )
+        self.updated = now
+
+    async def take(self, tokens):
+        """
+        Take tokens from the bucket, waiting until there are enough.
+
+        Args:
+            tokens (int): The estimated tokens of the request.
+        """
+        if self.capacity is None:
+            return
+        tokens = min(tokens, self.capacity)
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                self.refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                # Settled requests may refund tokens, so look again at least every second
+                await asyncio.sleep(min((tokens - self.tokens) * 60 / self.capacity, 1))
+
+    def settle(self, estimated, actual):
+        """
+        Correct the bucket once the actual usage of a request is known.
+
+        Args:
+            estimated (int): The tokens taken for the request.
+            actual (int): The tokens the request actually used.
+        """
+        if self.capacity is None:
+            return
+        self.refill()
+        self.tokens = min(self.capacity, self.tokens + estimated - actual)
+
+
+class Lease:
+    """
+    This class is the permission to send one request, returned by `LLMLimiter.limit`.
+    """
+
+    def __init__(self, bucket, tokens):
+        """
+        Initialize the Lease.
+
+        Args:
+            bucket (TokenBucket): The bucket the tokens were taken from.
+            tokens (int): The estimated tokens taken.
+        """
+        self.bucket = bucket
+        self.tokens = tokens
+
+    def settle(self, usage):
+        """
+        Settle the tokens of the request with its actual usage.
+
+        Args:
+            usage (dict): The usage of the request, or None if it is unknown and the estimate stands.
+        """
+        if usage is not None:
+            self.bucket.settle(self.tokens, usage["total_tokens"])
+
+
+class LLMLimiter:
+    """
+    This class bounds concurrent LLM requests, overall and per model, and the tokens per minute of each model.
+
+    It must only be used from the shared background loop (see `AsyncLoop`), which creates its
+    semaphores and token buckets lazily.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, model_limits=None):
+        """
+        Initialize the LLMLimiter.
+
+        Args:
+            max_concurrency (int, optional): The maximum number of requests in flight over all models. Default is MAX_CONCURRENCY.
+            model_limits (dict, optional): Per-model limits, e.g. {"gpt-4": {"concurrency": 4, "tpm": 300000}}. Default is None.
+        """
+        self.max_concurrency = max_concurrency
+        self.model_limits = model_limits or {}
+        self.semaphore = None
+        self.models = {}
+
+    def model(self, model):
+        """
+        Get the semaphore and token bucket of a model, creating them on first use.
+
+        Args:
+            model (str): The model.
+
+        Return:
+            tuple: The semaphore and the token bucket.
+        """
+        if model not in self.models:
+            limits = self.model_limits.get(model, {})
+            self.models[model] = (
+                asyncio.Semaphore(limits.get("concurrency", MODEL_CONCURRENCY)),
+                TokenBucket(limits.get("tpm", TOKENS_PER_MINUTE)),
+            )
+        return self.models[model]
+
+    @contextlib.asynccontextmanager
+    async def limit(self, model, tokens):
+        """
+        Wait until a request may be sent, and hold its concurrency slots while it runs.
+
+        Args:
+            model (str): The model of the request.
+            tokens (int): The estimated tokens of the request.
+
+        Return:
+            Lease: The lease of the request, to settle with the actual usage.
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        semaphore, bucket = self.model(model)
+        # The tokens are waited for before any slot is taken, so that a model throttled by
+        # its bucket does not hold the slots of the other models
+        await bucket.take(tokens)
+        entered = False
+        try:
+            async with self.semaphore, semaphore:
+                entered = True
+                yield Lease(bucket, tokens)
+        finally:
+            if not entered:
+                # Cancelled while waiting for a slot: the request was never sent
+                bucket.settle(tokens, 0)
+
+
+llm_limiter = LLMLimiter()
@@ -0,0 +1,100 @@
+import threading
+
+FAST_MODEL = "gpt-3.5-turbo-0125"
+# A tier of None is the model the run was started with (`--gpt_version`)
+TIERS = {
+    "strong": None,
+    "fast": FAST_MODEL,
+}
+SITE_TIERS = {
+    "orchestrator": "strong",
+    "readme_judge": "fast",
+    "issue_judge": "fast",
+    "pr_judge": "fast",
+    "description": "fast",
+    "experience": "fast",
+    "output_summary": "fast",
+}
+
+
+class ModelRouter:
+    """
+    This class picks the model of each LLM call site.
+
+    Every call site is mapped to a tier, and every tier to a model, so the many short yes/no
+    judgements can run on a fast and inexpensive model while the reasoning loops keep the strong one.
+    A site can be overridden with either a tier or a model name. The model the run was started with
+    is the fallback of every site: if the routed model fails, the call is repeated on it, and a model
+    the server does not know is not tried again.
+    """
+
+    def __init__(self, tiers=None, site_tiers=None):
+        """
+        Initialize the ModelRouter.
+
+        Args:
+            tiers (dict, optional): Model names by tier. Default is TIERS.
+            site_tiers (dict, optional): Tiers by call site. Default is SITE_TIERS.
+        """
+        self.tiers = dict(tiers or TIERS)
+        self.site_tiers = dict(site_tiers or SITE_TIERS)
+        self.overrides = {}
+        self.unavailable = set()
+        self.lock = threading.Lock()
+        self.stats = {"routed": 0, "fallbacks": 0}
+
+    def model(self, site, default):
+        """
+        Get the model of a call site.
+
+        Args:
+            site (str): The call site, or None for the default model.
+            default (str): The model the run was started with.
+
+        Return:
+            str: The model.
+        """
+        if site is None:
+            return default
+        choice = self.overrides.get(site, self.site_tiers.get(site, "strong"))
+        model = self.tiers[choice] if choice in self.tiers else choice
+        if not model or model in self.unavailable:
+            return default
+        return model
+
+    def models(self, site, default):
+        """
+        Get the models to try for a call site, in order.
+
+        Args:
+            site (str): The call site, or None for the default model.
+            default (str): The model the run was started with.
+
+        Return:
+            list: The routed model, followed by the default model if it is a different one.
+        """
+        model = self.model(site, default)
+        if model == default:
+            return [default]
+        with self.lock:
+            self.stats["routed"] += 1
+        return [model, default]
+
+    def fail(self, site, model, error, unavailable=False):
+        """
+        Record that a routed model failed and the call falls back.
+
+        Args:
+            site (str): The call site.
+            model (str): The model that failed.
+            error (Exception): The error.
+            unavailable (bool, optional): Whether the model should not be tried again. Default is False.
+        """
+        with self.lock:
+            self.stats["fallbacks"] += 1
+            if unavailable:
+                self.unavailable.add(model)
+        print(f"{model} failed for {site}, falling back to the default model: {error}")
+
+
+model_router = ModelRouter()
@@ -1,18 +1,43 @@
+import asyncio
+import contextlib
 import json
 import logging
 import os
 import re
 import sys
+import threading
 from datetime import datetime
 
 import openai
 from colorama import Fore, init
 
 from  logger import logger
+from  utils.AsyncLoop import background_loop
+from  utils.ContextCompactor import context_compactor
+from  utils.LLMCache import LLMCacheMiss, llm_cache
+from  utils.LLMLimiter import estimate_request_tokens, llm_limiter
+from  utils.ModelRouter import model_router
+from  utils.OpenaiClient import client_manager
+from  utils.RetryPolicy import (CONTEXT_SHRINK, TRANSIENT_KINDS, LLMCallError,
+                                classify, retry_policy)
+from  utils.TokenBudget import COMPLETION_RESERVE, token_budget
+from  utils.ToolSchema import tool_schema, with_format_instructions
 
 user_config = json.load(open("config.json"))
 GITHUB_TOKEN = user_config["GITHUB_TOKEN"]
 OPENAI_API_KEY = user_config["OPENAI_API_KEY"]
+OPENAI_BASE_URL = user_config.get("BaseURL") or None
+OPENAI_TIMEOUT = user_config.get("Timeout")
+BACKEND = user_config.get("Backend", "openai")
+llm_cache.mode = user_config.get("LLMCache", "off")
+STREAM = user_config.get("Stream", True)
+STREAM_OPTIONS = {"stream_options": {"include_usage": True}}
+llm_limiter.model_limits = user_config.get("ModelLimits", {})
+token_budget.context_windows.update(user_config.get("ContextWindows", {}))
+model_router.tiers.update(user_config.get("ModelRouting", {}).get("tiers", {}))
+model_router.overrides.update(user_config.get("ModelRouting", {}).get("sites", {}))
+SUMMARY_TOKENS = 12000
+README_TOKENS = 3000
 messages_length = []
 
 init(autoreset=True)
@@ -50,6 +75,7 @@ class LoggerAndPrinter:
         formatter = logging.Formatter("%(asctime)s - %(message)s")
         fh.setFormatter(formatter)
         self.log.addHandler(fh)
+        self.stream_buffer = ""
 
     def write(self, message, color=None):
         if color and color in self.COLOR_MAPPING:
@@ -64,6 +90,20 @@ class LoggerAndPrinter:
         self.write(message + "\n", color)
         self.flush()
 
+    def stream_write(self, message, color=None):
+        # Show a streamed piece of text right away, and log the whole text once in stream_end
+        self.stream_buffer += message
+        if color and color in self.COLOR_MAPPING:
+            message = self.COLOR_MAPPING[color] + message
+        self.terminal.write(message)
+        self.flush()
+
+    def stream_end(self):
+        self.terminal.write("\n")
+        self.flush()
+        self.log.info(self.stream_buffer.strip("\n"))
+        self.stream_buffer = ""
+
 
 sys.stdout = LoggerAndPrinter()
 
@@ -82,36 +122,136 @@ def print_usage():
 
 
 class GPT:
-    def __init__(self, version="gpt-4-1106", temperature=0.7):
+    def __init__(
+        self, version="gpt-4-1106", temperature=0.7, timeout=OPENAI_TIMEOUT, stream=STREAM
+    ):
         self.version = version
         self.temperature = temperature
+        self.timeout = timeout
+        self.stream = stream
         self.accum_len = 0
-
-    def gpt4(self, messages):
-        client = openai.OpenAI(
-            api_key=OPENAI_API_KEY,
-            base_url="",
-        )
-
-        response = client.chat.completions.create(
-            model=self.version,
-            messages=messages,
-            # max_tokens=2000,
+        self.tasks = set()
+
+    async def acreate(self, timeout=None, model=None, **kwargs):
+        # All calls share one pooled client; a per-call timeout overrides self.timeout
+        client = client_manager.get_async(OPENAI_API_KEY, OPENAI_BASE_URL)
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        return await client.chat.completions.create(
+            model=model or self.version,
             temperature=self.temperature,
             stop=None,
+            **kwargs,
         )
 
-        messages_length.append(dict(response.usage))
-        logger.update("usage", dict(response.usage))
-        sys.stdout.print_colored(
-            str(response.choices[0].message.content.strip()), "green"
+    def log_usage(self, usage):
+        if usage is None:
+            return
+        messages_length.append(usage)
+        logger.update("usage", usage)
+
+    async def astream_text(self, messages, timeout=None, model=None):
+        # Print the answer as it arrives
+        stream = await self.acreate(
+            timeout=timeout,
+            model=model,
+            messages=messages,
+            stream=True,
+            extra_body=STREAM_OPTIONS,
         )
+        content = ""
+        usage = None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = dict(chunk.usage)
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not content:
+                delta = delta.lstrip()
+            content += delta
+            sys.stdout.stream_write(delta, "green")
+        sys.stdout.stream_end()
+        return content.strip(), usage
+
+    async def acomplete(self, messages, model, timeout=None, live=False):
+        # Only live calls are streamed to the terminal, so that the answers of
+        # concurrent calls are not interleaved
+        request = llm_cache.canonicalize(model, self.temperature, messages)
+        entry = llm_cache.lookup(request)
+        if entry is not None:
+            sys.stdout.print_colored(str(entry["response"]), "green")
+            return entry["response"]
+
+        # Transient errors are retried here, since the client does not retry
+        kind_tries = {}
+        tries = 0
+        while True:
+            tries += 1
+            try:
+                async with llm_limiter.limit(
+                    model, estimate_request_tokens(messages, model=model)
+                ) as lease:
+                    if self.stream and live:
+                        content, usage = await self.astream_text(messages, timeout, model)
+                        self.log_usage(usage)
+                    else:
+                        response = await self.acreate(
+                            timeout=timeout,
+                            model=model,
+                            messages=messages,
+                            # max_tokens=2000,
+                        )
+                        content = response.choices[0].message.content.strip()
+                        usage = dict(response.usage)
+                        self.log_usage(usage)
+                        sys.stdout.print_colored(str(content), "green")
+                    lease.settle(usage)
+                break
+            except Exception as e:
+                kind = classify(e)
+                kind_tries[kind] = kind_tries.get(kind, 0) + 1
+                if kind not in TRANSIENT_KINDS or not retry_policy.should_retry(
+                    kind, kind_tries[kind], tries
+                ):
+                    raise
+                print(f"LLM call failed ({kind}, try {tries}): {e}")
+                await asyncio.sleep(retry_policy.delay(kind, kind_tries[kind], e))
+
+        llm_cache.store(request, content, usage)
+        return content
+
+    async def agpt4(self, messages, timeout=None, live=False, site=None):
+        # The call site picks the model; a failing routed model falls back to self.version
+        models = model_router.models(site, self.version)
+        for model in models[:-1]:
+            try:
+                return await self.acomplete(messages, model, timeout, live)
+            except LLMCacheMiss:
+                raise
+            except Exception as e:
+                model_router.fail(
+                    site, model, e, isinstance(e, openai.NotFoundError)
+                )
+        return await self.acomplete(messages, models[-1], timeout, live)
 
-        return response.choices[0].message.content.strip()
+    def gpt4(self, messages, timeout=None, site=None):
+        live = threading.current_thread() is threading.main_thread()
+        return background_loop.run(self.agpt4(messages, timeout, live, site))
 
     def gpt_summary(self, messages, functions):
-        if self.accum_len + len(messages[-1]["content"]) < 12000:
-            return self.gpt4_functions(messages, functions)
+        # Compact old turns into digests first, and summarize only if the pinned
+        # and recent messages alone outgrow SUMMARY_TOKENS or the context window
+        limit = min(
+            SUMMARY_TOKENS,
+            token_budget.context_window(self.version) - COMPLETION_RESERVE,
+        )
+        # The compacted copy is only sent: the transcript keeps every turn verbatim
+        compacted = context_compactor.compact(messages, functions, self.version, limit)
+        if token_budget.count_messages(compacted, functions, self.version) < limit:
+            return self.gpt4_functions(compacted, functions)
         else:
             sys_p = """You are a professional programmer. You are using Lange Language Model to manipulate a computer to find and use a github repository to solve a problem. However, now the input to the model, which include former actions, is too long. Your task is to summarize the former process based on the given actions and feedbacks. If there is readme file in the input, you should insure you maintain the key information especially commands and their functions in the file. If there are multiple actions and fedacks, you should summarize what you can learn from it one by one. Also, do not forget the initial query."""
             content = "\n".join(
@@ -128,52 +268,161 @@ class GPT:
             ]
             response = self.gpt4(messages_sum)
             print(response)
-            messages[1:-1] = [{"role": "user", "content": response}]
-            return self.gpt4_functions(messages, functions)
+            # The summary replaces the middle turns in a new list, as for the compacted copy
+            summarized = (
+                messages[:1]
+                + [{"role": "user", "content": response}]
+                + messages[1:][-1:]
+            )
+            return self.gpt4_functions(summarized, functions)
+
+    async def afinish_stream(self, stream, request, func_call, lease, slot):
+        # Read the rest of a stream whose tool call was already dispatched, for its usage;
+        # the limiter slot of the request is held until the stream is drained
+        usage = None
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = dict(chunk.usage)
+        except Exception as e:
+            print(f"Failed to read the end of the stream: {e}")
+        finally:
+            await stream.close()
+            lease.settle(usage)
+            await slot.aclose()
+        self.log_usage(usage)
+        if usage is not None:
+            self.accum_len = usage["total_tokens"]
+        if func_call is not None:
+            llm_cache.store(request, func_call, usage)
+
+    async def astream_tool_call(self, request, messages, functions, timeout=None):
+        # Assemble the first tool call from the deltas and return it as soon as its
+        # arguments parse; the rest of the stream is read in the background
+        slot = contextlib.AsyncExitStack()
+        lease = await slot.enter_async_context(
+            llm_limiter.limit(
+                self.version, estimate_request_tokens(messages, functions, self.version)
+            )
+        )
+        stream = None
+        try:
+            stream = await self.acreate(
+                timeout=timeout,
+                messages=messages,
+                tools=functions,
+                stream=True,
+                extra_body=STREAM_OPTIONS,
+            )
+            name = ""
+            arguments = ""
+            complete = False
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.tool_calls:
+                    continue
+                for tool_call in chunk.choices[0].delta.tool_calls:
+                    if tool_call.index != 0:
+                        complete = True
+                        break
+                    if tool_call.function and tool_call.function.name:
+                        name += tool_call.function.name
+                    if tool_call.function and tool_call.function.arguments:
+                        arguments += tool_call.function.arguments
+                if not complete and name and arguments.rstrip().endswith("}"):
+                    try:
+                        json.loads(arguments)
+                        complete = True
+                    except ValueError:
+                        pass
+                if complete:
+                    break
+        except BaseException:
+            if stream is not None:
+                await stream.close()
+            await slot.aclose()
+            raise
+        if not name:
+            await self.afinish_stream(stream, request, None, lease, slot)
+            raise ValueError("The response contains no tool call.")
+        func_call = {"name": name, "arguments": arguments}
+        # Only a call whose arguments parse is cached, so that replay never returns a broken one
+        try:
+            json.loads(arguments)
+        except ValueError:
+            valid_call = None
+        else:
+            valid_call = func_call
+        if complete:
+            task = asyncio.ensure_future(
+                self.afinish_stream(stream, request, valid_call, lease, slot)
+            )
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        else:
+            await self.afinish_stream(stream, request, valid_call, lease, slot)
+        return func_call
 
-    def gpt4_functions(self, messages, functions):
-        MAX_TRIES = 5
-        tried = 0
-        while tried < MAX_TRIES:
+    async def agpt4_functions(self, messages, functions, timeout=None):
+        request = llm_cache.canonicalize(
+            self.version, self.temperature, messages, functions
+        )
+        entry = llm_cache.lookup(request)
+        if entry is not None:
+            sys.stdout.print_colored(str(entry["response"]), "yellow")
+            self.accum_len = (entry["usage"] or {}).get("total_tokens", 0)
+            return dict(entry["response"])
+
+        # Each try sends its own copy of the messages, so repair hints and
+        # compaction never leak into the transcript of the caller
+        attempt_messages = messages
+        kind_tries = {}
+        tries = 0
+        while True:
+            response = None
             try:
-                tried += 1
-
-                client = openai.OpenAI(
-                    api_key=OPENAI_API_KEY,
-                    base_url="",
-                )
-
-                response = None
-
-                response = client.chat.completions.create(
-                    model=self.version,
-                    messages=messages,
-                    tools=functions,
-                    temperature=self.temperature,
-                    # max_tokens=2000,
-                    stop=None,
-                )
+                tries += 1
+                if self.stream:
+                    func_call = await self.astream_tool_call(
+                        request, attempt_messages, functions, timeout
+                    )
+                    json.loads(func_call["arguments"])
+                    sys.stdout.print_colored(str(func_call), "yellow")
+                    return func_call
+
+                async with llm_limiter.limit(
+                    self.version,
+                    estimate_request_tokens(attempt_messages, functions, self.version),
+                ) as lease:
+                    response = await self.acreate(
+                        timeout=timeout,
+                        messages=attempt_messages,
+                        tools=functions,
+                        # max_tokens=2000,
+                    )
+                    lease.settle(dict(response.usage))
 
                 messages_length.append(dict(response.usage))
                 logger.update("usage", dict(response.usage))
-                func_call = response.choices[0]
-                func_call = func_call.message.tool_calls
-                func_call = func_call[0].function
-                func_name = func_call.name
-                func_para = func_call.arguments
-                func_call = {"name": func_name, "arguments": func_para}
-                json.loads(func_para)
+                tool_calls = response.choices[0].message.tool_calls
+                if not tool_calls:
+                    raise ValueError("The response contains no tool call.")
+                func_call = {
+                    "name": tool_calls[0].function.name,
+                    "arguments": tool_calls[0].function.arguments,
+                }
+                json.loads(func_call["arguments"])
 
                 sys.stdout.print_colored(str(func_call), "yellow")
 
                 self.accum_len = response.usage.total_tokens
+                llm_cache.store(request, func_call, dict(response.usage))
                 return func_call
+            except LLMCacheMiss:
+                raise
             except Exception as e:
-                import traceback
-
-                traceback.print_exc()
-                print(traceback.format_exc())
-                print(e)
+                kind = classify(e)
+                kind_tries[kind] = kind_tries.get(kind, 0) + 1
+                print(f"LLM call failed ({kind}, try {tries}): {e}")
 
                 if response:
                     response = dict(response)
@@ -183,22 +432,60 @@ class GPT:
                             response[k] = str(v)
                 logger.update(
                     "call_error",
-                    {"Error": str(e), "input": messages, "output": response},
+                    {
+                        "Error": str(e),
+                        "kind": kind,
+                        "input": attempt_messages,
+                        "output": response,
+                    },
                 )
-                messages[-1][
-                    "content"
-                ] += "\nYou should use tool call to call a function. If you find you are unable to handle the problem, please submit and end this task."
+                if not retry_policy.should_retry(kind, kind_tries[kind], tries):
+                    raise LLMCallError(kind, e, tries) from e
+
+                attempt_messages = messages
+                if kind == "context_overflow":
+                    size = token_budget.count_messages(messages, functions, self.version)
+                    attempt_messages = context_compactor.compact(
+                        messages, functions, self.version, int(size * CONTEXT_SHRINK)
+                    )
+                    if token_budget.count_messages(
+                        attempt_messages, functions, self.version
+                    ) >= size:
+                        raise LLMCallError(kind, e, tries) from e
+                hint = retry_policy.hint(kind, e)
+                if hint is not None:
+                    attempt_messages = attempt_messages + [hint]
+                await asyncio.sleep(retry_policy.delay(kind, kind_tries[kind], e))
+
+    def gpt4_functions(self, messages, functions, timeout=None):
+        return background_loop.run(self.agpt4_functions(messages, functions, timeout))
 
 
 gpt = GPT()
 
 
-# def gpt4(messages):
-#     return gpt.gpt4(messages)
+def gpt4(messages, timeout=None, site=None):
+    if BACKEND == "codellama":
+        return codellama_gpt4(messages)
+    return gpt.gpt4(messages, timeout=timeout, site=site)
+
 
+def gpt4_functions(messages, functions, timeout=None):
+    if BACKEND == "codellama":
+        return codellama_gpt4_functions(messages, functions)
+    return gpt.gpt4_functions(messages, functions, timeout=timeout)
 
-# def gpt4_functions(messages, functions):
-#     return gpt.gpt4_functions(messages, functions)
+
+async def agpt4(messages, timeout=None, site=None):
+    if BACKEND == "codellama":
+        return codellama_gpt4(messages)
+    return await gpt.agpt4(messages, timeout=timeout, site=site)
+
+
+async def agpt4_functions(messages, functions, timeout=None):
+    if BACKEND == "codellama":
+        return codellama_gpt4_functions(messages, functions)
+    return await gpt.agpt4_functions(messages, functions, timeout=timeout)
 
 
 def gpt_summary(messages, functions):
@@ -212,7 +499,7 @@ def handle_readme(text):
         text = re.sub(r"<p.*?>.*?</p>", "", text, flags=re.DOTALL)
         text = re.sub(r"<div.*?>.*?</div>", "", text, flags=re.DOTALL)
         text = re.sub(r"<a.*?>.*?</a>", "", text, flags=re.DOTALL)
-        if len(text) > 12000:
+        if token_budget.count(text) > README_TOKENS:
             text = re.sub(r"\[(.*?)\]\([^)]*\)", r"\1", text)
             text = re.sub(r"\[(.*?)\]\([^)]*\)", r"\1", text)
     return text
@@ -220,23 +507,25 @@ def handle_readme(text):
 def codellama(text):
     return text
 
-def gpt4(messages):
+def codellama_gpt4(messages):
     message_text = "<s>"
     for message in messages:
         if message["role"] == "system":
-            message_text += f"System: {message['content'].replace("\n","")}\n"
+            content = message["content"].replace("\n", "")
+            message_text += f"System: {content}\n"
         else:
             message_text += f"{message['role']}: {message['content']}\n"
     back_content = codellama(message_text)
     print(back_content)
     return back_content
 
-def gpt4_functions(messages, functions):
+def codellama_gpt4_functions(messages, functions):
     messages = handle_sys_prompt(messages)
     message_text = "<s>"
     for message in messages:
         if message["role"] == "system":
-            message_text += f"System: {message['content'].replace("\n","")}\n"
+            content = message["content"].replace("\n", "")
+            message_text += f"System: {content}\n"
         else:
             message_text += f"{message['role']}: {message['content']}\n"
     message_text += func2text(functions)
@@ -246,24 +535,10 @@ def gpt4_functions(messages, functions):
 
 
 def func2text(funcs):
-    text = ""
-    func_index = 0
-    for func in funcs:
-        func = func["function"]
-        text += f"Function {func_index}:\n"
-        text += f"Function Name: {func['name']}\n"
-        text += f"Function Description: {func['description']}\n"
-        for arg in func["parameters"]["properties"]:
-            text += f"Argument: {arg['name']}\n"
-            text += f"Argument Type: {arg['type']}\n"
-            text += f"Argument Description: {arg['description']}\n"
-        text += f"Parameters Required: {",".join(func['parameters']['required'])}\n\n\n"
-    return text
+    return tool_schema.text(funcs)
 
 def handle_sys_prompt(messages):
-    str = "You will be provided the functions that you can use to solve the problem.\nYour answer should be a function call with the function name and the arguments.\nYour answer should be in the following format:\n\n{\n\t\"name\": \"function_name\",\n\t\"arguments\": {\n\t\t\"argument1\": \"value1\",\n\t\t\"argument2\": \"value2\",\n\t\t\"argument3\": \"value3\"\n\t}\n}\n\n"
-    messages[0]["content"] += str
-    return messages
+    return with_format_instructions(messages)
 
 def text2funccall(text):
     text = re.findall(r"{(.+)}", text, re.DOTALL)[0]
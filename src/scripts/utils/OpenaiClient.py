@@ -0,0 +1,84 @@
+import threading
+
+import httpx
+import openai
+
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+KEEPALIVE_EXPIRY = 120
+CONNECT_TIMEOUT = 10
+REQUEST_TIMEOUT = 600
+# Retries are left to `RetryPolicy`, so that every attempt it counts is one request
+MAX_RETRIES = 0
+
+
+class OpenaiClientManager:
+    """
+    This class hands out long-lived `openai.AsyncOpenAI` clients, one per (API key, base URL).
+
+    Each client owns a pooled `httpx` client with keep-alive connections, so consecutive and
+    concurrent calls reuse open TLS connections instead of handshaking again for every request.
+    Clients are created lazily, and must only be used from the shared background loop (see
+    `AsyncLoop`), which runs until the end of the process.
+
+    The SDK's own retries are turned off (`max_retries=0`): `RetryPolicy` is the only retry layer,
+    and a failed request reaches it at once instead of after the SDK has retried it.
+    """
+
+    def __init__(
+        self,
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+        connect_timeout=CONNECT_TIMEOUT,
+        request_timeout=REQUEST_TIMEOUT,
+    ):
+        """
+        Initialize the OpenaiClientManager.
+
+        Args:
+            max_connections (int, optional): The maximum number of open connections per client. Default is MAX_CONNECTIONS.
+            max_keepalive_connections (int, optional): The maximum number of idle connections kept open per client. Default is MAX_KEEPALIVE_CONNECTIONS.
+            keepalive_expiry (float, optional): Seconds an idle connection is kept open. Default is KEEPALIVE_EXPIRY.
+            connect_timeout (float, optional): Seconds allowed to open a connection. Default is CONNECT_TIMEOUT.
+            request_timeout (float, optional): Seconds allowed for a request unless a call sets its own timeout. Default is REQUEST_TIMEOUT.
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(request_timeout, connect=connect_timeout)
+        self.lock = threading.Lock()
+        self.async_clients = {}
+
+    def get_async(self, api_key, base_url=None):
+        """
+        Get the shared async client of an API key and base URL, creating it on first use.
+
+        Args:
+            api_key (str): The OpenAI API key.
+            base_url (str, optional): The URL of an OpenAI-compatible server. Default is None, the OpenAI API.
+
+        Return:
+            openai.AsyncOpenAI: The client.
+        """
+        key = (api_key, base_url)
+        with self.lock:
+            client = self.async_clients.get(key)
+            if client is None:
+                http_client = httpx.AsyncClient(
+                    limits=self.limits, timeout=self.timeout, follow_redirects=True
+                )
+                client = openai.AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=self.timeout,
+                    max_retries=MAX_RETRIES,
+                    http_client=http_client,
+                )
+                self.async_clients[key] = client
+            return client
+
+
+client_manager = OpenaiClientManager()
@@ -0,0 +1,149 @@
+import posixpath
+import shlex
+
+OUTPUT_HEAD_BYTES = 16 * 1024
+OUTPUT_TAIL_BYTES = 16 * 1024
+# Runs the command with its stderr merged into its stdout, copies the output to the spill file with
+# tee as it is streamed back, and exits with the status of the command rather than of tee
+SPILL_SCRIPT = (
+    "mkdir -p {directory}; "
+    '{{ "$@" 2>&1; echo $? > {status}; }} | tee {spill}; '
+    "code=$(cat {status} 2>/dev/null || echo 1); rm -f {status}; exit $code"
+)
+
+
+class OutputCapture:
+    """
+    This class keeps a bounded view of the output of a command as it is streamed: the first
+    `head_bytes` bytes, a ring buffer of the last `tail_bytes` bytes, and the total byte and line
+    counts. Its memory does not grow with the output, which is saved whole in a spill file of the
+    container instead.
+    """
+
+    def __init__(self, spill_path=None, head_bytes=OUTPUT_HEAD_BYTES, tail_bytes=OUTPUT_TAIL_BYTES):
+        """
+        Initialize the OutputCapture.
+
+        Args:
+            spill_path (str, optional): The file of the container the whole output is saved in. Default is None.
+            head_bytes (int, optional): The number of bytes kept from the beginning. Default is OUTPUT_HEAD_BYTES.
+            tail_bytes (int, optional): The number of bytes kept from the end. Default is OUTPUT_TAIL_BYTES.
+        """
+        self.spill_path = spill_path
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the output captured so far, e.g. before a command is run again.
+        """
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.lines = 0
+        self.last_byte = b"\n"
+
+    def feed(self, chunk):
+        """
+        Add a chunk of output.
+
+        Args:
+            chunk (bytes): The chunk.
+        """
+        if not chunk:
+            return
+        self.total_bytes += len(chunk)
+        self.lines += chunk.count(b"\n")
+        self.last_byte = chunk[-1:]
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self.tail += chunk
+            # Trimmed once it doubles, so that each byte is moved a bounded number of times
+            if len(self.tail) > 2 * self.tail_bytes:
+                del self.tail[: -self.tail_bytes]
+
+    @property
+    def line_count(self):
+        """
+        The number of lines of the output, counting a last line without a newline.
+        """
+        return self.lines + (self.last_byte != b"\n")
+
+    @property
+    def truncated(self):
+        """
+        Whether bytes of the output were left out between the head and the tail.
+        """
+        return self.total_bytes > len(self.head) + min(len(self.tail), self.tail_bytes)
+
+    def summary(self):
+        """
+        Describe the size of the output and where it is saved.
+
+        Return:
+            str: The description.
+        """
+        text = f"The output has {self.total_bytes} bytes in {self.line_count} lines"
+        if self.spill_path:
+            text += f", and it is saved whole in `{self.spill_path}`"
+        return text + "."
+
+    def text(self):
+        """
+        Decode the output kept, with a note of the bytes left out between the head and the tail.
+
+        Return:
+            str: The text.
+        """
+        tail = bytes(self.tail[-self.tail_bytes :]) if self.tail else b""
+        if not self.truncated:
+            return (bytes(self.head) + tail).decode("utf-8", errors="replace")
+        omitted = self.total_bytes - len(self.head) - len(tail)
+        return (
+            bytes(self.head).decode("utf-8", errors="ignore")
+            + f"\n...({omitted} bytes omitted)...\n"
+            + tail.decode("utf-8", errors="ignore")
+        )
+
+
+def capture_output(
+    container,
+    command,
+    spill_path,
+    timeout=1200,
+    head_bytes=OUTPUT_HEAD_BYTES,
+    tail_bytes=OUTPUT_TAIL_BYTES,
+):
+    """
+    Run a command in a container, keeping a bounded head and tail of its output in memory and saving
+    the whole output in a spill file of the container.
+
+    Args:
+        container (EnhancedContainer): The container.
+        command (str or list): The command, split like `docker exec` does if it is a string.
+        spill_path (str): The file of the container the output is saved in.
+        timeout (int, optional): Seconds the command may run. Default is 1200.
+        head_bytes (int, optional): The number of bytes kept from the beginning. Default is OUTPUT_HEAD_BYTES.
+        tail_bytes (int, optional): The number of bytes kept from the end. Default is OUTPUT_TAIL_BYTES.
+
+    Return:
+        tuple: The exit code, -1 on timeout, and the OutputCapture, which holds what was output until then.
+    """
+    command = shlex.split(command) if isinstance(command, str) else list(command)
+    script = SPILL_SCRIPT.format(
+        directory=shlex.quote(posixpath.dirname(spill_path) or "."),
+        spill=shlex.quote(spill_path),
+        status=shlex.quote(spill_path + ".status"),
+    )
+    capture = OutputCapture(spill_path, head_bytes, tail_bytes)
+    exit_code, output = container.exec_run(
+        ["sh", "-c", script, "sh"] + command, timeout=timeout, capture=capture
+    )
+    if exit_code == -1 and output:
+        # Timed out or failed: the reason follows what was output until then
+        capture.feed((b"\n" if capture.last_byte != b"\n" else b"") + output)
+    return exit_code, capture
@@ -4,10 +4,11 @@ import re
 from pprint import pprint
 
 import docker
-import requests
 
 from  logger import logger
+from  utils.BatchJudge import BATCH_JUDGE, judge_each
 from  utils.DockerOperations import dockerwrite, dockerwrite_empty_file
+from  utils.GithubClient import github
 from  utils.OpenaiAPI import GITHUB_TOKEN, gpt4
 
 system = """You are a professional programmer. When using a github repository, you met a problem and you want to check the pull requests to solve it.
@@ -34,14 +35,19 @@ def judge(problem, content):
         {"role": "system", "content": system},
         {"role": "user", "content": query},
     ]
-    response = gpt4(messages)
+    response = gpt4(messages, site="pr_judge")
+    judgement, message = parse_judgement(response)
+    logger.update("PR_log", {"PR": content, "judgement": response})
+    return judgement, message
+
+
+def parse_judgement(response):
     judgement = re.findall(r"Judge: (.+?)\n", response)[0] == "Yes"
     message = re.findall(r"Message: (.+?)$", response, re.DOTALL)[0]
-    logger.update("PR_log", {"PR": content, "judgement": response})
     return judgement, message
 
 
-def read_PRs(container, problem, owner, repo):
+def read_PRs(container, problem, owner, repo, batch=BATCH_JUDGE):
     logger.log["PR_log"].append({"problem": problem, "search_log": []})
     headers = {
         "Authorization": "token {}".format(GITHUB_TOKEN),
@@ -51,8 +57,8 @@ def read_PRs(container, problem, owner, repo):
     page = 1
     per_page = 30
     while True:
-        url = f"https://api.github.com/repos/{owner}/{repo}/pulls?page={page}&per_page={per_page}&state=all"
-        response = requests.get(url, headers=headers)
+        url = f"/repos/{owner}/{repo}/pulls?page={page}&per_page={per_page}&state=all"
+        response = github.get(url, headers=headers)
 
         if response.status_code == 200:
             PRs = response.json()
@@ -60,18 +66,33 @@ def read_PRs(container, problem, owner, repo):
             if not PRs:
                 break
 
-            for PR in PRs:
-                if not PR["body"] or PR["body"].strip() == "":
-                    continue
-                judgement, message = judge(problem, PR["body"])
+            PRs = [PR for PR in PRs if PR["body"] and PR["body"].strip() != ""]
+            if batch:
+                results = (
+                    verdict
+                    for _, verdict in judge_each(
+                        system,
+                        "Problem: " + problem,
+                        [PR["body"] for PR in PRs],
+                        "pr_judge",
+                        parse_judgement,
+                        lambda content: judge(problem, content),
+                        lambda content, response: logger.update(
+                            "PR_log", {"PR": content, "judgement": response}
+                        ),
+                        prefix="PR: ",
+                    )
+                )
+            else:
+                results = (judge(problem, PR["body"]) for PR in PRs)
 
+            for PR, (judgement, message) in zip(PRs, results):
                 if judgement:
-                    while True:
-                        try:
-                            diff = requests.get(PR["diff_url"], headers=headers)
-                            break
-                        except:
-                            pass
+                    try:
+                        diff = github.get(PR["diff_url"], headers=headers)
+                    except Exception as e:
+                        print(f"Failed to download the diff of the PR: {e}")
+                        return json.dumps({"Report": message})
                     diff = diff.text
                     dockerwrite_empty_file(container, "/pr_diff.txt")
                     dockerwrite("/pr_diff.txt", diff, container)
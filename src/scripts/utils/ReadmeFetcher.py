@@ -0,0 +1,81 @@
+import os
+import shutil
+
+import git
+import requests
+
+from  utils.GithubClient import github
+
+README_PATTERN = "/[Rr][Ee][Aa][Dd][Mm][Ee]*"
+
+
+def fetch_readme_via_api(full_name, headers):
+    """
+    Download only the README blob of a repository through the GitHub contents API.
+
+    Args:
+        full_name (str): The repository in `owner/name` form.
+        headers (dict): The headers used to authenticate against the GitHub API.
+
+    Return:
+        str: The content of the README, or None if it could not be fetched.
+    """
+    url = f"/repos/{full_name}/readme"
+    raw_headers = dict(headers)
+    raw_headers["Accept"] = "application/vnd.github.raw"
+    try:
+        response = github.get(url, headers=raw_headers)
+    except requests.RequestException as e:
+        print(e)
+        return None
+    if response.status_code == 200:
+        return response.text
+    print(f"README request for {full_name} failed with status code {response.status_code}")
+    return None
+
+
+def fetch_readme_via_checkout(repo_url, destination):
+    """
+    Fetch the README with a shallow, blobless, sparse checkout so that no other blob is downloaded.
+
+    Args:
+        repo_url (str): The clone URL of the repository.
+        destination (str): The local directory used for the checkout. It is removed afterwards.
+
+    Return:
+        str: The content of the README, or None if it could not be fetched.
+    """
+    try:
+        repo = git.Repo.clone_from(
+            repo_url, destination, depth=1, filter="blob:none", no_checkout=True
+        )
+        repo.git.sparse_checkout("set", "--no-cone", README_PATTERN)
+        repo.git.checkout()
+        for file in os.listdir(destination):
+            file_path = os.path.join(destination, file)
+            if "readme" in file.lower() and os.path.isfile(file_path):
+                with open(file_path, "r") as f:
+                    return f.read()
+    except Exception as e:
+        print(e)
+    finally:
+        shutil.rmtree(destination, ignore_errors=True)
+    return None
+
+
+def fetch_readme(repo, headers, destination):
+    """
+    Fetch the README of a candidate repository, trying the contents API first and a sparse checkout second.
+
+    Args:
+        repo (dict): The repository information returned by the GitHub search API.
+        headers (dict): The headers used to authenticate against the GitHub API.
+        destination (str): The local directory used if a checkout is needed.
+
+    Return:
+        str: The content of the README, or None if it could not be fetched.
+    """
+    readme = fetch_readme_via_api(repo["full_name"], headers)
+    if readme is None:
+        readme = fetch_readme_via_checkout(repo["clone_url"], destination)
+    return readme
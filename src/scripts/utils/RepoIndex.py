@@ -0,0 +1,171 @@
+import hashlib
+import math
+import os
+import pickle
+import threading
+from collections import Counter
+
+from  utils.RepoRanker import tokenize
+
+repo_index_file = "repo_index.pkl"
+DISPATCH_TOP_K = 5
+FIELD_WEIGHTS = {"description": 3, "readme": 1, "experience": 1}
+K1 = 1.5
+B = 0.75
+
+
+class RepoIndex:
+    """
+    This class is a BM25 index over the description, README and experience of the cached repositories.
+
+    It is persisted next to the repository cache and updated incrementally: only repositories whose
+    indexed fields changed are re-tokenized, so keeping it in sync and querying it stays cheap as the
+    cache grows.
+    """
+
+    def __init__(self, file_name=repo_index_file):
+        """
+        Initialize the RepoIndex and load it from disk.
+
+        Args:
+            file_name (str, optional): The pickle file the index is stored in. Default is repo_index_file.
+        """
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.docs = {}
+        self.df = Counter()
+        self.total_length = 0
+        if os.path.exists(file_name):
+            try:
+                with open(file_name, "rb") as f:
+                    self.docs, self.df, self.total_length = pickle.load(f)
+            except Exception as e:
+                print(f"Failed to load repository index: {e}")
+
+    def save(self):
+        """
+        Write the index to disk atomically.
+        """
+        temp_file = f"{self.file_name}.{os.getpid()}.tmp"
+        with open(temp_file, "wb") as f:
+            pickle.dump((self.docs, self.df, self.total_length), f)
+        os.replace(temp_file, self.file_name)
+
+    def fingerprint(self, repo):
+        """
+        Get a fingerprint of the indexed fields of a cached repository.
+
+        Args:
+            repo (dict): The cache entry of the repository.
+
+        Return:
+            str: The fingerprint.
+        """
+        digest = hashlib.md5()
+        for field in FIELD_WEIGHTS:
+            digest.update(str(repo.get(field) or "").encode("utf-8", "ignore") + b"\0")
+        return digest.hexdigest()
+
+    def remove(self, repo_name):
+        """
+        Remove a repository from the index without saving it.
+
+        Args:
+            repo_name (str): The name of the repository.
+        """
+        doc = self.docs.pop(repo_name, None)
+        if doc is None:
+            return
+        self.df.subtract(doc["tf"].keys())
+        self.df += Counter()
+        self.total_length -= doc["length"]
+
+    def add(self, repo_name, repo):
+        """
+        Add or refresh a repository in the index without saving it.
+
+        Args:
+            repo_name (str): The name of the repository.
+            repo (dict): The cache entry of the repository.
+
+        Return:
+            bool: Whether the index changed.
+        """
+        fingerprint = self.fingerprint(repo)
+        if repo_name in self.docs and self.docs[repo_name]["fingerprint"] == fingerprint:
+            return False
+        self.remove(repo_name)
+        tf = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for word in tokenize(str(repo.get(field) or "")):
+                tf[word] += weight
+        length = sum(tf.values())
+        self.docs[repo_name] = {"tf": tf, "length": length, "fingerprint": fingerprint}
+        self.df.update(tf.keys())
+        self.total_length += length
+        return True
+
+    def update(self, repo_name, repo):
+        """
+        Add or refresh a repository in the index and save it, e.g. after its description was written.
+
+        Args:
+            repo_name (str): The name of the repository.
+            repo (dict): The cache entry of the repository.
+        """
+        with self.lock:
+            if self.add(repo_name, repo):
+                self.save()
+
+    def sync(self, cache):
+        """
+        Bring the index in line with the repository cache, which may have been edited elsewhere.
+
+        Args:
+            cache (dict): The repository cache.
+        """
+        with self.lock:
+            changed = False
+            for repo_name in list(self.docs):
+                if repo_name not in cache:
+                    self.remove(repo_name)
+                    changed = True
+            for repo_name, repo in cache.items():
+                changed = self.add(repo_name, repo) or changed
+            if changed:
+                self.save()
+
+    def search(self, query, top_k=DISPATCH_TOP_K):
+        """
+        Get the repositories that best match a query.
+
+        Args:
+            query (str): The query to solve.
+            top_k (int, optional): The maximum number of repositories returned. Default is DISPATCH_TOP_K.
+
+        Return:
+            list: (repository name, score) tuples, best first. Repositories sharing no word with the query are left out.
+        """
+        with self.lock:
+            if not self.docs:
+                return []
+            doc_count = len(self.docs)
+            average_length = self.total_length / doc_count or 1
+            words = set(tokenize(query))
+            scores = Counter()
+            for repo_name, doc in self.docs.items():
+                score = 0
+                for word in words:
+                    frequency = doc["tf"].get(word)
+                    if not frequency:
+                        continue
+                    idf = math.log(1 + (doc_count - self.df[word] + 0.5) / (self.df[word] + 0.5))
+                    score += idf * frequency * (K1 + 1) / (
+                        frequency + K1 * (1 - B + B * doc["length"] / average_length)
+                    )
+                if score > 0:
+                    scores[repo_name] = score
+            return scores.most_common(top_k)
+
+
+repo_index = RepoIndex()
@@ -0,0 +1,126 @@
+import math
+import re
+from datetime import datetime, timezone
+
+TOP_K = 10
+MIN_STARS = 0
+MAX_INACTIVE_DAYS = 5 * 365
+MIN_SIZE = 1
+PREFERRED_LANGUAGES = ["Python", "Jupyter Notebook", "Shell", "C++"]
+EXCLUDE_ARCHIVED = True
+EXCLUDE_FORKS = True
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "get", "give", "i", "in",
+    "into", "is", "it", "its", "me", "my", "of", "on", "or", "please", "result", "should",
+    "task", "that", "the", "this", "to", "use", "using", "with", "you", "your",
+}
+
+
+def tokenize(text):
+    """
+    Split a text into lowercase words, also splitting names like `image-segmentation` or `UNet_v2`.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Return:
+        list: The words of the text without stop words.
+    """
+    words = re.findall(r"[a-z0-9]+", (text or "").lower().replace("_", " "))
+    return [word for word in words if word not in STOP_WORDS]
+
+
+def days_since(timestamp):
+    """
+    Get the number of days since a GitHub timestamp such as `2024-02-01T10:00:00Z`.
+
+    Args:
+        timestamp (str): The timestamp.
+
+    Return:
+        float: The number of days, or None if the timestamp is missing or malformed.
+    """
+    try:
+        moment = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+    return (datetime.now(timezone.utc) - moment).total_seconds() / 86400
+
+
+def score_repo(repo, query_words):
+    """
+    Score a candidate repository from the metadata of the search response, without any network call.
+
+    The score adds the lexical overlap between the query and the name, description and topics of
+    the repository, the popularity of the repository (log of stars), its recency, and a bonus for
+    languages that can be run in the setup container.
+
+    Args:
+        repo (dict): The repository information returned by the GitHub search API.
+        query_words (set): The words of the query.
+
+    Return:
+        float: The score of the repository. Higher is better.
+    """
+    name_words = set(tokenize(repo.get("name")))
+    topic_words = set(tokenize(" ".join(repo.get("topics") or [])))
+    description_words = set(tokenize(repo.get("description")))
+    overlap = (
+        3 * len(query_words & name_words)
+        + 2 * len(query_words & topic_words)
+        + len(query_words & description_words)
+    )
+    score = overlap / math.sqrt(len(query_words) or 1)
+    score += math.log10(repo.get("stargazers_count", 0) + 1)
+    inactive_days = days_since(repo.get("pushed_at"))
+    if inactive_days is not None:
+        score -= min(inactive_days / 365, 5) * 0.3
+    if repo.get("language") in PREFERRED_LANGUAGES:
+        score += 0.5
+    return score
+
+
+def rank_candidates(
+    repos,
+    query,
+    top_k=TOP_K,
+    min_stars=MIN_STARS,
+    max_inactive_days=MAX_INACTIVE_DAYS,
+    min_size=MIN_SIZE,
+    exclude_archived=EXCLUDE_ARCHIVED,
+    exclude_forks=EXCLUDE_FORKS,
+):
+    """
+    Reorder candidate repositories by `score_repo` and prune them before any of them is judged by the LLM.
+
+    Args:
+        repos (list): The candidate repositories returned by the GitHub search API.
+        query (str): The query to solve.
+        top_k (int, optional): The maximum number of candidates kept. None keeps all. Default is TOP_K.
+        min_stars (int, optional): Candidates with fewer stars are dropped. Default is MIN_STARS.
+        max_inactive_days (int, optional): Candidates not pushed to for longer are dropped. Default is MAX_INACTIVE_DAYS.
+        min_size (int, optional): Candidates smaller than this many KB (usually empty repositories) are dropped. Default is MIN_SIZE.
+        exclude_archived (bool, optional): Whether archived candidates are dropped. Default is EXCLUDE_ARCHIVED.
+        exclude_forks (bool, optional): Whether forks are dropped. Default is EXCLUDE_FORKS.
+
+    Return:
+        list: The kept candidates, best first.
+    """
+    query_words = set(tokenize(query))
+    kept = []
+    for rank, repo in enumerate(repos):
+        if exclude_archived and repo.get("archived"):
+            continue
+        if exclude_forks and repo.get("fork"):
+            continue
+        if repo.get("stargazers_count", 0) < min_stars:
+            continue
+        if repo.get("size", min_size) < min_size:
+            continue
+        inactive_days = days_since(repo.get("pushed_at"))
+        if inactive_days is not None and inactive_days > max_inactive_days:
+            continue
+        kept.append((score_repo(repo, query_words), -rank, repo))
+    kept.sort(key=lambda item: item[:2], reverse=True)
+    return [repo for _, _, repo in kept[:top_k]]
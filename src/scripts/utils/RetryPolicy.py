@@ -0,0 +1,156 @@
+import asyncio
+import random
+
+import openai
+
+MAX_TRIES = 8
+MAX_DELAY = 30
+CONTEXT_SHRINK = 0.5
+# How many times each kind of error is tried, and the base of its exponential backoff in seconds
+RETRY_POLICIES = {
+    "rate_limit": {"tries": 6, "base": 2},
+    "timeout": {"tries": 3, "base": 1},
+    "connection": {"tries": 4, "base": 1},
+    "server": {"tries": 4, "base": 1},
+    "malformed": {"tries": 3, "base": 0},
+    "context_overflow": {"tries": 2, "base": 0},
+    "fatal": {"tries": 1, "base": 0},
+}
+# Errors that the same request can succeed after, e.g. on the text path where nothing can be repaired
+TRANSIENT_KINDS = ("rate_limit", "timeout", "connection", "server")
+REPAIR_HINTS = {
+    "malformed": "Your last answer was not a valid tool call ({error}). Call exactly one of the given functions, with its arguments as a JSON object. If you find you are unable to handle the problem, please submit and end this task.",
+}
+
+
+class LLMCallError(Exception):
+    """
+    Raised when an LLM call fails for good, after the retries its kind of error allows.
+    """
+
+    def __init__(self, kind, error, tries):
+        """
+        Initialize the LLMCallError.
+
+        Args:
+            kind (str): The kind of the last error, one of RETRY_POLICIES.
+            error (Exception): The last error.
+            tries (int): The number of tries made.
+        """
+        super().__init__(f"LLM call failed after {tries} tries ({kind}): {error}")
+        self.kind = kind
+        self.error = error
+        self.tries = tries
+
+
+def classify(error):
+    """
+    Classify the error of an LLM call.
+
+    Args:
+        error (Exception): The error.
+
+    Return:
+        str: The kind of the error, one of RETRY_POLICIES.
+    """
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limit"
+    if isinstance(error, (openai.APITimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    if isinstance(error, openai.InternalServerError):
+        return "server"
+    if isinstance(error, openai.BadRequestError):
+        if getattr(error, "code", None) == "context_length_exceeded" or (
+            "maximum context length" in str(error)
+        ):
+            return "context_overflow"
+        return "fatal"
+    if isinstance(error, openai.APIStatusError):
+        return "server" if error.status_code in (408, 409) else "fatal"
+    if isinstance(error, (ValueError, TypeError, KeyError, IndexError, AttributeError)):
+        return "malformed"
+    return "fatal"
+
+
+class RetryPolicy:
+    """
+    This class decides whether a failed LLM call is tried again, after how long, and with which hint.
+
+    Rate limits, timeouts and server errors back off exponentially with full jitter, honouring the
+    Retry-After header of the server. Malformed tool calls are retried at once with a repair hint,
+    which is sent as an extra message on the next try only and never written into the transcript.
+    Context overflows are retried once on a compacted transcript. Other errors fail at once.
+    """
+
+    def __init__(self, policies=None, max_tries=MAX_TRIES, max_delay=MAX_DELAY):
+        """
+        Initialize the RetryPolicy.
+
+        Args:
+            policies (dict, optional): The tries and backoff base of each kind of error. Default is RETRY_POLICIES.
+            max_tries (int, optional): The maximum number of tries of a call, over all kinds of errors. Default is MAX_TRIES.
+            max_delay (float, optional): The maximum number of seconds to wait before a try. Default is MAX_DELAY.
+        """
+        self.policies = dict(policies or RETRY_POLICIES)
+        self.max_tries = max_tries
+        self.max_delay = max_delay
+
+    def should_retry(self, kind, kind_tries, tries):
+        """
+        Decide whether a failed call is tried again.
+
+        Args:
+            kind (str): The kind of the last error.
+            kind_tries (int): The number of tries that failed with this kind of error.
+            tries (int): The number of tries made.
+
+        Return:
+            bool: Whether to try again.
+        """
+        return tries < self.max_tries and kind_tries < self.policies[kind]["tries"]
+
+    def delay(self, kind, kind_tries, error=None):
+        """
+        Get the number of seconds to wait before the next try.
+
+        Args:
+            kind (str): The kind of the last error.
+            kind_tries (int): The number of tries that failed with this kind of error.
+            error (Exception, optional): The last error, whose Retry-After header is honoured. Default is None.
+
+        Return:
+            float: The delay.
+        """
+        base = self.policies[kind]["base"]
+        if not base:
+            return 0
+        delay = random.uniform(0, min(self.max_delay, base * 2 ** (kind_tries - 1)))
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms"):
+                delay = max(delay, float(headers["retry-after-ms"]) / 1000)
+            elif headers.get("retry-after"):
+                delay = max(delay, float(headers["retry-after"]))
+        except ValueError:
+            pass
+        return min(delay, self.max_delay)
+
+    def hint(self, kind, error):
+        """
+        Get the repair hint to send with the next try.
+
+        Args:
+            kind (str): The kind of the last error.
+            error (Exception): The last error.
+
+        Return:
+            dict: The hint message, or None if this kind of error has no hint.
+        """
+        if kind not in REPAIR_HINTS:
+            return None
+        return {"role": "user", "content": REPAIR_HINTS[kind].format(error=error)}
+
+
+retry_policy = RetryPolicy()
@@ -0,0 +1,229 @@
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+
+import git
+
+search_cache_dir = "search_cache"
+README_TTL = 30 * 24 * 3600
+VERDICT_TTL = 7 * 24 * 3600
+MAX_READMES = 2000
+# A section of the cache is pruned once every this many entries written to it
+PRUNE_EVERY = 50
+
+
+def normalize_query(query):
+    """
+    Normalize a query so that queries differing only in case, punctuation or spacing share a key.
+
+    Args:
+        query (str): The query to normalize.
+
+    Return:
+        str: The normalized query.
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", query.lower()))
+
+
+def resolve_head_sha(repo_url):
+    """
+    Resolve the commit SHA of the default branch of a repository without cloning it.
+
+    Args:
+        repo_url (str): The clone URL of the repository.
+
+    Return:
+        str: The SHA of the default branch head, or None if it could not be resolved.
+    """
+    try:
+        output = git.cmd.Git().ls_remote(repo_url, "HEAD")
+    except Exception as e:
+        print(e)
+        return None
+    return output.split()[0] if output else None
+
+
+class SearchCache:
+    """
+    This class persists fetched candidate READMEs and README judgements across searches.
+
+    READMEs are keyed by (repository URL, default-branch SHA) and judgements by
+    (normalized query, repository URL, default-branch SHA), so a new commit on the
+    default branch invalidates both. Entries also expire after a TTL.
+
+    Each entry is a file of its own, named by the hash of its key and written atomically, so
+    concurrent judges and processes never wait on each other or rewrite the whole cache. Expired
+    entries are removed from time to time, and the README store is capped: past `max_readmes`, the
+    oldest READMEs are removed.
+    """
+
+    def __init__(
+        self,
+        cache_dir=search_cache_dir,
+        readme_ttl=README_TTL,
+        verdict_ttl=VERDICT_TTL,
+        max_readmes=MAX_READMES,
+    ):
+        """
+        Initialize the SearchCache.
+
+        Args:
+            cache_dir (str, optional): The directory the entries are stored in. Default is search_cache_dir.
+            readme_ttl (int, optional): Seconds after which a cached README expires. Default is README_TTL.
+            verdict_ttl (int, optional): Seconds after which a cached judgement expires. Default is VERDICT_TTL.
+            max_readmes (int, optional): The maximum number of READMEs kept. Default is MAX_READMES.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = {"readmes": readme_ttl, "verdicts": verdict_ttl}
+        self.max_readmes = max_readmes
+        self.lock = threading.Lock()
+        self.puts = {"readmes": 0, "verdicts": 0}
+
+    def entry_path(self, section, key):
+        """
+        Get the file an entry is stored in.
+
+        Args:
+            section (str): "readmes" or "verdicts".
+            key (tuple): The key of the entry.
+
+        Return:
+            str: The path of the file.
+        """
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, section, digest[:2], digest + ".pkl")
+
+    def get(self, section, key):
+        """
+        Get a non-expired value from a section of the cache.
+
+        Args:
+            section (str): "readmes" or "verdicts".
+            key (tuple): The key of the entry.
+
+        Return:
+            The cached value, or None on a miss.
+        """
+        path = self.entry_path(section, key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except Exception:
+            return None
+        # A hash collision is told apart by the key stored with the value
+        if entry.get("key") != key or time.time() - entry["time"] >= self.ttl[section]:
+            return None
+        return entry["value"]
+
+    def put(self, section, key, value):
+        """
+        Store a value in a section of the cache.
+
+        Args:
+            section (str): "readmes" or "verdicts".
+            key (tuple): The key of the entry.
+            value: The value to store.
+        """
+        path = self.entry_path(section, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump({"key": key, "value": value, "time": time.time()}, f)
+        os.replace(temp_path, path)
+        with self.lock:
+            self.puts[section] += 1
+            prune = self.puts[section] % PRUNE_EVERY == 0
+        if prune:
+            self.prune(section)
+
+    def prune(self, section):
+        """
+        Remove the expired entries of a section, and for READMEs the oldest ones past `max_readmes`.
+
+        Args:
+            section (str): "readmes" or "verdicts".
+        """
+        limit = self.max_readmes if section == "readmes" else None
+        entries = []
+        for root, _, files in os.walk(os.path.join(self.cache_dir, section)):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        entries.sort(reverse=True)
+        oldest = time.time() - self.ttl[section]
+        for number, (mtime, path) in enumerate(entries):
+            if (limit is not None and number >= limit) or mtime < oldest:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get_readme(self, repo_url, sha):
+        """
+        Get a cached README.
+
+        Args:
+            repo_url (str): The clone URL of the repository.
+            sha (str): The SHA of the default branch head.
+
+        Return:
+            str: The cached README, or None on a miss.
+        """
+        if sha is None:
+            return None
+        return self.get("readmes", (repo_url, sha))
+
+    def put_readme(self, repo_url, sha, readme):
+        """
+        Cache a README.
+
+        Args:
+            repo_url (str): The clone URL of the repository.
+            sha (str): The SHA of the default branch head.
+            readme (str): The content of the README.
+        """
+        if sha is not None:
+            self.put("readmes", (repo_url, sha), readme)
+
+    def get_verdict(self, query, repo_url, sha):
+        """
+        Get a cached judgement of a repository for a query.
+
+        Args:
+            query (str): The query the repository was judged against.
+            repo_url (str): The clone URL of the repository.
+            sha (str): The SHA of the default branch head.
+
+        Return:
+            dict: The cached judgement with keys "judgement" and "response", or None on a miss.
+        """
+        if sha is None:
+            return None
+        return self.get("verdicts", (normalize_query(query), repo_url, sha))
+
+    def put_verdict(self, query, repo_url, sha, judgement, response):
+        """
+        Cache a judgement of a repository for a query.
+
+        Args:
+            query (str): The query the repository was judged against.
+            repo_url (str): The clone URL of the repository.
+            sha (str): The SHA of the default branch head.
+            judgement (bool): Whether the repository was judged suitable.
+            response (str): The response of the judge.
+        """
+        if sha is not None:
+            self.put(
+                "verdicts",
+                (normalize_query(query), repo_url, sha),
+                {"judgement": judgement, "response": response},
+            )
+
+
+search_cache = SearchCache()
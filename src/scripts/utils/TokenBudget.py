@@ -0,0 +1,200 @@
+import json
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_MODEL = "gpt-4-1106"
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+COMPLETION_RESERVE = 2000
+# Longest prefix wins, so specific versions are listed next to their family
+CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4-vision": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+
+class TokenBudget:
+    """
+    This class counts the tokens of texts and chat requests for the active model.
+
+    Counts use the model's tiktoken encoding when tiktoken is installed, and fall back to an
+    estimate of CHARS_PER_TOKEN characters per token otherwise. Message counts follow the chat
+    format, where every message and the reply carry a few tokens of framing.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, context_windows=None):
+        """
+        Initialize the TokenBudget.
+
+        Args:
+            model (str, optional): The active model, used when a call names none. Default is DEFAULT_MODEL.
+            context_windows (dict, optional): Context windows by model name prefix. Default is CONTEXT_WINDOWS.
+        """
+        self.model = model
+        self.context_windows = dict(context_windows or CONTEXT_WINDOWS)
+        self.encodings = {}
+        self.lock = threading.Lock()
+
+    def encoding(self, model=None):
+        """
+        Get the tiktoken encoding of a model.
+
+        Args:
+            model (str, optional): The model. Default is None, the active model.
+
+        Return:
+            tiktoken.Encoding: The encoding, or None if tiktoken is not available.
+        """
+        if tiktoken is None:
+            return None
+        model = model or self.model
+        with self.lock:
+            if model not in self.encodings:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    print(f"Failed to load the tokenizer, estimating tokens instead: {e}")
+                    encoding = None
+                self.encodings[model] = encoding
+            return self.encodings[model]
+
+    def count(self, text, model=None):
+        """
+        Count the tokens of a text.
+
+        Args:
+            text (str): The text.
+            model (str, optional): The model. Default is None, the active model.
+
+        Return:
+            int: The number of tokens.
+        """
+        text = text or ""
+        encoding = self.encoding(model)
+        if encoding is None:
+            return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def count_messages(self, messages, functions=None, model=None):
+        """
+        Count the prompt tokens of a chat request.
+
+        Args:
+            messages (list): The messages.
+            functions (list, optional): The tools offered to the model. Default is None.
+            model (str, optional): The model. Default is None, the active model.
+
+        Return:
+            int: The number of prompt tokens.
+        """
+        tokens = TOKENS_PER_REPLY
+        for message in messages:
+            tokens += TOKENS_PER_MESSAGE
+            for key, value in message.items():
+                if value is None:
+                    continue
+                if not isinstance(value, str):
+                    value = json.dumps(value, ensure_ascii=False)
+                tokens += self.count(value, model)
+        if functions:
+            tokens += self.count(json.dumps(functions, ensure_ascii=False), model)
+        return tokens
+
+    def context_window(self, model=None):
+        """
+        Get the context window of a model.
+
+        Args:
+            model (str, optional): The model. Default is None, the active model.
+
+        Return:
+            int: The maximum number of prompt and completion tokens.
+        """
+        model = model or self.model
+        matches = [prefix for prefix in self.context_windows if model.startswith(prefix)]
+        if not matches:
+            return DEFAULT_CONTEXT_WINDOW
+        return self.context_windows[max(matches, key=len)]
+
+    def remaining(self, messages, functions=None, model=None, reserve=COMPLETION_RESERVE):
+        """
+        Get the tokens left in the context window for a chat request.
+
+        Args:
+            messages (list): The messages.
+            functions (list, optional): The tools offered to the model. Default is None.
+            model (str, optional): The model. Default is None, the active model.
+            reserve (int, optional): The tokens kept free for the answer. Default is COMPLETION_RESERVE.
+
+        Return:
+            int: The number of tokens that can still be added to the prompt. Negative if it is already too long.
+        """
+        return (
+            self.context_window(model)
+            - reserve
+            - self.count_messages(messages, functions, model)
+        )
+
+    def truncate(self, text, max_tokens, model=None, marker="..."):
+        """
+        Keep the beginning of a text that fits a number of tokens.
+
+        Args:
+            text (str): The text.
+            max_tokens (int): The maximum number of tokens kept.
+            model (str, optional): The model. Default is None, the active model.
+            marker (str, optional): Appended if the text was cut. Default is "...".
+
+        Return:
+            str: The text, cut if it was too long.
+        """
+        encoding = self.encoding(model)
+        if encoding is None:
+            max_chars = max_tokens * CHARS_PER_TOKEN
+            return text if len(text) <= max_chars else text[:max_chars] + marker
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens]) + marker
+
+    def truncate_middle(self, text, max_tokens, model=None, marker="\n...\n"):
+        """
+        Keep the beginning and the end of a text that fit a number of tokens, e.g. for program output.
+
+        Args:
+            text (str): The text.
+            max_tokens (int): The maximum number of tokens kept, half at each end.
+            model (str, optional): The model. Default is None, the active model.
+            marker (str, optional): Put where the middle was cut. Default is "\\n...\\n".
+
+        Return:
+            str: The text, cut in the middle if it was too long.
+        """
+        half = max(max_tokens // 2, 1)
+        encoding = self.encoding(model)
+        if encoding is None:
+            max_chars = half * CHARS_PER_TOKEN
+            if len(text) <= 2 * max_chars:
+                return text
+            return text[:max_chars] + marker + text[-max_chars:]
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:half]) + marker + encoding.decode(tokens[-half:])
+
+
+token_budget = TokenBudget()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import threading
+
+MAX_RENDERED = 64
+FORMAT_INSTRUCTIONS = "You will be provided the functions that you can use to solve the problem.\nYour answer should be a function call with the function name and the arguments.\nYour answer should be in the following format:\n\n{\n\t\"name\": \"function_name\",\n\t\"arguments\": {\n\t\t\"argument1\": \"value1\",\n\t\t\"argument2\": \"value2\",\n\t\t\"argument3\": \"value3\"\n\t}\n}\n\n"
+
+
+class ToolSchema:
+    """
+    This class renders each function set (`functions_main`, `functions_setup`, `functions_action`,
+    `functions_modify`, ...) as text for the text backend once, instead of on every call.
+
+    Renderings are keyed by a hash of the tools, so a copy of a set shares the rendering of the
+    original, and an edited set, such as the dispatcher tools with the cached repositories as an
+    enum, is rendered on its own. Only the `max_rendered` most recently used renderings are kept.
+    """
+
+    def __init__(self, max_rendered=MAX_RENDERED):
+        """
+        Initialize the ToolSchema.
+
+        Args:
+            max_rendered (int, optional): The number of renderings kept. Default is MAX_RENDERED.
+        """
+        self.max_rendered = max_rendered
+        self.rendered = {}
+        self.lock = threading.Lock()
+        self.stats = {"rendered": 0, "reused": 0}
+
+    def key(self, functions):
+        """
+        Get the cache key of a function set.
+
+        Args:
+            functions (list): The tools.
+
+        Return:
+            str: The hash of the tools.
+        """
+        text = json.dumps(functions, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def render(self, functions):
+        """
+        Render the functions as text for the text backend.
+
+        Args:
+            functions (list): The tools.
+
+        Return:
+            str: The text.
+        """
+        text = ""
+        for index, function in enumerate(functions):
+            function = function["function"]
+            parameters = function.get("parameters", {})
+            text += f"Function {index}:\n"
+            text += f"Function Name: {function['name']}\n"
+            text += f"Function Description: {function.get('description', '')}\n"
+            for name, schema in parameters.get("properties", {}).items():
+                text += f"Argument: {name}\n"
+                text += f"Argument Type: {schema.get('type', '')}\n"
+                text += f"Argument Description: {schema.get('description', '')}\n"
+            text += f"Parameters Required: {','.join(parameters.get('required', []))}\n\n\n"
+        return text
+
+    def text(self, functions):
+        """
+        Get the text rendering of a function set, rendering it on first use.
+
+        Args:
+            functions (list): The tools.
+
+        Return:
+            str: The text.
+        """
+        key = self.key(functions)
+        with self.lock:
+            if key in self.rendered:
+                self.stats["reused"] += 1
+                # Moved to the end, so that the least recently used rendering is dropped first
+                self.rendered[key] = self.rendered.pop(key)
+                return self.rendered[key]
+        text = self.render(functions)
+        with self.lock:
+            self.rendered[key] = text
+            self.stats["rendered"] += 1
+            while len(self.rendered) > self.max_rendered:
+                del self.rendered[next(iter(self.rendered))]
+        return text
+
+
+def with_format_instructions(messages):
+    """
+    Add the function call format instructions to the system prompt, once.
+
+    Args:
+        messages (list): The messages, which are left unchanged.
+
+    Return:
+        list: The messages, with the instructions at the end of the system prompt.
+    """
+    content = messages[0]["content"] or ""
+    if content.endswith(FORMAT_INSTRUCTIONS):
+        return messages
+    return [dict(messages[0], content=content + FORMAT_INSTRUCTIONS)] + messages[1:]
+
+
+tool_schema = ToolSchema()
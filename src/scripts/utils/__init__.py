@@ -1,7 +1,25 @@
+from  utils.AsyncLoop import *
+from  utils.BatchJudge import *
+from  utils.ContainerFile import *
+from  utils.ContainerPool import *
+from  utils.ContextCompactor import *
 from  utils.DescriptionWriter import *
 from  utils.DockerOperations import *
 from  utils.EnhancedContianer import *
 from  utils.ExperienceWriter import *
+from  utils.GithubClient import *
 from  utils.IssueReader import *
+from  utils.LLMCache import *
+from  utils.LLMLimiter import *
+from  utils.ModelRouter import *
 from  utils.OpenaiAPI import *
+from  utils.OpenaiClient import *
+from  utils.OutputCapture import *
 from  utils.PrReader import *
+from  utils.ReadmeFetcher import *
+from  utils.RepoIndex import *
+from  utils.RepoRanker import *
+from  utils.RetryPolicy import *
+from  utils.SearchCache import *
+from  utils.TokenBudget import *
+from  utils.ToolSchema import *